@@ -0,0 +1,38 @@
+# accrue_fines.py
+"""Начисление штрафов за просроченные выдачи.
+
+Запускается по расписанию (например, раз в сутки):
+    python accrue_fines.py
+    python accrue_fines.py --as-of 2026-01-31 --rate 15
+Повторный запуск за ту же дату безопасен.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from data_access import FineDAO, FINE_DAILY_RATE
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Начисление штрафов за просроченные выдачи")
+    parser.add_argument('--as-of', default=datetime.now().strftime('%Y-%m-%d'),
+                        help="дата начисления в формате ГГГГ-ММ-ДД (по умолчанию: сегодня)")
+    parser.add_argument('--rate', type=float, default=FINE_DAILY_RATE,
+                        help="штраф за день просрочки, руб. (по умолчанию: %(default)s, "
+                             "переменная окружения LIBRARY_FINE_DAILY_RATE)")
+    args = parser.parse_args(argv)
+    try:
+        datetime.strptime(args.as_of, '%Y-%m-%d')
+    except ValueError:
+        parser.error(f"неверная дата: {args.as_of}")
+    if args.rate <= 0:
+        parser.error("ставка должна быть больше нуля")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    success, message = FineDAO.accrue_overdue_fines(args.as_of, args.rate)
+    print(message)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
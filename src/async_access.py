@@ -0,0 +1,214 @@
+# async_access.py
+"""Асинхронный фасад над DAO для фронтендов на asyncio.
+
+Методы DAO синхронны и блокируют вызывающий поток. Классы этого модуля
+(AsyncBookDAO, AsyncReaderDAO, ...) повторяют методы соответствующих DAO
+как корутины, которые выполняются в пуле потоков:
+
+    books = await AsyncBookDAO.search_books('мир')
+    async for page in AsyncBookDAO.iter_pages(limit=50):
+        ...
+
+Чтения идут в ограниченный пул потоков, у каждого потока свое соединение
+mode=ro вне общего пула db. Все записи выполняются по очереди в одном
+потоке-писателе со своим соединением, поэтому писатели одного процесса не
+соревнуются за блокировку записи. Отмена ожидающей корутины прерывает
+выполняющийся запрос через Connection.interrupt(); незапущенный запрос
+не выполняется вовсе. Синхронные DAO продолжают работать как раньше.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import db
+from data_access import AuthDAO, BookDAO, ReaderDAO, LibrarianDAO, LoanDAO, ReservationDAO, FineDAO, StatsDAO
+
+class _Call:
+    """Вызов метода DAO в потоке исполнителя, который можно отменить извне"""
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def run(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise asyncio.CancelledError()
+            self._conn = conn
+        try:
+            with db.pinned(conn):
+                return self.func(*self.args, **self.kwargs)
+        finally:
+            with self._lock:
+                self._conn = None
+
+    def cancel(self):
+        # interrupt() можно вызывать из другого потока; прерванный запрос
+        # завершается ошибкой, а незавершенная транзакция откатывается
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+class _Lane:
+    """Пул потоков, у каждого из которых собственное соединение с базой"""
+
+    def __init__(self, workers, read_only, name):
+        self.read_only = read_only
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = db.get_connection(read_only=self.read_only)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _run(self, call):
+        conn = self._connection()
+        try:
+            return call.run(conn)
+        finally:
+            # Прерванный или упавший метод мог оставить транзакцию открытой
+            if conn.in_transaction:
+                conn.rollback()
+
+    async def submit(self, func, *args, **kwargs):
+        call = _Call(func, args, kwargs)
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._run, call)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+class AsyncRunner:
+    """Исполнители фасада: пул читателей и единственный поток-писатель.
+
+    Размер пула чтения по умолчанию равен размеру пула соединений db.
+    Потоки и соединения создаются при первом обращении.
+    """
+
+    def __init__(self, readers=None):
+        self.readers = readers or db.read_pool.max_size
+        self._read_lane = None
+        self._write_lane = None
+        self._lock = threading.Lock()
+
+    def _lanes(self):
+        with self._lock:
+            if self._read_lane is None:
+                self._read_lane = _Lane(self.readers, read_only=True, name='library-read')
+                self._write_lane = _Lane(1, read_only=False, name='library-write')
+            return self._read_lane, self._write_lane
+
+    async def read(self, func, *args, **kwargs):
+        return await self._lanes()[0].submit(func, *args, **kwargs)
+
+    async def write(self, func, *args, **kwargs):
+        return await self._lanes()[1].submit(func, *args, **kwargs)
+
+    def shutdown(self):
+        """Дожидается запущенных запросов и закрывает соединения исполнителей"""
+        with self._lock:
+            lanes = (self._read_lane, self._write_lane)
+            self._read_lane = self._write_lane = None
+        for lane in lanes:
+            if lane is not None:
+                lane.shutdown()
+
+runner = AsyncRunner()
+
+class AsyncDAO:
+    """Основа асинхронных фасадов.
+
+    Подкласс объявляет синхронный DAO и его пишущие методы:
+        class AsyncBookDAO(AsyncDAO, dao=BookDAO, writes=('add_book', ...))
+    Каждый публичный метод DAO становится корутиной с теми же аргументами.
+    Потоковые методы iter_* не переносятся: они держат соединение между
+    вызовами; вместо них у фасадов есть постраничные iter_pages.
+    """
+
+    def __init_subclass__(cls, dao=None, writes=(), **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, member in vars(dao).items():
+            if name.startswith(('_', 'iter_')) or not isinstance(member, staticmethod) or name in vars(cls):
+                continue
+            submit = runner.write if name in writes else runner.read
+            setattr(cls, name, staticmethod(cls._wrap(submit, member.__func__)))
+
+    @staticmethod
+    def _wrap(submit, func):
+        async def method(*args, **kwargs):
+            return await submit(func, *args, **kwargs)
+        method.__name__ = func.__name__
+        method.__qualname__ = func.__qualname__
+        method.__doc__ = func.__doc__
+        return method
+
+async def _iter_keyset_pages(fetch_page, key, limit):
+    # Ключ последней строки страницы - граница следующей, как в KeysetPager
+    after = None
+    while True:
+        page = await fetch_page(after=after, limit=limit)
+        if page:
+            yield page
+        if len(page) < limit:
+            return
+        after = key(page[-1])
+
+class AsyncAuthDAO(AsyncDAO, dao=AuthDAO):
+    pass
+
+class AsyncBookDAO(AsyncDAO, dao=BookDAO, writes=('add_book', 'add_books', 'update_book_copies')):
+    @staticmethod
+    def iter_pages(limit=100, full=False):
+        """Асинхронно перебирает каталог страницами по (title, book_id)"""
+        async def fetch_page(after, limit):
+            return await AsyncBookDAO.get_books_page(after=after, limit=limit, full=full)
+        return _iter_keyset_pages(fetch_page, lambda book: (book.title, book.book_id), limit)
+
+class AsyncReaderDAO(AsyncDAO, dao=ReaderDAO, writes=('reserve_book', 'update_reader_status')):
+    @staticmethod
+    def iter_pages(limit=100):
+        """Асинхронно перебирает читателей со сводкой штрафов страницами по reader_id"""
+        return _iter_keyset_pages(AsyncReaderDAO.get_readers_with_fine_summary,
+                                  lambda reader: reader.reader_id, limit)
+
+class AsyncLibrarianDAO(AsyncDAO, dao=LibrarianDAO):
+    pass
+
+class AsyncLoanDAO(AsyncDAO, dao=LoanDAO, writes=('create_loan', 'return_loan')):
+    @staticmethod
+    def iter_overdue_pages(as_of=None, limit=100):
+        """Асинхронно перебирает просроченные выдачи страницами по (due_date, loan_id)"""
+        async def fetch_page(after, limit):
+            return await AsyncLoanDAO.get_overdue_loans(as_of, after=after, limit=limit)
+        return _iter_keyset_pages(fetch_page, lambda loan: (loan.due_date, loan.loan_id), limit)
+
+class AsyncReservationDAO(AsyncDAO, dao=ReservationDAO,
+                          writes=('create_reservation', 'place_hold', 'cancel_reservation', 'expire_holds')):
+    pass
+
+class AsyncFineDAO(AsyncDAO, dao=FineDAO,
+                   writes=('add_fine_with_status_update', 'accrue_overdue_fines', 'update_fine_status')):
+    pass
+
+class AsyncStatsDAO(AsyncDAO, dao=StatsDAO, writes=('rebuild',)):
+    pass
@@ -0,0 +1 @@
+# Замеры производительности; запускаются из папки src как python -m benchmarks.<имя>
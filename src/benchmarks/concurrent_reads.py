@@ -0,0 +1,197 @@
+# benchmarks/concurrent_reads.py
+"""Пропускная способность чтения при параллельной записи.
+
+Для каждого профиля соединения (database.PROFILES) создается временная база
+с каталогом книг. Процессы-читатели в нескольких потоках листают каталог,
+открывают карточки книг и ищут по каталогу, а процессы-писатели в это
+время выдают и возвращают книги и пачками добавляют новые. Сравниваются
+число чтений в секунду, задержки чтения и ошибки блокировки:
+    cd src
+    python -m benchmarks.concurrent_reads
+    python -m benchmarks.concurrent_reads --seconds 10 --readers 4 --threads 4 --writers 2
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+# Названия книг каталога - пары слов тех же списков, что у генератора баз;
+# поиск идет по паре, как ищут читатели
+from generate_library import ADJECTIVES, NOUNS
+
+def _use_database(path, profile):
+    # Вызывается до импорта database: глобальный db читает путь и профиль из окружения
+    os.environ['LIBRARY_DB'] = path
+    os.environ['LIBRARY_DB_PROFILE'] = profile
+
+def _is_lock_error(error):
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+def prepare_database(profile, books):
+    """Создает временную базу в заданном профиле и заполняет каталог"""
+    path = os.path.join(tempfile.mkdtemp(), f'concurrent_reads_{profile}.db')
+    _use_database(path, profile)
+
+    from database import Database, PROFILES
+
+    # Сообщения миграций и заполнения здесь не нужны
+    with redirect_stdout(io.StringIO()):
+        database = Database(path, profile=PROFILES[profile])
+        database.add_sample_data()
+    conn = database.get_connection()
+    conn.executemany('''
+        INSERT INTO books (title, author, genre, year, total_copies, available_copies)
+        VALUES (?, ?, 'Роман', ?, 3, 3)
+    ''', ((f'{ADJECTIVES[i % len(ADJECTIVES)]} {NOUNS[i // len(ADJECTIVES) % len(NOUNS)]} {i}',
+            f'Автор {i % 500}', 1900 + i % 120) for i in range(books)))
+    conn.commit()
+    conn.close()
+    return path
+
+def reader_worker(path, profile, seconds, threads, seed):
+    """Процесс-читатель: возвращает (чтений, ошибок блокировки, задержки в мс)"""
+    _use_database(path, profile)
+    from data_access import BookDAO
+
+    max_id = BookDAO.get_books_page(before=('\uffff', 1 << 62), limit=1)[-1].book_id
+    results = {'reads': 0, 'lock_errors': 0, 'latencies': []}
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def run(thread_seed):
+        rng = random.Random(thread_seed)
+        reads, errors, latencies = 0, 0, []
+        start.wait()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            kind = rng.random()
+            started = time.perf_counter()
+            try:
+                if kind < 0.5:
+                    BookDAO.get_book_by_id(rng.randint(1, max_id))
+                elif kind < 0.8:
+                    BookDAO.get_books_page(after=(rng.choice(ADJECTIVES), 0))
+                else:
+                    BookDAO.search_books(f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}')
+            except sqlite3.OperationalError as e:
+                if not _is_lock_error(e):
+                    raise
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            reads += 1
+        with lock:
+            results['reads'] += reads
+            results['lock_errors'] += errors
+            results['latencies'].extend(latencies)
+
+    workers = [threading.Thread(target=run, args=(seed * 1000 + i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results['reads'], results['lock_errors'], results['latencies']
+
+def writer_worker(path, profile, seconds, seed):
+    """Процесс-писатель: выдачи, возвраты и пополнение каталога; возвращает (записей, ошибок блокировки)"""
+    _use_database(path, profile)
+    from data_access import BookDAO, LoanDAO, ReaderDAO
+    from models import Book
+
+    rng = random.Random(seed)
+    # Читатель 1 из тестовых данных активен; выдачи писателей различаются книгами
+    reader_id = 1
+    max_id = BookDAO.get_books_page(before=('\uffff', 1 << 62), limit=1)[-1].book_id
+    writes, errors = 0, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if rng.random() < 0.05:
+            # Библиотекарь добавляет поступление: длинная пишущая транзакция
+            first = rng.randint(10 ** 6, 10 ** 9)
+            results = [BookDAO.add_books(Book(title=f'Поступление {first + i}', author='Поставщик', genre='Роман',
+                                              total_copies=1, available_copies=1) for i in range(500))]
+        else:
+            book_id = rng.randint(1, max_id)
+            results = [LoanDAO.create_loan(book_id, reader_id)]
+            for loan in ReaderDAO.get_reader_loans(reader_id):
+                if loan.book_id == book_id:
+                    results.append(LoanDAO.return_loan(loan.loan_id))
+        for success, message in results:
+            if success:
+                writes += 1
+            elif 'locked' in message:
+                errors += 1
+    return writes, errors
+
+def run_profile(profile, seconds, readers, threads, writers, books):
+    path = prepare_database(profile, books)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=readers + writers, mp_context=context) as pool:
+        read_futures = [pool.submit(reader_worker, path, profile, seconds, threads, i) for i in range(readers)]
+        write_futures = [pool.submit(writer_worker, path, profile, seconds, 1000 + i) for i in range(writers)]
+        read_results = [future.result() for future in read_futures]
+        write_results = [future.result() for future in write_futures]
+
+    latencies = sorted(latency for _, _, values in read_results for latency in values)
+    return {
+        'profile': profile,
+        'reads_per_second': sum(reads for reads, _, _ in read_results) / seconds,
+        'read_lock_errors': sum(errors for _, errors, _ in read_results),
+        'p50_ms': statistics.median(latencies) if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        'max_ms': latencies[-1] if latencies else 0.0,
+        'writes_per_second': sum(writes for writes, _ in write_results) / seconds,
+        'write_errors': sum(errors for _, errors in write_results),
+    }
+
+def parse_args(argv=None):
+    from database import PROFILES
+
+    parser = argparse.ArgumentParser(description="Чтение каталога при параллельной записи по профилям соединения")
+    parser.add_argument('--profiles', default='default,wal',
+                        help=f"профили через запятую из: {', '.join(PROFILES)} (по умолчанию: %(default)s)")
+    parser.add_argument('--seconds', type=float, default=5, help="длительность замера (по умолчанию: %(default)s)")
+    parser.add_argument('--readers', type=int, default=2, help="процессов-читателей (по умолчанию: %(default)s)")
+    parser.add_argument('--threads', type=int, default=4, help="потоков в читателе (по умолчанию: %(default)s)")
+    parser.add_argument('--writers', type=int, default=2, help="процессов-писателей (по умолчанию: %(default)s)")
+    parser.add_argument('--books', type=int, default=20000, help="книг в каталоге (по умолчанию: %(default)s)")
+    args = parser.parse_args(argv)
+    args.profiles = [name.strip() for name in args.profiles.split(',') if name.strip()]
+    unknown = [name for name in args.profiles if name not in PROFILES]
+    if unknown:
+        parser.error(f"неизвестные профили: {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
+    # Глобальный db создается при импорте database; до выбора профиля он
+    # должен смотреть на временный файл, а не на рабочую базу
+    _use_database(os.path.join(tempfile.mkdtemp(), 'concurrent_reads.db'), 'wal')
+    with redirect_stdout(io.StringIO()):
+        import database  # noqa: F401
+    args = parse_args(argv)
+
+    print("=" * 78)
+    print("ЧТЕНИЕ ПРИ ПАРАЛЛЕЛЬНОЙ ЗАПИСИ")
+    print("=" * 78)
+    print(f"Книг: {args.books}, читателей: {args.readers} x {args.threads} потоков, "
+          f"писателей: {args.writers}, {args.seconds:g} с на профиль")
+    print(f"{'Профиль':<10}{'чтений/с':>10}{'p50, мс':>10}{'p95, мс':>10}{'макс, мс':>10}"
+          f"{'блок.':>8}{'записей/с':>11}{'ошибок':>9}")
+    for profile in args.profiles:
+        result = run_profile(profile, args.seconds, args.readers, args.threads, args.writers, args.books)
+        print(f"{profile:<10}{result['reads_per_second']:>10.0f}{result['p50_ms']:>10.2f}"
+              f"{result['p95_ms']:>10.2f}{result['max_ms']:>10.1f}{result['read_lock_errors']:>8}"
+              f"{result['writes_per_second']:>11.1f}{result['write_errors']:>9}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# benchmarks/fixtures.py
+"""Детерминированные базы для замеров.
+
+build_fixture строит базу заданного масштаба генератором generate_library
+из зерна и фиксированной даты REFERENCE_DATE: одни и те же (масштаб, зерно)
+всегда дают одинаковые строки, поэтому замеры разных запусков сравнимы.
+Масштаб - число выдач в истории; остальные таблицы растут пропорционально.
+Готовые базы кэшируются во временной папке:
+    cd src
+    python -m benchmarks.fixtures --scale 100k
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date
+
+from generate_library import generate_library
+from migrations import TRACKED_TABLES
+
+# Масштаб -> число выдач
+FIXTURE_SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+DEFAULT_SEED = 20260101
+# Дата, относительно которой строятся история и просрочки
+REFERENCE_DATE = date(2026, 1, 1)
+FIXTURE_DIR = os.path.join(tempfile.gettempdir(), 'library_benchmarks')
+# Версия генератора: меняется вместе с его логикой, чтобы не брать старый кэш
+FIXTURE_VERSION = 2
+
+# Доли строк относительно числа выдач
+BOOKS_PER_LOAN = 0.1
+READERS_PER_LOAN = 0.05
+RESERVATIONS_PER_LOAN = 0.05
+
+def fixture_path(scale, seed=DEFAULT_SEED):
+    return os.path.join(FIXTURE_DIR, f'library_v{FIXTURE_VERSION}_{scale}_{seed}.db')
+
+def build_fixture(path, loans, seed=DEFAULT_SEED):
+    """Создает в path базу с loans выдачами; возвращает число строк по таблицам"""
+    counts = generate_library(path, loans, seed, books=max(int(loans * BOOKS_PER_LOAN), 50),
+                              readers=max(int(loans * READERS_PER_LOAN), 20),
+                              reservations=int(loans * RESERVATIONS_PER_LOAN),
+                              as_of=REFERENCE_DATE, log=lambda message: None)
+    # Генератор загружает строки со снятыми триггерами, и журнал изменений пуст.
+    # Замерам выгрузки изменений нужен журнал, как после обычных вставок
+    conn = sqlite3.connect(path)
+    with conn:
+        for table, key in TRACKED_TABLES.items():
+            conn.execute(f'''
+                INSERT INTO change_log (table_name, row_id, operation)
+                SELECT '{table}', {key}, 'insert' FROM {table} ORDER BY {key}
+            ''')
+    conn.execute('ANALYZE change_log')
+    conn.close()
+    return counts
+
+def ensure_fixture(scale, seed=DEFAULT_SEED, rebuild=False):
+    """Возвращает путь к базе масштаба scale, строя ее, если в кэше ее нет"""
+    path = fixture_path(scale, seed)
+    if os.path.exists(path) and not rebuild:
+        return path
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    # Строим во временный файл: прерванная сборка не оставит неполную базу в кэше
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    build_fixture(partial, FIXTURE_SCALES[scale], seed)
+    os.replace(partial, path)
+    return path
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Построение баз для замеров")
+    parser.add_argument('--scale', choices=FIXTURE_SCALES, default='10k', help="масштаб (по умолчанию: %(default)s)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="зерно генератора (по умолчанию: %(default)s)")
+    parser.add_argument('--rebuild', action='store_true', help="пересобрать базу, даже если она есть в кэше")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    path = ensure_fixture(args.scale, args.seed, args.rebuild)
+    print(f"База {args.scale}: {path} ({time.perf_counter() - started:.1f} с)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+# benchmarks/run.py
+"""Замеры всех публичных методов DAO и сериализаторов export.py.
+
+Для каждого масштаба берется детерминированная база (benchmarks.fixtures),
+копируется во временный файл, и в отдельном процессе каждый метод
+вызывается --repeat раз после одного прогревочного вызова. Результаты
+(медиана, минимум, максимум в мс) сохраняются в JSON и сравниваются с
+эталоном по лучшему из вызовов (минимуму): он меньше всего зависит от
+посторонней нагрузки на машину. Если время выросло больше допуска, запуск
+завершается с кодом 1.
+    cd src
+    python -m benchmarks.run                          # 10k, сравнение с эталоном
+    python -m benchmarks.run --scales 10k,100k,1m
+    python -m benchmarks.run --save-baseline          # записать эталон
+
+Публичный метод DAO без замера в CASES тоже считается ошибкой, чтобы
+новые методы не оставались без замера. Ошибкой считается и отказ пишущего
+метода (False в ответе): такой замер измеряет проверку, а не запись.
+"""
+import argparse
+import inspect
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from benchmarks.fixtures import DEFAULT_SEED, FIXTURE_SCALES, REFERENCE_DATE, ensure_fixture
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(BENCHMARKS_DIR)), 'out', 'benchmarks')
+DAO_CLASSES = ['AuthDAO', 'BookDAO', 'ReaderDAO', 'LibrarianDAO', 'LoanDAO', 'ReservationDAO',
+               'FineDAO', 'StatsDAO', 'ChangeLogDAO']
+EXPORT_SERIALIZERS = ['json', 'csv', 'xml', 'yaml']
+# Лучшее время хуже эталона больше чем на TOLERANCE (доля) и на MIN_DELTA_MS - регрессия
+TOLERANCE = 0.5
+MIN_DELTA_MS = 2.0
+
+class Context:
+    """Идентификаторы из базы замера, на которых вызываются методы.
+
+    Пишущие методы на каждом вызове i берут свой объект (свою выдачу,
+    свое бронирование), чтобы повторы не превращались в пустые операции.
+    Поисковый запрос - начало названия книги из этой же базы, чтобы поиск
+    находил строки на любом масштабе.
+    """
+
+    def __init__(self, conn, calls):
+        def column(sql, *params):
+            return [row[0] for row in conn.execute(sql, params)]
+
+        self.as_of = REFERENCE_DATE.strftime('%Y-%m-%d')
+        reader = conn.execute('''
+            SELECT reader_id, card_number, password FROM readers
+            WHERE reader_id = (SELECT reader_id FROM loans WHERE status = 'active'
+                               GROUP BY reader_id ORDER BY COUNT(*) DESC LIMIT 1)
+        ''').fetchone()
+        self.reader_id, self.card_number, self.password = reader
+        self.readers = column('SELECT reader_id FROM readers WHERE status = 1 ORDER BY reader_id LIMIT ?', calls)
+        self.book_id, title = conn.execute('SELECT book_id, title FROM books ORDER BY book_id LIMIT 1').fetchone()
+        self.search_query = ' '.join(title.split()[:2])
+        self.middle_book = conn.execute('''
+            SELECT title, book_id FROM books ORDER BY title, book_id
+            LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM books)
+        ''').fetchone()
+        self.free_books = column('SELECT book_id FROM books WHERE available_copies > 1 ORDER BY book_id LIMIT ?',
+                                 calls)
+        # С конца списка, чтобы не пересекаться с free_books и book_id: у этих книг
+        # есть свободный экземпляр и пустая очередь, place_hold сразу откладывает его
+        self.holdable_books = column('SELECT book_id FROM book_availability '
+                                     'WHERE effective_available > 0 AND waiting_holds = 0 '
+                                     'ORDER BY book_id DESC LIMIT ?', calls)
+        self.active_loans = column("SELECT loan_id FROM loans WHERE status = 'active' ORDER BY loan_id LIMIT ?",
+                                   calls)
+        self.middle_loan = column('''
+            SELECT loan_id FROM loans WHERE status = 'active' ORDER BY loan_id
+            LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM loans WHERE status = 'active')
+        ''')[0]
+        self.overdue_key = conn.execute('''
+            SELECT due_date, loan_id FROM loans WHERE status = 'active' AND due_date < ?
+            ORDER BY due_date, loan_id LIMIT 1 OFFSET 100
+        ''', (self.as_of,)).fetchone()
+        self.waiting = column("SELECT reservation_id FROM reservations WHERE status = 'active' "
+                              "ORDER BY reservation_id LIMIT ?", calls)
+        self.fines = column('SELECT fine_id FROM fines ORDER BY fine_id LIMIT ?', calls)
+        self.last_change = column('SELECT COALESCE(MAX(change_id), 0) FROM change_log')[0]
+        self.book_ids = column('SELECT book_id FROM books ORDER BY book_id LIMIT 500')
+
+    def as_of_plus(self, i):
+        return datetime.fromordinal(REFERENCE_DATE.toordinal() + i).strftime('%Y-%m-%d')
+
+def _new_books(i, count=1000):
+    from models import Book
+    return [Book(title=f'Поступление {i}-{n}', author='Поставщик', genre='Роман',
+                 isbn=f'979{i:04d}{n:06d}', total_copies=2, available_copies=2) for n in range(count)]
+
+# (класс, метод, аргументы от (контекст, номер вызова))
+CASES = [
+    ('AuthDAO', 'authenticate_reader', lambda c, i: (c.card_number, c.password)),
+    ('AuthDAO', 'authenticate_librarian', lambda c, i: ('01', '1111')),
+    ('BookDAO', 'get_all_books', lambda c, i: ()),
+    ('BookDAO', 'get_books_page', lambda c, i: (c.middle_book,)),
+    ('BookDAO', 'iter_books', lambda c, i: ()),
+    ('BookDAO', 'get_copies_summary', lambda c, i: ()),
+    ('BookDAO', 'search_books', lambda c, i: (c.search_query,)),
+    ('BookDAO', 'get_book_by_id', lambda c, i: (c.book_id,)),
+    ('BookDAO', 'add_book', lambda c, i: (_new_books(i, 1)[0],)),
+    ('BookDAO', 'add_books', lambda c, i: (_new_books(i + 100),)),
+    ('BookDAO', 'update_book_copies', lambda c, i: (c.book_id, 0)),
+    ('ReaderDAO', 'get_all_readers', lambda c, i: ()),
+    ('ReaderDAO', 'iter_readers', lambda c, i: ()),
+    ('ReaderDAO', 'get_readers_with_fine_summary', lambda c, i: (c.readers[-1],)),
+    ('ReaderDAO', 'get_reader_by_id', lambda c, i: (c.reader_id,)),
+    ('ReaderDAO', 'get_reader_loans', lambda c, i: (c.reader_id,)),
+    ('ReaderDAO', 'get_reader_reservations', lambda c, i: (c.reader_id,)),
+    ('ReaderDAO', 'get_reader_fines', lambda c, i: (c.reader_id,)),
+    ('ReaderDAO', 'reserve_book', lambda c, i: (c.book_id, c.readers[i])),
+    ('ReaderDAO', 'get_account_summary', lambda c, i: (c.reader_id,)),
+    ('ReaderDAO', 'has_unpaid_fines', lambda c, i: (c.reader_id,)),
+    ('ReaderDAO', 'update_reader_status', lambda c, i: (c.readers[i], True)),
+    ('LibrarianDAO', 'get_all_librarians', lambda c, i: ()),
+    ('LoanDAO', 'get_active_loans', lambda c, i: ()),
+    ('LoanDAO', 'iter_active_loans', lambda c, i: ()),
+    ('LoanDAO', 'get_active_loans_page', lambda c, i: (c.middle_loan,)),
+    ('LoanDAO', 'get_overdue_loans', lambda c, i: (c.as_of, c.overdue_key)),
+    ('LoanDAO', 'count_overdue', lambda c, i: (c.as_of,)),
+    ('LoanDAO', 'create_loan', lambda c, i: (c.free_books[i], c.readers[i])),
+    ('LoanDAO', 'return_loan', lambda c, i: (c.active_loans[i],)),
+    ('ReservationDAO', 'get_all_reservations', lambda c, i: ()),
+    ('ReservationDAO', 'iter_reservations', lambda c, i: ()),
+    ('ReservationDAO', 'get_reservations_page', lambda c, i: (c.waiting[0],)),
+    ('ReservationDAO', 'create_reservation', lambda c, i: (c.book_id + 1, c.readers[i])),
+    ('ReservationDAO', 'place_hold', lambda c, i: (c.holdable_books[i], c.readers[i])),
+    ('ReservationDAO', 'cancel_reservation', lambda c, i: (c.waiting[i],)),
+    ('ReservationDAO', 'expire_holds', lambda c, i: (c.as_of_plus(i),)),
+    ('FineDAO', 'get_all_fines', lambda c, i: ()),
+    ('FineDAO', 'iter_fines', lambda c, i: ()),
+    ('FineDAO', 'get_fines_page', lambda c, i: (c.fines[-1],)),
+    ('FineDAO', 'add_fine_with_status_update', lambda c, i: (c.readers[i], 50.0, 'Порча книги')),
+    ('FineDAO', 'accrue_overdue_fines', lambda c, i: (c.as_of_plus(i),)),
+    ('FineDAO', 'update_fine_status', lambda c, i: (c.fines[i], 'paid')),
+    ('FineDAO', 'get_reader_unpaid_fines_count', lambda c, i: (c.reader_id,)),
+    ('StatsDAO', 'get_summary', lambda c, i: ()),
+    ('StatsDAO', 'get_genre_breakdown', lambda c, i: ()),
+    ('StatsDAO', 'rebuild', lambda c, i: ()),
+    ('ChangeLogDAO', 'get_last_change_id', lambda c, i: ()),
+    ('ChangeLogDAO', 'get_watermark', lambda c, i: ('benchmark',)),
+    ('ChangeLogDAO', 'set_watermark', lambda c, i: ('benchmark', i)),
+    ('ChangeLogDAO', 'iter_net_changes', lambda c, i: (max(c.last_change - 10_000, 0), c.last_change)),
+    ('ChangeLogDAO', 'get_rows', lambda c, i: ('books', c.book_ids)),
+]
+
+def missing_cases():
+    """Публичные методы DAO, для которых нет замера"""
+    import data_access
+
+    covered = {(class_name, method) for class_name, method, _ in CASES}
+    missing = []
+    for class_name in DAO_CLASSES:
+        for name, member in vars(getattr(data_access, class_name)).items():
+            if isinstance(member, staticmethod) and not name.startswith('_') and (class_name, name) not in covered:
+                missing.append(f"{class_name}.{name}")
+    return missing
+
+def _is_write_result(result):
+    """Пишущие методы DAO возвращают (успех, сообщение)"""
+    return isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], bool)
+
+def _timed(func, *args):
+    """Возвращает (время вызова в мс, число строк результата или None, результат)"""
+    started = time.perf_counter()
+    result = func(*args)
+    # Потоковые методы выполняют запросы только при переборе
+    if inspect.isgenerator(result):
+        rows = sum(1 for _ in result)
+    elif isinstance(result, (list, dict)):
+        rows = len(result)
+    else:
+        rows = None
+    return (time.perf_counter() - started) * 1000, rows, result
+
+def _summary(samples, rows, outcome=None):
+    summary = {
+        'median_ms': round(statistics.median(samples), 3),
+        'min_ms': round(min(samples), 3),
+        'max_ms': round(max(samples), 3),
+        'rows': rows,
+    }
+    if outcome is not None:
+        summary['outcome'] = outcome
+    return summary
+
+def run_scale(scale, seed, repeat, export_repeat):
+    """Выполняется в отдельном процессе: замеры одного масштаба на копии базы"""
+    fixture = ensure_fixture(scale, seed)
+    scratch_dir = tempfile.mkdtemp()
+    scratch = os.path.join(scratch_dir, 'benchmark.db')
+    shutil.copyfile(fixture, scratch)
+    os.environ['LIBRARY_DB'] = scratch
+
+    with redirect_stdout(io.StringIO()):
+        import data_access
+        import export
+
+    calls = repeat + 1
+    conn = sqlite3.connect(scratch)
+    context = Context(conn, calls)
+    conn.close()
+
+    results = {}
+    for class_name, method_name, make_args in CASES:
+        method = getattr(getattr(data_access, class_name), method_name)
+        samples = []
+        outcome = refusal = None
+        for i in range(calls):
+            # Методы DAO печатают служебные сообщения, здесь они не нужны
+            with redirect_stdout(io.StringIO()):
+                elapsed, rows, result = _timed(method, *make_args(context, i))
+            # Отказ (нет экземпляров, уже в очереди) выполняется быстрее
+            # настоящей записи, и его время нельзя сравнивать с эталоном
+            if _is_write_result(result):
+                if result[0]:
+                    outcome = outcome or 'ok'
+                else:
+                    outcome, refusal = 'refused', refusal or result[1]
+            # Первый вызов - прогрев кэша страниц и подготовленных запросов
+            if i:
+                samples.append(elapsed)
+        name = f"{class_name}.{method_name}"
+        results[name] = _summary(samples, rows, outcome)
+        if refusal:
+            results[name]['refusal'] = refusal
+
+    with redirect_stdout(io.StringIO()):
+        info = export.get_library_info()
+    for fmt in EXPORT_SERIALIZERS:
+        filename, save_document, _ = export.EXPORT_FORMATS[fmt]
+        samples = []
+        for _ in range(export_repeat):
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                ok = save_document(info, os.path.join(scratch_dir, filename))
+            if not ok:
+                raise RuntimeError(f"Экспорт {fmt} завершился ошибкой")
+            samples.append((time.perf_counter() - started) * 1000)
+        size = os.path.getsize(os.path.join(scratch_dir, filename))
+        results[f"export.{save_document.__name__}"] = dict(_summary(samples, None), bytes=size)
+
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+    return results
+
+def refused_cases(results):
+    """Пишущие замеры, в которых метод отказал: (масштаб, замер, сообщение)"""
+    return [(scale, name, result['refusal'])
+            for scale, cases in results.items()
+            for name, result in cases.items() if result.get('outcome') == 'refused']
+
+def compare(results, baseline, tolerance=TOLERANCE, min_delta_ms=MIN_DELTA_MS):
+    """Возвращает список регрессий (масштаб, замер, эталон, сейчас)"""
+    regressions = []
+    for scale, cases in results.items():
+        reference = baseline.get('scales', {}).get(scale, {})
+        for name, result in cases.items():
+            if name not in reference:
+                continue
+            before, now = reference[name]['min_ms'], result['min_ms']
+            if now > before * (1 + tolerance) and now - before > min_delta_ms:
+                regressions.append((scale, name, before, now))
+    return regressions
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+def print_results(scale, cases, reference):
+    print(f"\nМасштаб {scale}")
+    print(f"  {'Замер':<48}{'медиана, мс':>13}{'лучшее, мс':>12}{'эталон, мс':>12}{'строк':>9}")
+    for name, result in cases.items():
+        before = reference.get(name, {}).get('min_ms')
+        before = f"{before:.3f}" if before is not None else '-'
+        # Для пишущих методов вместо числа строк - исход записи
+        rows = result['rows'] if result['rows'] is not None else result.get('outcome', '')
+        print(f"  {name:<48}{result['median_ms']:>13.3f}{result['min_ms']:>12.3f}{before:>12}{rows:>9}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры методов DAO и экспорта на базах разного масштаба")
+    parser.add_argument('--scales', default='10k',
+                        help=f"масштабы через запятую из: {', '.join(FIXTURE_SCALES)} (по умолчанию: %(default)s)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="зерно генератора баз (по умолчанию: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=5, help="вызовов каждого метода (по умолчанию: %(default)s)")
+    parser.add_argument('--export-repeat', type=int, default=1,
+                        help="прогонов каждого сериализатора (по умолчанию: %(default)s)")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="файл эталона (по умолчанию: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="записать результаты этих масштабов в эталон вместо сравнения")
+    parser.add_argument('--output', help="файл результатов (по умолчанию: out/benchmarks/<время>.json)")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="допустимый рост лучшего времени, доля (по умолчанию: %(default)s)")
+    parser.add_argument('--min-delta-ms', type=float, default=MIN_DELTA_MS,
+                        help="рост меньше этого числа мс не считается регрессией (по умолчанию: %(default)s)")
+    args = parser.parse_args(argv)
+    args.scales = [scale.strip() for scale in args.scales.split(',') if scale.strip()]
+    unknown = [scale for scale in args.scales if scale not in FIXTURE_SCALES]
+    if unknown:
+        parser.error(f"неизвестные масштабы: {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Глобальный db создается при импорте data_access; здесь ему нужен временный файл
+    os.environ['LIBRARY_DB'] = os.path.join(tempfile.mkdtemp(), 'benchmark_cases.db')
+    with redirect_stdout(io.StringIO()):
+        missing = missing_cases()
+    if missing:
+        print(f"Нет замеров для методов: {', '.join(missing)}")
+        return 1
+
+    print("=" * 82)
+    print("ЗАМЕРЫ DAO И ЭКСПОРТА")
+    print("=" * 82)
+    baseline = load_baseline(args.baseline) or {'scales': {}}
+
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for scale in args.scales:
+        started = time.perf_counter()
+        # Отдельный процесс на масштаб: глобальный db открывается на его базе
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[scale] = pool.submit(run_scale, scale, args.seed, args.repeat, args.export_repeat).result()
+        print_results(scale, results[scale], baseline['scales'].get(scale, {}))
+        print(f"  Время масштаба: {time.perf_counter() - started:.1f} с")
+
+    document = {
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'scales': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    save_json(output, document)
+    print(f"\nРезультаты сохранены: {output}")
+
+    refused = refused_cases(results)
+    if refused:
+        print("-" * 82)
+        for scale, name, message in refused:
+            print(f"ОТКАЗ {scale} {name}: {message}")
+        print("Замер отказа не отражает время записи: аргументы в CASES нужно исправить")
+        return 1
+
+    if args.save_baseline:
+        baseline.update({key: value for key, value in document.items() if key != 'scales'})
+        baseline['scales'].update(results)
+        save_json(args.baseline, baseline)
+        print(f"Эталон обновлен: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    print("-" * 82)
+    if regressions:
+        for scale, name, before, now in regressions:
+            print(f"РЕГРЕССИЯ {scale} {name}: {before:.3f} -> {now:.3f} мс")
+        return 1
+    print("Регрессий нет")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
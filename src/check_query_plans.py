@@ -0,0 +1,175 @@
+# check_query_plans.py
+"""Проверка планов запросов DAO.
+
+Вызывает методы DAO на временной копии базы, перехватывает выполненные
+запросы и прогоняет каждый через EXPLAIN QUERY PLAN. Полный просмотр
+таблицы (SCAN) допускается только там, где он явно разрешен, например
+в выборках всего списка. При нарушении скрипт завершается с кодом 1.
+"""
+import inspect
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+from models import Book
+
+# (класс DAO, метод, аргументы, таблицы/псевдонимы, которым разрешен SCAN)
+CHECKS = [
+    ('AuthDAO', 'authenticate_reader', ('001', '111'), set()),
+    ('AuthDAO', 'authenticate_librarian', ('01', '1111'), set()),
+    ('BookDAO', 'get_all_books', (), {'books'}),
+    ('BookDAO', 'get_books_page', (), {'books'}),
+    ('BookDAO', 'get_books_page', (('Мастер', 3),), set()),
+    ('BookDAO', 'get_books_page', (None, ('Мастер', 3)), set()),
+    ('BookDAO', 'get_copies_summary', (), {'books'}),
+    ('BookDAO', 'search_books', ('мир',), set()),
+    ('BookDAO', 'get_book_by_id', (1,), set()),
+    ('BookDAO', 'update_book_copies', (1, 0), set()),
+    # Повторяющиеся значения, не похожие на ISBN, не должны откатывать импорт
+    ('BookDAO', 'add_books', ([Book(title='Проверка', author='-', isbn='978-5-389-00001-1'),
+                               Book(title='Без ISBN', author='-', isbn='N/A'),
+                               Book(title='Без ISBN', author='-', isbn='N/A'),
+                               Book(title='Без ISBN', author='-', isbn=''),
+                               Book(title='Без ISBN', author='-', isbn='')],), {'books', 'sqlite_master'}),
+    ('ReaderDAO', 'get_all_readers', (), {'readers'}),
+    ('ReaderDAO', 'get_readers_with_fine_summary', (), {'r'}),
+    ('ReaderDAO', 'get_readers_with_fine_summary', (1,), set()),
+    ('ReaderDAO', 'get_readers_with_fine_summary', (None, 3), set()),
+    ('ReaderDAO', 'get_reader_by_id', (1,), set()),
+    ('ReaderDAO', 'get_reader_loans', (1,), set()),
+    ('ReaderDAO', 'get_reader_reservations', (1,), set()),
+    ('ReaderDAO', 'get_reader_fines', (1,), set()),
+    ('ReaderDAO', 'get_account_summary', (1,), {'sqlite_master'}),
+    ('ReaderDAO', 'reserve_book', (1, 1), set()),
+    ('ReaderDAO', 'has_unpaid_fines', (1,), set()),
+    ('ReaderDAO', 'update_reader_status', (1, True), set()),
+    ('LibrarianDAO', 'get_all_librarians', (), {'librarians'}),
+    ('LoanDAO', 'get_active_loans', (), set()),
+    ('LoanDAO', 'get_active_loans_page', (), {'l'}),
+    ('LoanDAO', 'get_active_loans_page', (1,), set()),
+    ('LoanDAO', 'get_active_loans_page', (None, 3), set()),
+    ('LoanDAO', 'get_overdue_loans', ('2026-01-01',), set()),
+    ('LoanDAO', 'get_overdue_loans', ('2026-01-01', ('2025-12-10', 1)), set()),
+    ('LoanDAO', 'get_overdue_loans', ('2026-01-01', None, ('2025-12-12', 2)), set()),
+    ('LoanDAO', 'count_overdue', ('2026-01-01',), set()),
+    ('LoanDAO', 'create_loan', (1, 1), set()),
+    ('LoanDAO', 'return_loan', (1,), set()),
+    ('ReservationDAO', 'get_all_reservations', (), {'r'}),
+    ('ReservationDAO', 'get_reservations_page', (), {'r'}),
+    ('ReservationDAO', 'get_reservations_page', (1,), set()),
+    ('ReservationDAO', 'place_hold', (2, 1), set()),
+    ('ReservationDAO', 'cancel_reservation', (1,), set()),
+    ('ReservationDAO', 'expire_holds', ('2026-01-01',), set()),
+    ('FineDAO', 'get_all_fines', (), {'f'}),
+    ('FineDAO', 'get_fines_page', (), {'f'}),
+    ('FineDAO', 'get_fines_page', (1,), set()),
+    ('FineDAO', 'accrue_overdue_fines', ('2026-01-01',), set()),
+    ('FineDAO', 'update_fine_status', (1, 'unpaid'), set()),
+    ('FineDAO', 'get_reader_unpaid_fines_count', (1,), set()),
+    ('StatsDAO', 'get_summary', (), set()),
+    ('StatsDAO', 'get_genre_breakdown', (), {'library_stats'}),
+    ('StatsDAO', 'rebuild', (), {'books', 'readers', 'loans', 'reservations', 'fines'}),
+    ('ChangeLogDAO', 'get_last_change_id', (), set()),
+    ('ChangeLogDAO', 'get_watermark', ('export',), set()),
+    ('ChangeLogDAO', 'iter_net_changes', (0, 100), set()),
+    ('ChangeLogDAO', 'get_rows', ('books', [1, 2]), set()),
+]
+
+# Пишущие методы, для которых отказ (False, сообщение) на проверочных данных - ошибка
+MUST_SUCCEED = {('BookDAO', 'add_books')}
+
+SKIPPED_PREFIXES = ('SELECT 1', 'BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', '--', 'CREATE', 'DROP')
+
+def is_dao_query(sql):
+    # Служебные запросы FTS5 к своим теневым таблицам обращаются к ним как 'main'.'...'
+    sql = sql.lstrip()
+    return not sql.upper().startswith(SKIPPED_PREFIXES) and "'main'." not in sql
+
+def make_scratch_database(source):
+    """Копирует базу во временный файл, чтобы пишущие методы не меняли данные"""
+    scratch = os.path.join(tempfile.mkdtemp(), 'query_plans.db')
+    if os.path.exists(source):
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(scratch)
+        src.backup(dst)
+        src.close()
+        dst.close()
+        return scratch, False
+    return scratch, True
+
+def find_scans(conn, sql, allowed):
+    """Возвращает строки плана с недопустимым полным просмотром таблицы"""
+    problems = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+        detail = row[3]
+        # Поиск по виртуальной таблице FTS5 идет через ее собственный индекс
+        if detail.startswith('SCAN ') and 'VIRTUAL TABLE INDEX' not in detail:
+            table = detail.split()[1]
+            if table not in allowed:
+                problems.append(detail)
+    return problems
+
+def check_query_plans():
+    source = os.environ.get('LIBRARY_DB', 'library.db')
+    scratch, empty = make_scratch_database(source)
+    os.environ['LIBRARY_DB'] = scratch
+
+    from database import db
+    import data_access
+
+    if empty:
+        db.add_sample_data()
+
+    statements = []
+    db.trace_callback = statements.append
+    plan_conn = db.get_connection()
+
+    print("=" * 50)
+    print("ПРОВЕРКА ПЛАНОВ ЗАПРОСОВ DAO")
+    print("=" * 50)
+
+    failures = 0
+    for class_name, method_name, args, allowed in CHECKS:
+        statements.clear()
+        method = getattr(getattr(data_access, class_name), method_name)
+        # Методы DAO печатают служебные сообщения, здесь они не нужны
+        with redirect_stdout(io.StringIO()):
+            result = method(*args)
+            # Потоковые методы выполняют запрос только при переборе
+            if inspect.isgenerator(result):
+                for _ in result:
+                    pass
+
+        label = f"{class_name}.{method_name}"
+        if (class_name, method_name) in MUST_SUCCEED and not result[0]:
+            failures += 1
+            print(f"  ОШИБКА  {label}: {result[1]}")
+            continue
+        queries = [sql for sql in statements if is_dao_query(sql)]
+        problems = []
+        for sql in queries:
+            problems.extend(find_scans(plan_conn, sql, allowed))
+
+        if problems:
+            failures += 1
+            print(f"  ОШИБКА  {label}")
+            for detail in problems:
+                print(f"          {detail}")
+        else:
+            print(f"  OK      {label} (запросов: {len(queries)})")
+
+    db.trace_callback = None
+    plan_conn.close()
+
+    print("-" * 50)
+    if failures:
+        print(f"Найдено проверок с ошибками: {failures}")
+        return False
+    print("Все запросы используют индексы")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if check_query_plans() else 1)
@@ -1,430 +1,1163 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+from contextlib import closing
 from database import db
-from models import Reader, Librarian, Book, Loan, Reservation, Fine
+from migrations import (TRACKED_TABLES, STATS_ALL, STATS_COUNTERS, HOLD_STATUSES, add_library_stats,
+                        rebuild_library_stats)
+from isbn import normalize_isbn
+from mappers import RowMapper
+from models import Reader, ReaderFineSummary, AccountSummary, Librarian, Book, Loan, OverdueLoan, Reservation, Hold, Fine
 from datetime import datetime, timedelta
 
+STREAM_BATCH_SIZE = 500
+# Штраф за каждый день просрочки, руб.; переопределяется переменной окружения
+FINE_DAILY_RATE = float(os.environ.get('LIBRARY_FINE_DAILY_RATE', '10'))
+OVERDUE_FINE_REASON = 'Просрочка возврата книги'
+# Сколько дней отложенный экземпляр ждет читателя; переопределяется переменной окружения
+HOLD_DAYS = int(os.environ.get('LIBRARY_HOLD_DAYS', '3'))
+# Повторы пишущей транзакции, если блокировка записи занята дольше timeout соединения
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+IMPORT_BATCH_SIZE = 5000
+# Построчные триггеры books, которые BookDAO.add_books заменяет запросами на пачку
+IMPORT_SUSPENDED_TRIGGERS = ('books_fts_insert', 'books_log_insert', 'books_log_update',
+                             'books_stats_insert', 'books_stats_update')
+
+# Вставка книги с пополнением экземпляров, если ISBN уже есть в каталоге
+UPSERT_BOOK_SQL = '''
+    INSERT INTO books (title, author, isbn, isbn_norm, year, publisher, genre, description, total_copies, available_copies)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (isbn_norm) DO UPDATE SET
+        total_copies = total_copies + excluded.total_copies,
+        available_copies = available_copies + excluded.total_copies
+'''
+
+# Столбцы, которые выбирает каждое место вызова
+BOOK_FULL = RowMapper(Book, ['book_id', 'title', 'author', 'isbn', 'year', 'publisher', 'genre',
+                             'description', 'total_copies', 'available_copies'])
+# Списки и поиск не читают ISBN, издательство и описание, поэтому отдают
+# кортежи Book.Row, а не объекты Book с незаполненными полями
+BOOK_LIST = RowMapper(Book, ['book_id', 'title', 'author', 'year', 'genre', 'total_copies', 'available_copies'],
+                      rows_only=True)
+BOOK_SEARCH = RowMapper(Book, ['b.book_id', 'b.title', 'b.author', 'b.year', 'b.genre',
+                               'b.total_copies', 'b.available_copies'], rows_only=True)
+READER_FULL = RowMapper(Reader, ['reader_id', 'name', 'card_number', 'contact', 'password', 'status'])
+READER_AUTH = RowMapper(Reader, ['reader_id', 'name', 'card_number', 'password', 'status'])
+READER_PROFILE = RowMapper(Reader, ['reader_id', 'name', 'card_number', 'contact', 'status'])
+READER_LIST = RowMapper(Reader, ['reader_id', 'name', 'card_number', 'status'])
+READER_FINE_SUMMARY = RowMapper(ReaderFineSummary, ['r.reader_id', 'r.name', 'r.card_number', 'r.status',
+                                                    'COUNT(f.fine_id) AS unpaid_fines',
+                                                    'COALESCE(SUM(f.amount), 0) AS unpaid_amount'])
+LIBRARIAN_AUTH = RowMapper(Librarian, ['librarian_id', 'name', 'username', 'password'])
+LIBRARIAN_LIST = RowMapper(Librarian, ['librarian_id', 'name', 'username'])
+READER_LOAN = RowMapper(Loan, ['l.loan_id', 'l.book_id', 'l.reader_id', 'l.issue_date', 'l.due_date',
+                               'l.status', 'b.title AS book_title'])
+ACTIVE_LOAN = RowMapper(Loan, ['l.loan_id', 'l.book_id', 'l.reader_id', 'l.issue_date', 'l.due_date',
+                               'l.return_date', 'l.status', 'b.title AS book_title', 'r.name AS reader_name'])
+OVERDUE_LOAN = RowMapper(OverdueLoan, ['l.loan_id', 'l.book_id', 'l.reader_id', 'l.issue_date', 'l.due_date',
+                                       'b.title AS book_title', 'r.name AS reader_name',
+                                       'CAST(julianday(:as_of) - julianday(l.due_date) AS INTEGER) AS days_overdue'])
+READER_HOLD = RowMapper(Hold, ['r.reservation_id', 'r.book_id', 'r.reader_id', 'r.reservation_date', 'r.status',
+                               'r.expires_at', 'b.title AS book_title',
+                               '''CASE WHEN r.status = 'active' THEN (
+                                      SELECT COUNT(*) FROM reservations q
+                                      WHERE q.book_id = r.book_id AND q.status = 'active'
+                                        AND q.reservation_id <= r.reservation_id
+                                  ) END AS queue_position'''])
+RESERVATION_LIST = RowMapper(Reservation, ['r.reservation_id', 'r.book_id', 'r.reader_id', 'r.reservation_date',
+                                           'r.status', 'b.title AS book_title', 'read.name AS reader_name'])
+READER_FINE = RowMapper(Fine, ['fine_id', 'reader_id', 'amount', 'reason', 'status'])
+FINE_LIST = RowMapper(Fine, ['f.fine_id', 'f.reader_id', 'f.amount', 'f.reason', 'f.status', 'r.name AS reader_name'])
+
+def _as_of_date(as_of=None):
+    """Дата проверки в формате столбцов дат ('YYYY-MM-DD'), по умолчанию сегодня.
+
+    Даты в запросах сравниваются как строки, и произвольный текст совпал бы
+    с любой датой, поэтому строка разбирается заново; неверная дата - ValueError.
+    """
+    if as_of is None:
+        as_of = datetime.now()
+    if isinstance(as_of, str):
+        as_of = datetime.strptime(as_of, '%Y-%m-%d')
+    return as_of.strftime('%Y-%m-%d')
+
+def _is_busy(error):
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+def _write_transaction(work, retries=BUSY_RETRIES):
+    """Выполняет work(cursor) в транзакции BEGIN IMMEDIATE и возвращает его результат.
+
+    work возвращает (успех, сообщение); при неуспехе транзакция откатывается.
+    Если блокировка записи не получена (SQLITE_BUSY), попытка повторяется
+    с экспоненциальной задержкой и случайным разбросом, чтобы конкурирующие
+    писатели не просыпались одновременно.
+    """
+    for attempt in range(retries + 1):
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                success, message = work(cursor)
+                if success:
+                    conn.commit()
+                else:
+                    conn.rollback()
+                return success, message
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                if not _is_busy(e) or attempt == retries:
+                    raise
+        time.sleep(BUSY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+def _id_keyset(column, after=None, before=None):
+    """Условие, порядок и граница страницы, упорядоченной по целочисленному ключу column"""
+    if before is not None:
+        return f'{column} < ?', 'DESC', before
+    if after is not None:
+        return f'{column} > ?', 'ASC', after
+    return '1', 'ASC', None
+
+def _isbn_columns(isbn):
+    """Значения столбцов (isbn, isbn_norm) для записи книги.
+
+    Значение без единой цифры ISBN ('N/A', пустая строка) сохраняется как
+    NULL: иначе две такие книги нарушили бы UNIQUE(books.isbn), а пополнение
+    по isbn_norm их не объединяет.
+    """
+    key = normalize_isbn(isbn)
+    return (isbn if key is not None else None), key
+
+def _stream_rows(sql, params=(), batch_size=STREAM_BATCH_SIZE, row_factory=None):
+    """Выдает строки результата пачками по batch_size, не загружая всю выборку в память.
+
+    Пока генератор не исчерпан или не закрыт, он держит соединение из пула
+    чтения. Вызывающий код, который может прервать обход раньше, должен
+    оборачивать генератор в contextlib.closing, чтобы соединение сразу
+    вернулось в пул, а не ждало сборщика мусора.
+    """
+    with db.connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = row_factory
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
 class AuthDAO:
     @staticmethod
     def authenticate_reader(card_number, password):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM readers WHERE card_number = ?', (card_number,))
-        row = cursor.fetchone()
-        conn.close()
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = READER_AUTH.factory()
+            cursor.execute(f'SELECT {READER_AUTH.columns} FROM readers WHERE card_number = ?', (card_number,))
+            reader = cursor.fetchone()
 
-        if not row:
-            print(f"Читатель с картой {card_number} не найден")
-            return None
-            
-        # Создаем объект читателя
-        reader = Reader(*row)
+            if not reader:
+                print(f"Читатель с картой {card_number} не найден")
+                return None
 
-        # Сравниваем пароли ПРОСТО как строки
-        if reader.password == password:
-            print(f"Пароль верный для {reader.name}")
-            return reader
-        else:
-            print(f"Неверный пароль. Ожидалось: {reader.password}, получено: {password}")
-            return None
+            # Сравниваем пароли ПРОСТО как строки
+            if reader.password == password:
+                print(f"Пароль верный для {reader.name}")
+                return reader
+            else:
+                print(f"Неверный пароль для карты {card_number}")
+                return None
     
     @staticmethod
     def authenticate_librarian(username, password):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM librarians WHERE username = ?', (username,)) 
-        row = cursor.fetchone()
-        conn.close()
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = LIBRARIAN_AUTH.factory()
+            cursor.execute(f'SELECT {LIBRARIAN_AUTH.columns} FROM librarians WHERE username = ?', (username,)) 
+            librarian = cursor.fetchone()
 
-        if not row:
-            print(f"Библиотекарь с логином {username} не найден")
-            return None
-            
-        # Создаем объект библиотекаря
-        librarian = Librarian(*row)
+            if not librarian:
+                print(f"Библиотекарь с логином {username} не найден")
+                return None
         
-        # Сравниваем пароли ПРОСТО как строки
-        if librarian.password == password:
-            print(f"Пароль верный для {librarian.name}")
-            return librarian
-        else:
-            print(f"Неверный пароль. Ожидалось: {librarian.password}, получено: {password}")
-            return None
+            # Сравниваем пароли ПРОСТО как строки
+            if librarian.password == password:
+                print(f"Пароль верный для {librarian.name}")
+                return librarian
+            else:
+                print(f"Неверный пароль для логина {username}")
+                return None
         
 class BookDAO:
     @staticmethod
     def get_all_books():
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM books ORDER BY title')
-        books = [Book(*row) for row in cursor.fetchall()]
-        conn.close()
-        return books
+        """Возвращает все книги кортежными строками Book.Row (без ISBN, издательства и описания)"""
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = BOOK_LIST.factory()
+            cursor.execute(f'SELECT {BOOK_LIST.columns} FROM books ORDER BY title')
+            return cursor.fetchall()
     
+    @staticmethod
+    def get_books_page(after=None, before=None, limit=20, full=False):
+        """Возвращает страницу книг, упорядоченных по (title, book_id).
+
+        after/before - ключ (title, book_id) граничной книги соседней страницы.
+        Страница ищется по индексу от ключа, поэтому ее стоимость не зависит
+        от того, насколько далеко она от начала каталога.
+        Без full книги выдаются кортежами Book.Row без ISBN, издательства
+        и описания; full=True - объекты Book со всеми столбцами (для экспорта).
+        """
+        mapper = BOOK_FULL if full else BOOK_LIST
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = mapper.factory()
+            if before is not None:
+                cursor.execute(f'''
+                    SELECT {mapper.columns} FROM books
+                    WHERE (title, book_id) < (?, ?)
+                    ORDER BY title DESC, book_id DESC
+                    LIMIT ?
+                ''', (*before, limit))
+                books = cursor.fetchall()
+                books.reverse()
+                return books
+
+            if after is not None:
+                cursor.execute(f'''
+                    SELECT {mapper.columns} FROM books
+                    WHERE (title, book_id) > (?, ?)
+                    ORDER BY title, book_id
+                    LIMIT ?
+                ''', (*after, limit))
+            else:
+                cursor.execute(f'SELECT {mapper.columns} FROM books ORDER BY title, book_id LIMIT ?', (limit,))
+            return cursor.fetchall()
+
+    @staticmethod
+    def iter_books(after_title=None, after_id=None, limit=100, full=False):
+        """Перебирает книги по порядку названий, загружая по limit строк за запрос"""
+        after = (after_title, after_id or 0) if after_title is not None else None
+        while True:
+            books = BookDAO.get_books_page(after=after, limit=limit, full=full)
+            yield from books
+            if len(books) < limit:
+                return
+            after = (books[-1].title, books[-1].book_id)
+
+    @staticmethod
+    def get_copies_summary():
+        """Возвращает общее количество экземпляров и количество доступных"""
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(SUM(total_copies), 0), COALESCE(SUM(available_copies), 0) FROM books')
+            return cursor.fetchone()
+
     @staticmethod
     def search_books(query):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM books 
-            WHERE title LIKE ? OR author LIKE ? OR genre LIKE ? OR isbn LIKE ?
-            ORDER BY title
-        ''', (f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%'))
-        books = [Book(*row) for row in cursor.fetchall()]
-        conn.close()
-        return books
+        """Ищет книги по названию, автору, жанру и ISBN через полнотекстовый индекс.
+
+        Каждое слово запроса ищется как префикс, результаты упорядочены
+        по релевантности (bm25, совпадения в названии весят больше).
+        """
+        match = BookDAO._build_match_query(query)
+        if not match:
+            return []
+
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = BOOK_SEARCH.factory()
+            cursor.execute(f'''
+                SELECT {BOOK_SEARCH.columns} FROM books_fts
+                JOIN books b ON b.book_id = books_fts.rowid
+                WHERE books_fts MATCH ?
+                ORDER BY bm25(books_fts, 10.0, 5.0, 2.0, 1.0), b.title
+            ''', (match,))
+            return cursor.fetchall()
+
+    @staticmethod
+    def _build_match_query(query):
+        # Разбиваем запрос на слова и экранируем их, чтобы символы
+        # синтаксиса FTS5 (кавычки, *, -, :) не влияли на поиск.
+        # «ё» в индексе хранится как «е», запрос приводим так же
+        query = query.replace('ё', 'е').replace('Ё', 'Е')
+        words = re.findall(r'\w+', query)
+        return ' '.join(f'"{word}"*' for word in words)
     
     @staticmethod
     def get_book_by_id(book_id):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM books WHERE book_id = ?', (book_id,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return Book(*row)
-        return None
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = BOOK_FULL.factory()
+            cursor.execute(f'SELECT {BOOK_FULL.columns} FROM books WHERE book_id = ?', (book_id,))
+            return cursor.fetchone()
     
     @staticmethod
     def add_book(book):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO books (title, author, isbn, year, publisher, genre, description, total_copies, available_copies)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (book.title, book.author, book.isbn, book.year, book.publisher, book.genre, book.description, book.total_copies, book.available_copies))
-        conn.commit()
-        conn.close()
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO books (title, author, isbn, isbn_norm, year, publisher, genre, description, total_copies, available_copies)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (book.title, book.author, *_isbn_columns(book.isbn), book.year, book.publisher, book.genre, book.description, book.total_copies, book.available_copies))
+            conn.commit()
+
+    @staticmethod
+    def add_books(books, batch_size=IMPORT_BATCH_SIZE):
+        """Добавляет книги пачками executemany в одной транзакции.
+
+        Книга с уже известным ISBN (в любом написании, см. isbn.normalize_isbn)
+        не создается заново: ее total_copies и available_copies увеличиваются
+        на число поступивших экземпляров. Значения, не похожие на ISBN,
+        сохраняются как NULL и дубликатами не считаются. При ошибке
+        откатывается весь импорт.
+        Возвращает (успех, сообщение).
+        """
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('SELECT COUNT(*), COALESCE(MAX(book_id), 0) FROM books')
+                count_before, max_id_before = cursor.fetchone()
+                # Построчные триггеры FTS, журнала изменений и статистики на порядок
+                # медленнее одного INSERT ... SELECT на пачку, поэтому на время импорта
+                # они снимаются. DDL в SQLite транзакционен: при откате триггеры вернутся сами
+                placeholders = ', '.join('?' * len(IMPORT_SUSPENDED_TRIGGERS))
+                cursor.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})",
+                               IMPORT_SUSPENDED_TRIGGERS)
+                suspended = cursor.fetchall()
+                for name, _ in suspended:
+                    cursor.execute(f'DROP TRIGGER {name}')
+
+                processed = 0
+                last_id = max_id_before
+                batch = []
+
+                def flush():
+                    nonlocal processed, last_id
+                    # Книги, которые уже были в базе до пачки и получат пополнение по ISBN:
+                    # их вклад в статистику пересчитывается. Унарный плюс не дает
+                    # планировщику выбрать просмотр диапазона book_id вместо индекса isbn_norm
+                    keys = json.dumps([row[3] for row in batch if row[3] is not None])
+                    cursor.execute('''
+                        SELECT book_id FROM books
+                        WHERE isbn_norm IN (SELECT value FROM json_each(?)) AND +book_id <= ?
+                    ''', (keys, last_id))
+                    matched = [book_id for book_id, in cursor.fetchall()]
+                    existing = json.dumps(matched)
+                    if matched:
+                        add_library_stats(cursor, 'books', 'book_id IN (SELECT value FROM json_each(?))',
+                                          (existing,), '-')
+                    cursor.executemany(UPSERT_BOOK_SQL, batch)
+                    if matched:
+                        add_library_stats(cursor, 'books', 'book_id IN (SELECT value FROM json_each(?))',
+                                          (existing,))
+                        # Книги, созданные этим же импортом, остаются в журнале вставками
+                        cursor.execute('''
+                            INSERT INTO change_log (table_name, row_id, operation)
+                            SELECT 'books', value, 'update' FROM json_each(?) WHERE value <= ?
+                        ''', (existing, max_id_before))
+                    # Новые книги получили book_id больше прежнего максимума (AUTOINCREMENT)
+                    add_library_stats(cursor, 'books', 'book_id > ?', (last_id,))
+                    cursor.execute('''
+                        INSERT INTO change_log (table_name, row_id, operation)
+                        SELECT 'books', book_id, 'insert' FROM books WHERE book_id > ?
+                    ''', (last_id,))
+                    cursor.execute('SELECT COALESCE(MAX(book_id), 0) FROM books')
+                    last_id = cursor.fetchone()[0]
+                    processed += len(batch)
+                    batch.clear()
+
+                for book in books:
+                    batch.append((book.title, book.author, *_isbn_columns(book.isbn), book.year,
+                                  book.publisher, book.genre, book.description, book.total_copies,
+                                  book.available_copies))
+                    if len(batch) >= batch_size:
+                        flush()
+                if batch:
+                    flush()
+                cursor.execute('''
+                    INSERT INTO books_fts (rowid, title, author, genre, isbn)
+                    SELECT book_id, title, author, genre, isbn
+                    FROM books_fts_content WHERE book_id > ?
+                ''', (max_id_before,))
+                for _, sql in suspended:
+                    cursor.execute(sql)
+                cursor.execute('SELECT COUNT(*) FROM books')
+                added = cursor.fetchone()[0] - count_before
+                conn.commit()
+                return True, f"Обработано книг: {processed}, новых: {added}, пополнено: {processed - added}"
+            except Exception as e:
+                conn.rollback()
+                return False, f"Ошибка импорта книг: {e}"
 
     @staticmethod
     def update_book_copies(book_id, change):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE books SET available_copies = available_copies + ? WHERE book_id = ?', 
-                      (change, book_id))
-        conn.commit()
-        conn.close()
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE books SET available_copies = available_copies + ? WHERE book_id = ?', 
+                          (change, book_id))
+            conn.commit()
 
 class ReaderDAO:
     @staticmethod
-    def get_all_readers():
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM readers')
-        readers = [Reader(*row) for row in cursor.fetchall()]
-        conn.close()
-        return readers
+    def get_all_readers(as_rows=False):
+        return list(ReaderDAO.iter_readers(as_rows))
+
+    @staticmethod
+    def iter_readers(as_rows=False, full=False):
+        """Перебирает читателей; full=True - все столбцы, включая пароль (для экспорта)"""
+        mapper = READER_FULL if full else READER_LIST
+        yield from _stream_rows(f'SELECT {mapper.columns} FROM readers', row_factory=mapper.factory(as_rows))
+
+    @staticmethod
+    def get_readers_with_fine_summary(after=None, before=None, limit=20):
+        """Возвращает страницу читателей с числом и суммой неоплаченных штрафов.
+
+        Один сгруппированный запрос вместо запроса штрафов на каждого читателя.
+        Страницы упорядочены по reader_id; after/before - граничный reader_id
+        соседней страницы, как в BookDAO.get_books_page.
+        """
+        condition, order, bound = _id_keyset('r.reader_id', after, before)
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = READER_FINE_SUMMARY.factory()
+            cursor.execute(f'''
+                SELECT {READER_FINE_SUMMARY.columns}
+                FROM readers r
+                LEFT JOIN fines f ON f.reader_id = r.reader_id AND f.status = 'unpaid'
+                WHERE {condition}
+                GROUP BY r.reader_id
+                ORDER BY r.reader_id {order}
+                LIMIT ?
+            ''', (bound, limit) if bound is not None else (limit,))
+            readers = cursor.fetchall()
+            if before is not None:
+                readers.reverse()
+            return readers
 
     @staticmethod
     def get_reader_by_id(reader_id):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM readers WHERE reader_id = ?', (reader_id,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return Reader(*row)
-        return None
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = READER_PROFILE.factory()
+            cursor.execute(f'SELECT {READER_PROFILE.columns} FROM readers WHERE reader_id = ?', (reader_id,))
+            return cursor.fetchone()
     
     @staticmethod
     def get_reader_loans(reader_id):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT l.*, b.title 
-            FROM loans l 
-            JOIN books b ON l.book_id = b.book_id 
-            WHERE l.reader_id = ? AND l.status = 'active'
-        ''', (reader_id,))
-        loans = []
-        for row in cursor.fetchall():
-            loan = Loan(*row[:7])
-            loan.book_title = row[7]
-            loans.append(loan)
-        conn.close()
-        return loans
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = READER_LOAN.factory()
+            cursor.execute(f'''
+                SELECT {READER_LOAN.columns}
+                FROM loans l 
+                JOIN books b ON l.book_id = b.book_id 
+                WHERE l.reader_id = ? AND l.status = 'active'
+            ''', (reader_id,))
+            return cursor.fetchall()
     
     @staticmethod
     def get_reader_reservations(reader_id):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT r.*, b.title 
-            FROM reservations r 
-            JOIN books b ON r.book_id = b.book_id 
-            WHERE r.reader_id = ? AND r.status = 'active'
-        ''', (reader_id,))
-        reservations = []
-        for row in cursor.fetchall():
-            reservation = Reservation(*row[:5])
-            reservation.book_title = row[5]
-            reservations.append(reservation)
-        conn.close()
-        return reservations
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = READER_HOLD.factory()
+            cursor.execute(f'''
+                SELECT {READER_HOLD.columns}
+                FROM reservations r 
+                JOIN books b ON r.book_id = b.book_id 
+                WHERE r.reader_id = ? AND r.status IN {HOLD_STATUSES}
+                ORDER BY r.reservation_id
+            ''', (reader_id,))
+            return cursor.fetchall()
     
     @staticmethod
     def get_reader_fines(reader_id):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM fines WHERE reader_id = ?', (reader_id,))
-        fines = [Fine(*row) for row in cursor.fetchall()]
-        conn.close()
-        return fines
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = READER_FINE.factory()
+            cursor.execute(f'SELECT {READER_FINE.columns} FROM fines WHERE reader_id = ?', (reader_id,))
+            return cursor.fetchall()
     
     @staticmethod
     def reserve_book(book_id, reader_id):
-        """Бронирует книгу для читателя"""
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # Проверяем, доступна ли книга для бронирования
-            cursor.execute('SELECT available_copies FROM books WHERE book_id = ?', (book_id,))
-            book = cursor.fetchone()
-            
-            if not book:
-                return False, "Книга не найдена"
-            
-            available_copies = book[0]
-            if available_copies <= 0:
-                return False, "Нет доступных экземпляров для бронирования"
-            
-            # Проверяем, не забронировал ли уже читатель эту книгу
-            cursor.execute('''
-                SELECT * FROM reservations 
-                WHERE book_id = ? AND reader_id = ? AND status = "active"
-            ''', (book_id, reader_id))
-            existing_reservation = cursor.fetchone()
-            
-            if existing_reservation:
-                return False, "Вы уже забронировали эту книгу"
-            
-            # Создаем бронирование
-            reservation_date = datetime.now().strftime('%Y-%m-%d')
-            cursor.execute('''
-                INSERT INTO reservations (book_id, reader_id, reservation_date, status)
-                VALUES (?, ?, ?, "active")
-            ''', (book_id, reader_id, reservation_date))
-            
-            conn.commit()
-            return True, "Книга успешно забронирована"
-            
-        except Exception as e:
-            conn.rollback()
-            return False, f"Ошибка при бронировании: {e}"
-        finally:
-            conn.close()
+        """Бронирует книгу для читателя (см. ReservationDAO.place_hold)"""
+        return ReservationDAO.place_hold(book_id, reader_id)
+
+    @staticmethod
+    def get_account_summary(reader_id):
+        """Возвращает профиль, выдачи, бронирования и штрафы читателя.
+
+        Все запросы идут через одно соединение в одной читающей транзакции,
+        поэтому части сводки согласованы между собой.
+        """
+        with db.snapshot():
+            return AccountSummary(
+                reader=ReaderDAO.get_reader_by_id(reader_id),
+                loans=ReaderDAO.get_reader_loans(reader_id),
+                reservations=ReaderDAO.get_reader_reservations(reader_id),
+                fines=ReaderDAO.get_reader_fines(reader_id),
+            )
 
     @staticmethod
     def has_unpaid_fines(reader_id):
         """Проверяет, есть ли у читателя неоплаченные штрафы"""
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT COUNT(*) FROM fines 
-            WHERE reader_id = ? AND status = "unpaid"
-        ''', (reader_id,))
+            cursor.execute('''
+                SELECT COUNT(*) FROM fines 
+                WHERE reader_id = ? AND status = "unpaid"
+            ''', (reader_id,))
         
-        count = cursor.fetchone()[0]
-        conn.close()
+            count = cursor.fetchone()[0]
         
-        return count > 0
+            return count > 0
     
     @staticmethod
     def update_reader_status(reader_id, new_status):
         """Обновляет статус читателя и синхронизирует штрафы"""
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        with db.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            # Обновляем статус читателя
-            cursor.execute('UPDATE readers SET status = ? WHERE reader_id = ?', 
-                          (new_status, reader_id))
+            try:
+                # Обновляем статус читателя
+                cursor.execute('UPDATE readers SET status = ? WHERE reader_id = ?', 
+                              (new_status, reader_id))
             
-            # Если статус становится "активен", помечаем все штрафы как оплаченные
-            if new_status:
-                cursor.execute('UPDATE fines SET status = "paid" WHERE reader_id = ?', 
-                              (reader_id,))
+                # Если статус становится "активен", помечаем все штрафы как оплаченные
+                if new_status:
+                    cursor.execute('UPDATE fines SET status = "paid" WHERE reader_id = ?', 
+                                  (reader_id,))
             
-            conn.commit()
-            return True, "Статус читателя обновлен"
+                conn.commit()
+                return True, "Статус читателя обновлен"
             
-        except Exception as e:
-            conn.rollback()
-            return False, f"Ошибка при обновлении статуса: {e}"
-        finally:
-            conn.close()
+            except Exception as e:
+                conn.rollback()
+                return False, f"Ошибка при обновлении статуса: {e}"
+
+class ReaderAccountCache:
+    """Сводка учетной записи читателя, кэшированная на время сеанса.
+
+    Сводка перечитывается, только если база изменилась: PRAGMA data_version
+    на отдельном соединении кэша меняется после каждой фиксации транзакции
+    другим соединением. Записи самого сеанса сбрасывают кэш через invalidate().
+    """
+
+    def __init__(self, reader_id):
+        self.reader_id = reader_id
+        # data_version сравнивается только в пределах одного соединения,
+        # поэтому кэш держит свое, а не берет из пула
+        self._conn = db.get_connection(read_only=True)
+        self._data_version = None
+        self._summary = None
+
+    def get(self):
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if self._summary is None or data_version != self._data_version:
+            self._summary = ReaderDAO.get_account_summary(self.reader_id)
+            self._data_version = data_version
+        return self._summary
+
+    def invalidate(self):
+        self._summary = None
+
+    def close(self):
+        self._conn.close()
 
 class LibrarianDAO:
     @staticmethod
     def get_all_librarians():
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM librarians')
-        librarians = [Librarian(*row) for row in cursor.fetchall()]
-        conn.close()
-        return librarians
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = LIBRARIAN_LIST.factory()
+            cursor.execute(f'SELECT {LIBRARIAN_LIST.columns} FROM librarians')
+            return cursor.fetchall()
 
 class LoanDAO:
     @staticmethod
-    def get_active_loans():
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT l.*, b.title, r.name 
+    def get_active_loans(as_rows=False):
+        return list(LoanDAO.iter_active_loans(as_rows))
+
+    @staticmethod
+    def iter_active_loans(as_rows=False):
+        yield from _stream_rows(f'''
+            SELECT {ACTIVE_LOAN.columns}
             FROM loans l 
             JOIN books b ON l.book_id = b.book_id 
             JOIN readers r ON l.reader_id = r.reader_id
             WHERE l.status = 'active'
-        ''')
-        loans = []
-        for row in cursor.fetchall():
-            loan = Loan(*row[:7])
-            loan.book_title = row[7]
-            loan.reader_name = row[8]
-            loans.append(loan)
-        conn.close()
-        return loans
+        ''', row_factory=ACTIVE_LOAN.factory(as_rows))
+
+    @staticmethod
+    def get_active_loans_page(after=None, before=None, limit=20):
+        """Возвращает страницу активных выдач по loan_id; after/before - граничный loan_id"""
+        condition, order, bound = _id_keyset('l.loan_id', after, before)
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = ACTIVE_LOAN.factory()
+            cursor.execute(f'''
+                SELECT {ACTIVE_LOAN.columns}
+                FROM loans l
+                JOIN books b ON l.book_id = b.book_id
+                JOIN readers r ON l.reader_id = r.reader_id
+                WHERE l.status = 'active' AND {condition}
+                ORDER BY l.loan_id {order}
+                LIMIT ?
+            ''', (bound, limit) if bound is not None else (limit,))
+            loans = cursor.fetchall()
+            if before is not None:
+                loans.reverse()
+            return loans
     
-    # ДОБАВЛЕННЫЙ МЕТОД для создания выдачи
+    @staticmethod
+    def get_overdue_loans(as_of=None, after=None, before=None, limit=20):
+        """Возвращает страницу просроченных на дату as_of выдач, самые давние первыми.
+
+        Фильтр и число дней просрочки считаются в SQL по индексу
+        (status, due_date), поэтому стоимость страницы не зависит от числа
+        выдач в истории. Страницы упорядочены по (due_date, loan_id);
+        after/before - ключ граничной выдачи соседней страницы.
+        """
+        params = {'as_of': _as_of_date(as_of), 'limit': limit}
+        if before is not None:
+            condition, order = 'AND (l.due_date, l.loan_id) < (:due_date, :loan_id)', 'DESC'
+            params['due_date'], params['loan_id'] = before
+        elif after is not None:
+            condition, order = 'AND (l.due_date, l.loan_id) > (:due_date, :loan_id)', 'ASC'
+            params['due_date'], params['loan_id'] = after
+        else:
+            condition, order = '', 'ASC'
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = OVERDUE_LOAN.factory()
+            cursor.execute(f'''
+                SELECT {OVERDUE_LOAN.columns}
+                FROM loans l
+                JOIN books b ON l.book_id = b.book_id
+                JOIN readers r ON l.reader_id = r.reader_id
+                WHERE l.status = 'active' AND l.due_date < :as_of {condition}
+                ORDER BY l.due_date {order}, l.loan_id {order}
+                LIMIT :limit
+            ''', params)
+            loans = cursor.fetchall()
+            if before is not None:
+                loans.reverse()
+            return loans
+
+    @staticmethod
+    def count_overdue(as_of=None):
+        """Возвращает число выдач, просроченных на дату as_of"""
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) FROM loans
+                WHERE status = 'active' AND due_date < ?
+            ''', (_as_of_date(as_of),))
+            return cursor.fetchone()[0]
+
     @staticmethod
     def create_loan(book_id, reader_id, days=30):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        from datetime import datetime, timedelta
+        """Выдает книгу читателю: списывает экземпляр и создает выдачу атомарно.
+
+        Экземпляр списывается условным UPDATE внутри той же транзакции,
+        что и вставка выдачи, поэтому параллельные выдачи не уводят остаток
+        в минус. Экземпляры, отложенные по бронированиям, выдаются только
+        их читателям: готовое бронирование читателя закрывается ('fulfilled')
+        и освобождает свой экземпляр. Возвращает (успех, сообщение).
+        """
         issue_date = datetime.now().strftime('%Y-%m-%d')
         due_date = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
-        
-        cursor.execute('''
-            INSERT INTO loans (book_id, reader_id, issue_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', (book_id, reader_id, issue_date, due_date))
-        
-        # Уменьшаем количество доступных книг
-        BookDAO.update_book_copies(book_id, -1)
-        
-        conn.commit()
-        conn.close()
-        return True
+
+        def checkout(cursor):
+            cursor.execute('''
+                UPDATE reservations SET status = 'fulfilled'
+                WHERE book_id = ? AND reader_id = ? AND status = 'ready'
+            ''', (book_id, reader_id))
+            cursor.execute('''
+                UPDATE books SET available_copies = available_copies - 1
+                WHERE book_id = ? AND available_copies > COALESCE(
+                    (SELECT ready FROM book_holds WHERE book_id = ?), 0)
+            ''', (book_id, book_id))
+            if cursor.rowcount == 0:
+                cursor.execute('SELECT 1 FROM books WHERE book_id = ?', (book_id,))
+                if cursor.fetchone() is None:
+                    return False, "Книга не найдена"
+                return False, "Нет доступных экземпляров"
+
+            cursor.execute('''
+                INSERT INTO loans (book_id, reader_id, issue_date, due_date, status)
+                VALUES (?, ?, ?, ?, 'active')
+            ''', (book_id, reader_id, issue_date, due_date))
+            return True, f"Книга выдана до {due_date}"
+
+        try:
+            return _write_transaction(checkout)
+        except Exception as e:
+            return False, f"Ошибка при выдаче книги: {e}"
+
+    @staticmethod
+    def return_loan(loan_id):
+        """Закрывает выдачу и возвращает экземпляр в фонд одной транзакцией"""
+        return_date = datetime.now().strftime('%Y-%m-%d')
+
+        def checkin(cursor):
+            cursor.execute("SELECT book_id FROM loans WHERE loan_id = ? AND status = 'active'", (loan_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return False, "Активная выдача не найдена"
+
+            cursor.execute('''
+                UPDATE loans SET status = 'returned', return_date = ?
+                WHERE loan_id = ?
+            ''', (return_date, loan_id))
+            cursor.execute('''
+                UPDATE books SET available_copies = available_copies + 1
+                WHERE book_id = ? AND available_copies < total_copies
+            ''', (row[0],))
+            # Вернувшийся экземпляр сразу откладывается для первого в очереди
+            ReservationDAO._promote_holds(cursor, row[0])
+            return True, "Книга возвращена"
+
+        try:
+            return _write_transaction(checkin)
+        except Exception as e:
+            return False, f"Ошибка при возврате книги: {e}"
 
 class ReservationDAO:
     @staticmethod
-    def get_all_reservations():
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT r.*, b.title, read.name
+    def get_all_reservations(as_rows=False):
+        return list(ReservationDAO.iter_reservations(as_rows))
+
+    @staticmethod
+    def iter_reservations(as_rows=False):
+        yield from _stream_rows(f'''
+            SELECT {RESERVATION_LIST.columns}
             FROM reservations r
             JOIN books b ON r.book_id = b.book_id
             JOIN readers read ON r.reader_id = read.reader_id
-        ''')
-        reservations = []
-        for row in cursor.fetchall():
-            reservation = Reservation(*row[:5])
-            reservation.book_title = row[5]
-            reservation.reader_name = row[6]
-            reservations.append(reservation)
-        conn.close()
-        return reservations
+        ''', row_factory=RESERVATION_LIST.factory(as_rows))
+
+    @staticmethod
+    def get_reservations_page(after=None, before=None, limit=20):
+        """Возвращает страницу бронирований по reservation_id; after/before - граничный reservation_id"""
+        condition, order, bound = _id_keyset('r.reservation_id', after, before)
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = RESERVATION_LIST.factory()
+            cursor.execute(f'''
+                SELECT {RESERVATION_LIST.columns}
+                FROM reservations r
+                JOIN books b ON r.book_id = b.book_id
+                JOIN readers read ON r.reader_id = read.reader_id
+                WHERE {condition}
+                ORDER BY r.reservation_id {order}
+                LIMIT ?
+            ''', (bound, limit) if bound is not None else (limit,))
+            reservations = cursor.fetchall()
+            if before is not None:
+                reservations.reverse()
+            return reservations
     
-    # ДОБАВЛЕННЫЙ МЕТОД для создания бронирования
     @staticmethod
     def create_reservation(book_id, reader_id):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        reservation_date = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute('''
-            INSERT INTO reservations (book_id, reader_id, reservation_date)
-            VALUES (?, ?, ?)
-        ''', (book_id, reader_id, reservation_date))
-        
-        conn.commit()
-        conn.close()
-        return True
-    
-    # ДОБАВЛЕННЫЙ МЕТОД для отмены бронирования
+        return ReservationDAO.place_hold(book_id, reader_id)
+
+    @staticmethod
+    def place_hold(book_id, reader_id):
+        """Ставит читателя в очередь на книгу.
+
+        Если есть свободный экземпляр и очередь пуста, он сразу
+        откладывается для читателя на HOLD_DAYS дней ('ready'), иначе
+        читатель ждет в очереди ('active'). Повторное бронирование
+        отсекает уникальный индекс, а не предварительная проверка,
+        поэтому два терминала не могут забронировать книгу дважды.
+        Возвращает (успех, сообщение).
+        """
+        today = datetime.now()
+        expires_at = (today + timedelta(days=HOLD_DAYS)).strftime('%Y-%m-%d')
+
+        def place(cursor):
+            cursor.execute('''
+                SELECT effective_available, waiting_holds FROM book_availability WHERE book_id = ?
+            ''', (book_id,))
+            availability = cursor.fetchone()
+            if availability is None:
+                return False, "Книга не найдена"
+
+            effective_available, waiting = availability
+            ready = effective_available > 0 and waiting == 0
+            try:
+                cursor.execute('''
+                    INSERT INTO reservations (book_id, reader_id, reservation_date, status, expires_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (book_id, reader_id, today.strftime('%Y-%m-%d'),
+                      'ready' if ready else 'active', expires_at if ready else None))
+            except sqlite3.IntegrityError:
+                return False, "Вы уже забронировали эту книгу"
+
+            if ready:
+                return True, f"Книга отложена для вас до {expires_at}"
+            return True, f"Вы в очереди на книгу, ваше место: {waiting + 1}"
+
+        try:
+            return _write_transaction(place)
+        except Exception as e:
+            return False, f"Ошибка при бронировании: {e}"
+
     @staticmethod
     def cancel_reservation(reservation_id):
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE reservations SET status = "cancelled" WHERE reservation_id = ?', 
-                      (reservation_id,))
-        conn.commit()
-        conn.close()
-        return True
+        """Отменяет действующее бронирование; отложенный экземпляр уходит следующему в очереди"""
+        def cancel(cursor):
+            cursor.execute(f'''
+                SELECT book_id, status FROM reservations
+                WHERE reservation_id = ? AND status IN {HOLD_STATUSES}
+            ''', (reservation_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return False, "Действующее бронирование не найдено"
+
+            book_id, status = row
+            cursor.execute("UPDATE reservations SET status = 'cancelled' WHERE reservation_id = ?",
+                           (reservation_id,))
+            if status == 'ready':
+                ReservationDAO._promote_holds(cursor, book_id)
+            return True, "Бронирование отменено"
+
+        try:
+            success, _ = _write_transaction(cancel)
+            return success
+        except Exception:
+            return False
 
-class FineDAO:
     @staticmethod
-    def get_all_fines():
-        conn = db.get_connection()
-        cursor = conn.cursor()
+    def expire_holds(as_of=None):
+        """Снимает отложенные экземпляры, которые не забрали до as_of, и передает их дальше по очереди"""
+        as_of = _as_of_date(as_of)
+
+        def expire(cursor):
+            # Без DISTINCT: иначе планировщик идет по idx_reservations_queue
+            # целиком вместо частичного индекса по сроку
+            cursor.execute('''
+                SELECT book_id FROM reservations
+                WHERE status = 'ready' AND expires_at < ?
+            ''', (as_of,))
+            book_ids = sorted({book_id for book_id, in cursor.fetchall()})
+
+            cursor.execute('''
+                UPDATE reservations SET status = 'expired'
+                WHERE status = 'ready' AND expires_at < ?
+            ''', (as_of,))
+            expired = cursor.rowcount
+
+            promoted = sum(ReservationDAO._promote_holds(cursor, book_id) for book_id in book_ids)
+            return True, f"Истекших бронирований: {expired}, передано следующим в очереди: {promoted}"
+
+        try:
+            return _write_transaction(expire)
+        except Exception as e:
+            return False, f"Ошибка при снятии бронирований: {e}"
+
+    @staticmethod
+    def _promote_holds(cursor, book_id):
+        """Откладывает свободные экземпляры книги для первых ожидающих в очереди.
+
+        Вызывается внутри пишущей транзакции. Следующие ожидающие берутся из
+        начала диапазона индекса idx_reservations_queue, так что стоимость
+        не зависит от длины очереди. Возвращает число готовых бронирований.
+        """
+        cursor.execute('''
+            SELECT MIN(effective_available, waiting_holds) FROM book_availability WHERE book_id = ?
+        ''', (book_id,))
+        row = cursor.fetchone()
+        count = row[0] if row else 0
+        if count <= 0:
+            return 0
+
+        expires_at = (datetime.now() + timedelta(days=HOLD_DAYS)).strftime('%Y-%m-%d')
         cursor.execute('''
-            SELECT f.*, r.name 
+            UPDATE reservations SET status = 'ready', expires_at = ?
+            WHERE reservation_id IN (
+                SELECT reservation_id FROM reservations
+                WHERE book_id = ? AND status = 'active'
+                ORDER BY reservation_id
+                LIMIT ?
+            )
+        ''', (expires_at, book_id, count))
+        return cursor.rowcount
+
+class FineDAO:
+    @staticmethod
+    def get_all_fines(as_rows=False):
+        return list(FineDAO.iter_fines(as_rows))
+
+    @staticmethod
+    def iter_fines(as_rows=False):
+        yield from _stream_rows(f'''
+            SELECT {FINE_LIST.columns}
             FROM fines f 
             JOIN readers r ON f.reader_id = r.reader_id
-        ''')
-        fines = []
-        for row in cursor.fetchall():
-            fine = Fine(*row[:5])
-            fine.reader_name = row[5]
-            fines.append(fine)
-        conn.close()
-        return fines
+        ''', row_factory=FINE_LIST.factory(as_rows))
+
+    @staticmethod
+    def get_fines_page(after=None, before=None, limit=20):
+        """Возвращает страницу штрафов по fine_id; after/before - граничный fine_id"""
+        condition, order, bound = _id_keyset('f.fine_id', after, before)
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = FINE_LIST.factory()
+            cursor.execute(f'''
+                SELECT {FINE_LIST.columns}
+                FROM fines f
+                JOIN readers r ON f.reader_id = r.reader_id
+                WHERE {condition}
+                ORDER BY f.fine_id {order}
+                LIMIT ?
+            ''', (bound, limit) if bound is not None else (limit,))
+            fines = cursor.fetchall()
+            if before is not None:
+                fines.reverse()
+            return fines
     
     @staticmethod
     def add_fine_with_status_update(reader_id, amount, reason):
         """Добавляет штраф и автоматически блокирует читателя"""
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        with db.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            # Добавляем штраф
-            cursor.execute('''
-                INSERT INTO fines (reader_id, amount, reason, status)
-                VALUES (?, ?, ?, "unpaid")
-            ''', (reader_id, amount, reason))
+            try:
+                # Добавляем штраф
+                cursor.execute('''
+                    INSERT INTO fines (reader_id, amount, reason, status)
+                    VALUES (?, ?, ?, "unpaid")
+                ''', (reader_id, amount, reason))
             
-            # Блокируем читателя
-            cursor.execute('UPDATE readers SET status = 0 WHERE reader_id = ?', 
-                          (reader_id,))
+                # Блокируем читателя
+                cursor.execute('UPDATE readers SET status = 0 WHERE reader_id = ?', 
+                              (reader_id,))
             
-            conn.commit()
-            return True, "Штраф добавлен и читатель заблокирован"
+                conn.commit()
+                return True, "Штраф добавлен и читатель заблокирован"
             
-        except Exception as e:
-            conn.rollback()
-            return False, f"Ошибка при добавлении штрафа: {e}"
-        finally:
-            conn.close()
+            except Exception as e:
+                conn.rollback()
+                return False, f"Ошибка при добавлении штрафа: {e}"
+
+    @staticmethod
+    def accrue_overdue_fines(as_of=None, daily_rate=FINE_DAILY_RATE):
+        """Начисляет штрафы по всем выдачам, просроченным на дату as_of.
+
+        Сумма по выдаче - daily_rate за каждый день просрочки за вычетом уже
+        начисленного по ней, так что ежедневный запуск добавляет по одному
+        дню, а запуск после перерыва догоняет пропущенные дни. Повторный
+        запуск за ту же дату ничего не меняет: штраф однозначно определяется
+        парой (loan_id, accrual_date). Штрафы вставляются, а их читатели
+        блокируются двумя запросами в одной транзакции.
+        Возвращает (успех, сообщение).
+        """
+        as_of = _as_of_date(as_of)
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('SELECT COALESCE(MAX(fine_id), 0) FROM fines')
+                last_fine_id = cursor.fetchone()[0]
+
+                cursor.execute('''
+                    WITH due AS (
+                        SELECT l.loan_id, l.reader_id,
+                               ROUND(:rate * (julianday(:as_of) - julianday(l.due_date))
+                                     - COALESCE((SELECT SUM(f.amount) FROM fines f
+                                                 WHERE f.loan_id = l.loan_id), 0), 2) AS amount
+                        FROM loans l
+                        WHERE l.status = 'active' AND l.due_date < :as_of
+                    )
+                    INSERT OR IGNORE INTO fines (reader_id, amount, reason, status, loan_id, accrual_date)
+                    SELECT reader_id, amount, :reason, 'unpaid', loan_id, :as_of
+                    FROM due WHERE amount > 0
+                ''', {'rate': daily_rate, 'as_of': as_of, 'reason': OVERDUE_FINE_REASON})
+
+                # Новые штрафы получили fine_id больше прежнего максимума (AUTOINCREMENT)
+                cursor.execute('''
+                    UPDATE readers SET status = 0
+                    WHERE status != 0 AND reader_id IN (
+                        SELECT reader_id FROM fines WHERE fine_id > ?
+                    )
+                ''', (last_fine_id,))
+                blocked = cursor.rowcount
+
+                cursor.execute('SELECT COUNT(*), TOTAL(amount) FROM fines WHERE fine_id > ?', (last_fine_id,))
+                accrued, total = cursor.fetchone()
+
+                conn.commit()
+                return True, (f"Начислено штрафов на {as_of}: {accrued} на сумму {total:.2f} руб., "
+                              f"заблокировано читателей: {blocked}")
+            except Exception as e:
+                conn.rollback()
+                return False, f"Ошибка начисления штрафов: {e}"
 
     @staticmethod
     def update_fine_status(fine_id, new_status):
         """Обновляет статус штрафа"""
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        with db.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute('UPDATE fines SET status = ? WHERE fine_id = ?', 
-                          (new_status, fine_id))
-            conn.commit()
-            return True, "Статус штрафа обновлен"
+            try:
+                cursor.execute('UPDATE fines SET status = ? WHERE fine_id = ?', 
+                              (new_status, fine_id))
+                conn.commit()
+                return True, "Статус штрафа обновлен"
             
-        except Exception as e:
-            conn.rollback()
-            return False, f"Ошибка при обновлении штрафа: {e}"
-        finally:
-            conn.close()
+            except Exception as e:
+                conn.rollback()
+                return False, f"Ошибка при обновлении штрафа: {e}"
 
     @staticmethod
     def get_reader_unpaid_fines_count(reader_id):
         """Возвращает количество неоплаченных штрафов читателя"""
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('SELECT COUNT(*) FROM fines WHERE reader_id = ? AND status = "unpaid"', 
-                      (reader_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
+            cursor.execute('SELECT COUNT(*) FROM fines WHERE reader_id = ? AND status = "unpaid"', 
+                          (reader_id,))
+            count = cursor.fetchone()[0]
         
-        return count
\ No newline at end of file
+            return count
+
+class StatsDAO:
+    """Счетчики library_stats, которые триггеры держат в актуальном состоянии"""
+
+    @staticmethod
+    def get_summary():
+        """Возвращает итоговые счетчики библиотеки: {metric: value}"""
+        summary = {metric: 0 for _, counters in STATS_COUNTERS.values() for metric, _, _ in counters}
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT metric, value FROM library_stats WHERE genre = ?', (STATS_ALL,))
+            summary.update(cursor.fetchall())
+            return summary
+
+    @staticmethod
+    def get_genre_breakdown():
+        """Возвращает [(жанр, названий, экземпляров, доступно)] по алфавиту жанров"""
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT genre,
+                       SUM(CASE WHEN metric = 'book_titles' THEN value ELSE 0 END),
+                       SUM(CASE WHEN metric = 'total_copies' THEN value ELSE 0 END),
+                       SUM(CASE WHEN metric = 'available_copies' THEN value ELSE 0 END)
+                FROM library_stats
+                WHERE metric IN ('book_titles', 'total_copies', 'available_copies') AND genre != ?
+                GROUP BY genre
+                HAVING SUM(CASE WHEN metric = 'book_titles' THEN value ELSE 0 END) > 0
+                ORDER BY genre
+            ''', (STATS_ALL,))
+            return cursor.fetchall()
+
+    @staticmethod
+    def rebuild():
+        """Пересчитывает счетчики с нуля по текущим данным"""
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                rebuild_library_stats(cursor)
+                conn.commit()
+                return True, "Статистика пересчитана"
+            except Exception as e:
+                conn.rollback()
+                return False, f"Ошибка пересчета статистики: {e}"
+
+class ChangeLogDAO:
+    """Журнал изменений таблиц и отметки выгрузки для инкрементального экспорта"""
+
+    @staticmethod
+    def get_last_change_id():
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(change_id), 0) FROM change_log')
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def get_watermark(name):
+        """Возвращает номер последнего выгруженного изменения или None, если выгрузок не было"""
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT last_change_id FROM export_state WHERE name = ?', (name,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    @staticmethod
+    def set_watermark(name, change_id):
+        """Сохраняет отметку выгрузки и удаляет из журнала уже выгруженные изменения"""
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            exported_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute('''
+                INSERT INTO export_state (name, last_change_id, exported_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    last_change_id = excluded.last_change_id,
+                    exported_at = excluded.exported_at
+            ''', (name, change_id, exported_at))
+            cursor.execute('''
+                DELETE FROM change_log
+                WHERE change_id <= (SELECT MIN(last_change_id) FROM export_state)
+            ''')
+            conn.commit()
+
+    @staticmethod
+    def iter_net_changes(after_id, upto_id):
+        """Выдает итоговое изменение каждой строки за интервал журнала.
+
+        Возвращает кортежи (таблица, id, операция), где операция - 'insert',
+        'update' или 'delete'. Строка, созданная и удаленная внутри интервала,
+        не выдается вовсе.
+        """
+        rows = _stream_rows('''
+            SELECT table_name, row_id, operation FROM change_log
+            WHERE change_id > ? AND change_id <= ?
+            ORDER BY table_name, row_id, change_id
+        ''', (after_id, upto_id))
+
+        current = None
+        first_op = last_op = None
+        with closing(rows):
+            for table, row_id, operation in rows:
+                if (table, row_id) != current:
+                    if current is not None:
+                        change = ChangeLogDAO._net_operation(first_op, last_op)
+                        if change:
+                            yield (*current, change)
+                    current = (table, row_id)
+                    first_op = operation
+                last_op = operation
+        if current is not None:
+            change = ChangeLogDAO._net_operation(first_op, last_op)
+            if change:
+                yield (*current, change)
+
+    @staticmethod
+    def _net_operation(first_op, last_op):
+        if last_op == 'delete':
+            return None if first_op == 'insert' else 'delete'
+        return 'insert' if first_op == 'insert' else 'update'
+
+    @staticmethod
+    def get_rows(table, row_ids):
+        """Возвращает текущие строки таблицы по списку id в виде словарей"""
+        key = TRACKED_TABLES[table]
+        with db.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            placeholders = ', '.join('?' for _ in row_ids)
+            cursor.execute(f'SELECT * FROM {table} WHERE {key} IN ({placeholders})', list(row_ids))
+            columns = [column[0] for column in cursor.description]
+            records = (dict(zip(columns, row)) for row in cursor.fetchall())
+            return {record[key]: record for record in records}
@@ -1,104 +1,253 @@
 import sqlite3
 import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
 from datetime import datetime, timedelta
+from migrations import apply_migrations, backfill_isbn_norm, promote_waiting_holds
+import query_stats
+
+class PoolExhaustedError(Exception):
+    """Все соединения пула заняты дольше допустимого времени ожидания"""
+
+class ConnectionPool:
+    """Ограниченный пул переиспользуемых соединений SQLite"""
+
+    def __init__(self, connect, max_size=5, timeout=10.0):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        # Простаивающие соединения; последнее возвращенное выдается первым
+        self._idle = []
+        # Оповещается, когда соединение вернулось в пул или освободилось место под новое
+        self._available = threading.Condition()
+        self._opened = 0
+
+    def acquire(self):
+        """Выдает свободное соединение или открывает новое, если лимит не достигнут"""
+        conn = self._open_or_wait()
+
+        # Проверяем, что соединение живое, иначе заменяем его новым
+        if not self._is_healthy(conn):
+            self._discard(conn)
+            conn = self._open_or_wait()
+        return conn
+
+    def release(self, conn):
+        """Возвращает соединение в пул, откатывая незавершенную транзакцию"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._available:
+            self._idle.append(conn)
+            self._available.notify()
+
+    def close_all(self):
+        """Закрывает все простаивающие соединения"""
+        with self._available:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def _open_or_wait(self):
+        # Ждущий поток просыпается и от возврата соединения, и от освобождения
+        # места (_discard), поэтому условия перепроверяются на каждом пробуждении
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._opened < self.max_size:
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhaustedError(
+                        f"Нет свободных соединений с базой (лимит: {self.max_size})"
+                    )
+                self._available.wait(remaining)
+        try:
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._available:
+            self._opened -= 1
+            self._available.notify()
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+class ConnectionProfile:
+    """Настройки SQLite (PRAGMA), применяемые к каждому новому соединению.
+
+    journal_mode хранится в самом файле базы, поэтому его устанавливают только
+    пишущие соединения; соединения только для чтения получают остальные настройки.
+    """
+
+    def __init__(self, journal_mode='wal', synchronous='normal', busy_timeout=5000,
+                 cache_size=-16000, mmap_size=256 * 1024 * 1024, temp_store='memory'):
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout      # мс ожидания занятой блокировки
+        self.cache_size = cache_size          # отрицательное значение - в КиБ
+        self.mmap_size = mmap_size            # байт файла, читаемых через mmap
+        self.temp_store = temp_store
+
+    def apply(self, conn, read_only=False):
+        if not read_only:
+            conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA temp_store = {self.temp_store}')
+
+# wal - профиль по умолчанию: читатели не ждут писателя, фиксация без fsync журнала
+# на каждой транзакции. default - настройки SQLite по умолчанию (журнал отката),
+# оставлен для сравнения в benchmarks.concurrent_reads
+PROFILES = {
+    'wal': ConnectionProfile(),
+    'default': ConnectionProfile(journal_mode='delete', synchronous='full', cache_size=-2000,
+                                 mmap_size=0, temp_store='default'),
+}
+
+def profile_from_env():
+    """Профиль из LIBRARY_DB_PROFILE; отдельные настройки переопределяются
+    переменными LIBRARY_DB_BUSY_TIMEOUT, LIBRARY_DB_CACHE_SIZE и LIBRARY_DB_MMAP_SIZE"""
+    name = os.environ.get('LIBRARY_DB_PROFILE', 'wal')
+    if name not in PROFILES:
+        raise ValueError(f"Неизвестный профиль соединения: {name}")
+    base = PROFILES[name]
+    return ConnectionProfile(
+        journal_mode=base.journal_mode,
+        synchronous=base.synchronous,
+        busy_timeout=int(os.environ.get('LIBRARY_DB_BUSY_TIMEOUT', base.busy_timeout)),
+        cache_size=int(os.environ.get('LIBRARY_DB_CACHE_SIZE', base.cache_size)),
+        mmap_size=int(os.environ.get('LIBRARY_DB_MMAP_SIZE', base.mmap_size)),
+        temp_store=base.temp_store,
+    )
 
 class Database:
-    def __init__(self, db_name='library.db'):
+    def __init__(self, db_name='library.db', pool_size=5, profile=None):
         self.db_name = db_name
-        # Удаляем старую базу если она есть
-        if os.path.exists(db_name):
-            os.remove(db_name)
-        self.create_tables()
-        self.add_sample_data()
+        self.read_only = False
+        self.profile = profile or profile_from_env()
+        self.pool = ConnectionPool(self._open_connection, max_size=pool_size)
+        # Запросы только для чтения идут через отдельный пул соединений mode=ro
+        self.read_pool = ConnectionPool(lambda: self._open_connection(read_only=True), max_size=pool_size)
+        # Необязательный обработчик, получающий текст каждого выполняемого запроса
+        self.trace_callback = None
+        # Соединение, закрепленное за потоком на время снимка (см. snapshot)
+        self._local = threading.local()
+        # Существующая база открывается как есть, применяются только новые миграции
+        self.migrate()
     
-    def get_connection(self):
-        return sqlite3.connect(self.db_name)   
+    def _open_connection(self, read_only=False):
+        # Соединение переходит между потоками через пул, поэтому проверку потока отключаем
+        read_only = read_only or self.read_only
+        timeout = self.profile.busy_timeout / 1000
+        # При выключенной статистике запросов это обычный sqlite3.Connection
+        factory = query_stats.connection_factory()
+        if read_only:
+            uri = Path(self.db_name).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, timeout=timeout, check_same_thread=False, factory=factory)
+        else:
+            conn = sqlite3.connect(self.db_name, timeout=timeout, check_same_thread=False, factory=factory)
+        self.profile.apply(conn, read_only=read_only)
+        return conn
+
+    def reopen(self, read_only=False):
+        """Закрывает соединения пулов; новые будут открыты в указанном режиме"""
+        self.pool.close_all()
+        self.read_pool.close_all()
+        self.read_only = read_only
+
+    def get_connection(self, read_only=False):
+        """Открывает отдельное соединение вне пула (для служебных скриптов)"""
+        return self._open_connection(read_only=read_only)
+
+    @contextmanager
+    def connection(self, read_only=False):
+        """Берет соединение из пула и возвращает его обратно после использования.
+
+        read_only=True берет соединение mode=ro из пула для чтения: в режиме WAL
+        такие запросы не ждут пишущих транзакций и не могут изменить базу.
+        """
+        pinned = getattr(self._local, 'conn', None)
+        if pinned is not None:
+            yield pinned
+            return
+
+        pool = self.read_pool if read_only else self.pool
+        conn = pool.acquire()
+        traced = self.trace_callback is not None
+        if traced:
+            conn.set_trace_callback(self.trace_callback)
+        try:
+            yield conn
+        finally:
+            if traced:
+                conn.set_trace_callback(None)
+            pool.release(conn)
     
-    def create_tables(self):
+    @contextmanager
+    def pinned(self, conn):
+        """Направляет все запросы DAO в текущем потоке на соединение conn.
+
+        Используется потоками, которые держат собственное соединение вне пула
+        (см. async_access); по выходе восстанавливается прежнее закрепление.
+        """
+        previous = getattr(self._local, 'conn', None)
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = previous
+
+    @contextmanager
+    def snapshot(self):
+        """Закрепляет за потоком одно соединение с открытой читающей транзакцией.
+
+        Все запросы DAO внутри блока видят одно согласованное состояние базы,
+        даже если другие процессы в это время ее изменяют.
+        """
+        with self.connection(read_only=True) as conn:
+            conn.execute('BEGIN')
+            # Снимок фиксируется первым чтением, а не самим BEGIN
+            conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            try:
+                with self.pinned(conn):
+                    yield conn
+            finally:
+                conn.rollback()
+
+    def migrate(self):
+        """Доводит схему базы до актуальной версии"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Таблица книг
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS books (
-                book_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                isbn TEXT UNIQUE,
-                year INTEGER,
-                publisher TEXT,
-                genre TEXT,
-                description TEXT,
-                total_copies INTEGER DEFAULT 1,
-                available_copies INTEGER DEFAULT 1
-            )
-        ''')
-        
-        # Таблица библиотекарей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS librarians (
-                librarian_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL
-            )
-        ''')
-
-        # Таблица читателей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS readers (
-                reader_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                card_number TEXT UNIQUE NOT NULL,
-                contact TEXT,
-                password TEXT NOT NULL,
-                status BOOLEAN DEFAULT 1
-            )
-        ''')
-        
-        # Таблица выдачи книг
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS loans (
-                loan_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER NOT NULL,
-                reader_id INTEGER NOT NULL,
-                issue_date TEXT NOT NULL,
-                due_date TEXT NOT NULL,
-                return_date TEXT,
-                status TEXT DEFAULT 'active',
-                FOREIGN KEY (book_id) REFERENCES books (book_id),
-                FOREIGN KEY (reader_id) REFERENCES readers (reader_id)
-            )
-        ''')
-        
-        # Таблица бронирований
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reservations (
-                reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER NOT NULL,
-                reader_id INTEGER NOT NULL,
-                reservation_date TEXT NOT NULL,
-                status TEXT DEFAULT 'active',
-                FOREIGN KEY (book_id) REFERENCES books (book_id),
-                FOREIGN KEY (reader_id) REFERENCES readers (reader_id)
-            )
-        ''')
-        
-        # Таблица штрафов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fines (
-                fine_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                reader_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                reason TEXT,
-                status TEXT DEFAULT 'unpaid',
-                FOREIGN KEY (reader_id) REFERENCES readers (reader_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
+        try:
+            return apply_migrations(conn)
+        finally:
+            conn.close()
+
     def add_sample_data(self):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -144,6 +293,7 @@ class Database:
             ('Отцы и дети', 'И.С. Тургенев', '978-5-389-00005-9', 1862, 'Эксмо', 'Роман',
              'Роман о конфликте поколений', 3, 3)
         ])
+        backfill_isbn_norm(cursor)
 
         # Добавляем выдачи книг
         cursor.executemany('''
@@ -162,6 +312,7 @@ class Database:
             (3, 1, '2025-11-15', 'active'),
             (4, 2, '2025-11-16', 'active')
         ])
+        promote_waiting_holds(cursor)
 
         # Добавляем штрафы
         cursor.executemany('''
@@ -177,4 +328,5 @@ class Database:
         print("Тестовые данные добавлены в базу данных")
 
 # Создаем глобальный объект базы данных
-db = Database()
+# Путь к файлу можно переопределить переменной окружения (например, для проверок на копии базы)
+db = Database(os.environ.get('LIBRARY_DB', 'library.db'))
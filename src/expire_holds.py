@@ -0,0 +1,33 @@
+# expire_holds.py
+"""Снятие просроченных бронирований.
+
+Отложенные экземпляры, которые читатели не забрали до срока, передаются
+следующим в очереди. Запускается по расписанию (например, раз в сутки):
+    python expire_holds.py
+    python expire_holds.py --as-of 2026-01-31
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from data_access import ReservationDAO
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Снятие просроченных бронирований")
+    parser.add_argument('--as-of', default=datetime.now().strftime('%Y-%m-%d'),
+                        help="дата проверки в формате ГГГГ-ММ-ДД (по умолчанию: сегодня)")
+    args = parser.parse_args(argv)
+    try:
+        datetime.strptime(args.as_of, '%Y-%m-%d')
+    except ValueError:
+        parser.error(f"неверная дата: {args.as_of}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    success, message = ReservationDAO.expire_holds(args.as_of)
+    print(message)
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
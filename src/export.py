@@ -1,23 +1,37 @@
 # lab5_export.py
 import json
 import csv
-import xml.etree.ElementTree as ET
+from xml.sax.saxutils import XMLGenerator
+from xml.sax.xmlreader import AttributesImpl
 import yaml
 import os
 import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
 from datetime import datetime
 
 # Добавляем путь к модулям для надежности
 sys.path.append(os.path.dirname(__file__))
 
-from data_access import BookDAO, ReaderDAO, LoanDAO, ReservationDAO, FineDAO
+from database import db
+from data_access import BookDAO, ReaderDAO, LoanDAO, ReservationDAO, FineDAO, ChangeLogDAO, STREAM_BATCH_SIZE
 
-def create_output_folder():
-    """Создает папку out в корне проекта"""
+# Имя отметки в export_state, до которой изменения уже выгружены
+EXPORT_WATERMARK = 'export'
+
+def get_output_folder():
+    """Возвращает путь к папке out в корне проекта"""
     # Поднимаемся на уровень выше из папки src
     script_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(script_dir)  # Поднимаемся из src в корень
-    out_dir = os.path.join(project_root, 'out')
+    return os.path.join(project_root, 'out')
+
+def create_output_folder():
+    """Создает папку out в корне проекта"""
+    out_dir = get_output_folder()
     
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
@@ -35,56 +49,97 @@ def create_output_folder():
     
     return out_dir
 
-def get_all_library_data():
-    """Собирает все данные из библиотеки"""
-    print("Сбор данных из базы...")
+# Разделы экспорта: имя раздела, имя элемента в XML и поток записей из DAO
+EXPORT_SECTIONS = [
+    ('books', 'book', lambda: BookDAO.iter_books(limit=STREAM_BATCH_SIZE, full=True)),
+    ('readers', 'reader', lambda: ReaderDAO.iter_readers(as_rows=True, full=True)),
+    ('loans', 'loan', lambda: LoanDAO.iter_active_loans(as_rows=True)),
+    ('reservations', 'reservation', lambda: ReservationDAO.iter_reservations(as_rows=True)),
+    ('fines', 'fine', lambda: FineDAO.iter_fines(as_rows=True)),
+]
+
+def iter_section(name):
+    """Построчно выдает записи раздела в виде словарей, читая их прямо из курсора"""
+    for section, _, stream in EXPORT_SECTIONS:
+        if section == name:
+            # closing возвращает соединение в пул, даже если обход прерван
+            with closing(stream()) as records:
+                for record in records:
+                    yield record.to_dict()
+            return
+    raise KeyError(name)
+
+def count_library_records():
+    """Считает записи каждого раздела запросами COUNT, не загружая сами строки"""
+    with db.connection(read_only=True) as conn:
+        cursor = conn.cursor()
+        counts = {}
+        for section, sql in [
+            ('books', 'SELECT COUNT(*) FROM books'),
+            ('readers', 'SELECT COUNT(*) FROM readers'),
+            ('loans', "SELECT COUNT(*) FROM loans WHERE status = 'active'"),
+            ('reservations', 'SELECT COUNT(*) FROM reservations'),
+            ('fines', 'SELECT COUNT(*) FROM fines'),
+        ]:
+            cursor.execute(sql)
+            counts[section] = cursor.fetchone()[0]
+        return counts
+
+def get_library_info():
+    """Собирает сводную информацию о библиотеке для заголовка экспорта"""
+    print("Подсчет данных в базе...")
     
     try:
-        books = BookDAO.get_all_books()
-        readers = ReaderDAO.get_all_readers()
-        loans = LoanDAO.get_active_loans()
-        reservations = ReservationDAO.get_all_reservations()
-        fines = FineDAO.get_all_fines()
-        
-        # Подготавливаем данные для экспорта
-        data = {
-            'library_info': {
-                'name': 'Библиотечная система',
-                'export_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'total_records': len(books) + len(readers) + len(loans) + len(reservations) + len(fines)
-            },
-            'books': [book.__dict__ for book in books],
-            'readers': [reader.__dict__ for reader in readers],
-            'loans': [loan.__dict__ for loan in loans],
-            'reservations': [reservation.__dict__ for reservation in reservations],
-            'fines': [fine.__dict__ for fine in fines]
-        }
+        counts = count_library_records()
         
         print(f"Собрано данных:")
-        print(f"  Книги: {len(books)}")
-        print(f"  Читатели: {len(readers)}")
-        print(f"  Активные выдачи: {len(loans)}")
-        print(f"  Бронирования: {len(reservations)}")
-        print(f"  Штрафы: {len(fines)}")
+        print(f"  Книги: {counts['books']}")
+        print(f"  Читатели: {counts['readers']}")
+        print(f"  Активные выдачи: {counts['loans']}")
+        print(f"  Бронирования: {counts['reservations']}")
+        print(f"  Штрафы: {counts['fines']}")
         
-        return data
+        return {
+            'name': 'Библиотечная система',
+            'export_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'total_records': sum(counts.values())
+        }
         
     except Exception as e:
         print(f"Ошибка при сборе данных: {e}")
         return {}
 
-def save_to_json(data, filename):
-    """Сохраняет данные в формате JSON"""
+def _indent(text, prefix):
+    return '\n'.join(prefix + line for line in text.split('\n'))
+
+def _write_json_array(f, section, prefix):
+    """Пишет раздел JSON-массивом, элементы с отступом prefix + два пробела"""
+    f.write('[')
+    empty = True
+    for row in iter_section(section):
+        f.write('\n' if empty else ',\n')
+        f.write(_indent(json.dumps(row, ensure_ascii=False, indent=2), prefix + '  '))
+        empty = False
+    f.write(']' if empty else '\n' + prefix + ']')
+
+def save_to_json(info, filename):
+    """Сохраняет данные в формате JSON, записывая их по одной записи"""
     try:
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            # Формат совпадает с json.dump(..., indent=2) для всего документа
+            f.write('{\n  "library_info": ')
+            f.write(_indent(json.dumps(info, ensure_ascii=False, indent=2), '  ').lstrip())
+            for section, _, _ in EXPORT_SECTIONS:
+                f.write(f',\n  "{section}": ')
+                _write_json_array(f, section, '  ')
+            f.write('\n}')
         print(f"JSON создан: {filename}")
         return True
     except Exception as e:
         print(f"Ошибка при сохранении JSON: {e}")
         return False
 
-def save_to_csv(data, filename):
+def save_to_csv(info, filename):
     """Сохраняет данные в формате CSV"""
     try:
         with open(filename, 'w', newline='', encoding='utf-8') as f:
@@ -92,7 +147,7 @@ def save_to_csv(data, filename):
             writer.writerow(['Тип', 'ID', 'Название/Имя', 'Автор/Контакты', 'Год', 'Доступно', 'Статус'])
             
             # Книги
-            for book in data.get('books', []):
+            for book in iter_section('books'):
                 writer.writerow([
                     'Книга', 
                     book.get('book_id', ''), 
@@ -104,7 +159,7 @@ def save_to_csv(data, filename):
                 ])
             
             # Читатели
-            for reader in data.get('readers', []):
+            for reader in iter_section('readers'):
                 status = 'Активен' if reader.get('status') else 'Заблокирован'
                 writer.writerow([
                     'Читатель',
@@ -122,41 +177,39 @@ def save_to_csv(data, filename):
         print(f"Ошибка при сохранении CSV: {e}")
         return False
 
-def save_to_xml(data, filename):
-    """Сохраняет данные в формате XML"""
+def _write_xml_element(xml, name, text):
+    xml.startElement(name, AttributesImpl({}))
+    xml.characters(text)
+    xml.endElement(name)
+
+def save_to_xml(info, filename):
+    """Сохраняет данные в формате XML потоково, без построения дерева в памяти"""
     try:
-        root = ET.Element('library')
-        
-        # Добавляем информацию о библиотеке
-        info_elem = ET.SubElement(root, 'info')
-        ET.SubElement(info_elem, 'name').text = data.get('library_info', {}).get('name', 'Библиотека')
-        ET.SubElement(info_elem, 'export_date').text = data.get('library_info', {}).get('export_date', '')
-        ET.SubElement(info_elem, 'total_records').text = str(data.get('library_info', {}).get('total_records', 0))
-        
-        # Книги
-        books_elem = ET.SubElement(root, 'books')
-        for book in data.get('books', []):
-            book_elem = ET.SubElement(books_elem, 'book')
-            for key, value in book.items():
-                if value is not None:
-                    elem = ET.SubElement(book_elem, key)
-                    elem.text = str(value)
-        
-        # Читатели
-        readers_elem = ET.SubElement(root, 'readers')
-        for reader in data.get('readers', []):
-            reader_elem = ET.SubElement(readers_elem, 'reader')
-            for key, value in reader.items():
-                if value is not None:
-                    elem = ET.SubElement(reader_elem, key)
-                    elem.text = str(value)
-        
-        tree = ET.ElementTree(root)
-        
-        # Сохраняем с правильным форматированием
         with open(filename, 'wb') as f:
             f.write('<?xml version="1.0" encoding="UTF-8"?>\n'.encode('utf-8'))
-            tree.write(f, encoding='utf-8', xml_declaration=False)
+            xml = XMLGenerator(f, encoding='utf-8', short_empty_elements=True)
+            xml.startElement('library', AttributesImpl({}))
+            
+            # Добавляем информацию о библиотеке
+            xml.startElement('info', AttributesImpl({}))
+            _write_xml_element(xml, 'name', info.get('name', 'Библиотека'))
+            _write_xml_element(xml, 'export_date', info.get('export_date', ''))
+            _write_xml_element(xml, 'total_records', str(info.get('total_records', 0)))
+            xml.endElement('info')
+            
+            # Книги и читатели
+            for section, item_name in [('books', 'book'), ('readers', 'reader')]:
+                xml.startElement(section, AttributesImpl({}))
+                for row in iter_section(section):
+                    xml.startElement(item_name, AttributesImpl({}))
+                    for key, value in row.items():
+                        if value is not None:
+                            _write_xml_element(xml, key, str(value))
+                    xml.endElement(item_name)
+                xml.endElement(section)
+            
+            xml.endElement('library')
+            xml.endDocument()
             
         print(f"XML создан: {filename}")
         return True
@@ -164,22 +217,37 @@ def save_to_xml(data, filename):
         print(f"Ошибка при сохранении XML: {e}")
         return False
 
-def save_to_yaml(data, filename):
-    """Сохраняет данные в формате YAML"""
+def _clean_for_yaml(obj):
+    # Очищаем данные от None значений для YAML
+    return {k: v for k, v in obj.items() if v is not None}
+
+def _yaml_dump(obj):
+    return yaml.dump(obj, allow_unicode=True, default_flow_style=False)
+
+def _write_yaml_list(f, section):
+    """Пишет записи раздела элементами YAML-списка, начиная с новой строки"""
+    empty = True
+    for row in iter_section(section):
+        if empty:
+            f.write('\n')
+            empty = False
+        f.write(_yaml_dump([_clean_for_yaml(row)]))
+    if empty:
+        f.write(' []\n')
+
+def save_to_yaml(info, filename):
+    """Сохраняет данные в формате YAML, выводя записи по одной"""
     try:
-        # Очищаем данные от None значений для YAML
-        def clean_for_yaml(obj):
-            if isinstance(obj, dict):
-                return {k: clean_for_yaml(v) for k, v in obj.items() if v is not None}
-            elif isinstance(obj, list):
-                return [clean_for_yaml(item) for item in obj]
-            else:
-                return obj
-        
-        cleaned_data = clean_for_yaml(data)
-        
         with open(filename, 'w', encoding='utf-8') as f:
-            yaml.dump(cleaned_data, f, allow_unicode=True, default_flow_style=False)
+            # Разделы идут в алфавитном порядке, как при yaml.dump всего документа
+            sections = sorted([section for section, _, _ in EXPORT_SECTIONS] + ['library_info'])
+            for section in sections:
+                if section == 'library_info':
+                    f.write(_yaml_dump({'library_info': _clean_for_yaml(info)}))
+                    continue
+                
+                f.write(f'{section}:')
+                _write_yaml_list(f, section)
         
         print(f"YAML создан: {filename}")
         return True
@@ -188,48 +256,219 @@ def save_to_yaml(data, filename):
         print(f"Ошибка при сохранении YAML: {e}")
         return False
 
-def main():
+def save_section_to_json(section, filename):
+    """Сохраняет один раздел отдельным JSON-файлом (массив записей)"""
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            _write_json_array(f, section, '')
+        print(f"JSON создан: {filename}")
+        return True
+    except Exception as e:
+        print(f"Ошибка при сохранении JSON: {e}")
+        return False
+
+def save_section_to_yaml(section, filename):
+    """Сохраняет один раздел отдельным YAML-файлом (список записей)"""
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            _write_yaml_list(f, section)
+        print(f"YAML создан: {filename}")
+        return True
+    except Exception as e:
+        print(f"Ошибка при сохранении YAML: {e}")
+        return False
+
+# Формат -> (файл, функция записи всего документа, функция записи одного раздела)
+EXPORT_FORMATS = {
+    'json': ('data.json', save_to_json, save_section_to_json),
+    'csv': ('data.csv', save_to_csv, None),
+    'xml': ('data.xml', save_to_xml, None),
+    'yaml': ('data.yaml', save_to_yaml, save_section_to_yaml),
+}
+
+def build_export_tasks(formats, split_tables):
+    """Составляет список задач (формат, раздел или None)"""
+    tasks = []
+    for fmt in formats:
+        if split_tables and EXPORT_FORMATS[fmt][2] is not None:
+            tasks.extend((fmt, section) for section, _, _ in EXPORT_SECTIONS)
+        else:
+            tasks.append((fmt, None))
+    return tasks
+
+def run_export_task(fmt, section, out_dir, info):
+    """Выполняет одну задачу экспорта на согласованном снимке базы"""
+    filename, save_document, save_section = EXPORT_FORMATS[fmt]
+    started = time.perf_counter()
+    with db.snapshot():
+        if section is None:
+            label = fmt.upper()
+            ok = save_document(info, os.path.join(out_dir, filename))
+        else:
+            label = f"{fmt.upper()}:{section}"
+            name, ext = os.path.splitext(filename)
+            ok = save_section(section, os.path.join(out_dir, f"{name}.{section}{ext}"))
+    return label, ok, time.perf_counter() - started
+
+def _init_export_worker():
+    # Каждый процесс читает базу через собственные соединения только для чтения
+    db.reopen(read_only=True)
+
+def run_export_tasks(tasks, out_dir, info, workers):
+    """Выполняет задачи последовательно или в пуле процессов"""
+    if workers <= 1:
+        return [run_export_task(fmt, section, out_dir, info) for fmt, section in tasks]
+
+    # spawn: дочерние процессы не наследуют открытые соединения SQLite родителя
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_export_worker) as executor:
+        futures = [executor.submit(run_export_task, fmt, section, out_dir, info)
+                   for fmt, section in tasks]
+        return [future.result() for future in futures]
+
+def export_delta(since_change_id):
+    """Выгружает только изменения после отметки since_change_id.
+
+    Для каждой таблицы создается файл <таблица>.jsonl, где каждая строка -
+    {"op": "insert"|"update"|"delete", "id": ..., "row": {...}}, и общий
+    manifest.json. После успешной выгрузки отметка сдвигается.
+    """
+    with db.snapshot():
+        upto_change_id = ChangeLogDAO.get_last_change_id()
+        if upto_change_id <= since_change_id:
+            print("Изменений с прошлой выгрузки нет")
+            return True
+
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        delta_dir = os.path.join(get_output_folder(), 'delta', f"{stamp}_{since_change_id}_{upto_change_id}")
+        os.makedirs(delta_dir, exist_ok=True)
+
+        manifest = {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'from_change_id': since_change_id,
+            'to_change_id': upto_change_id,
+            'tables': {}
+        }
+
+        files = {}
+        pending = []  # (таблица, id, операция) для вставленных и измененных строк
+
+        def write_line(table, record):
+            if table not in files:
+                files[table] = open(os.path.join(delta_dir, f"{table}.jsonl"), 'w', encoding='utf-8')
+                manifest['tables'][table] = {'file': f"{table}.jsonl", 'insert': 0, 'update': 0, 'delete': 0}
+            files[table].write(json.dumps(record, ensure_ascii=False) + '\n')
+            manifest['tables'][table][record['op']] += 1
+
+        def flush_pending():
+            if not pending:
+                return
+            table = pending[0][0]
+            rows = ChangeLogDAO.get_rows(table, [row_id for _, row_id, _ in pending])
+            for _, row_id, operation in pending:
+                write_line(table, {'op': operation, 'id': row_id, 'row': rows[row_id]})
+            pending.clear()
+
+        try:
+            # Изменения идут упорядоченными по таблице, строки дочитываются пачками
+            with closing(ChangeLogDAO.iter_net_changes(since_change_id, upto_change_id)) as changes:
+                for table, row_id, operation in changes:
+                    if pending and (pending[0][0] != table or len(pending) >= STREAM_BATCH_SIZE):
+                        flush_pending()
+                    if operation == 'delete':
+                        write_line(table, {'op': 'delete', 'id': row_id})
+                    else:
+                        pending.append((table, row_id, operation))
+            flush_pending()
+        finally:
+            for f in files.values():
+                f.close()
+
+        with open(os.path.join(delta_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    ChangeLogDAO.set_watermark(EXPORT_WATERMARK, upto_change_id)
+
+    print(f"Изменения {since_change_id + 1}-{upto_change_id} выгружены в: {delta_dir}")
+    for table, stats in manifest['tables'].items():
+        print(f"  {table}: добавлено {stats['insert']}, изменено {stats['update']}, удалено {stats['delete']}")
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Экспорт данных библиотеки в JSON, CSV, XML и YAML")
+    parser.add_argument('--formats', default=','.join(EXPORT_FORMATS),
+                        help="форматы через запятую (по умолчанию: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="число процессов экспорта; 1 - последовательный экспорт (по умолчанию)")
+    parser.add_argument('--split-tables', action='store_true',
+                        help="для JSON и YAML писать каждую таблицу отдельным файлом в отдельной задаче")
+    parser.add_argument('--since-last', action='store_true',
+                        help="выгрузить только изменения с прошлой выгрузки (файлы в out/delta)")
+    args = parser.parse_args(argv)
+
+    args.formats = [fmt.strip().lower() for fmt in args.formats.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in args.formats if fmt not in EXPORT_FORMATS]
+    if unknown:
+        parser.error(f"неизвестные форматы: {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
     """Основная функция экспорта"""
+    args = parse_args(argv)
+
     print("=" * 50)
     print("ЛАБОРАТОРНАЯ РАБОТА №5 - ЭКСПОРТ ДАННЫХ")
     print("=" * 50)
     
     # Проверяем доступность базы данных
-    if not os.path.exists('library.db'):
-        print("База данных 'library.db' не найдена!")
+    if not os.path.exists(db.db_name):
+        print(f"База данных '{db.db_name}' не найдена!")
         print("Запустите main.py сначала чтобы создать базу данных")
         return
     
+    if args.since_last:
+        watermark = ChangeLogDAO.get_watermark(EXPORT_WATERMARK)
+        if watermark is not None:
+            export_delta(watermark)
+            return
+        print("Полная выгрузка еще не выполнялась, выполняем ее")
+    
+    # Изменения до этой отметки войдут в полную выгрузку
+    upto_change_id = ChangeLogDAO.get_last_change_id()
+    
     # Создаем папку для результатов в корне проекта
     out_dir = create_output_folder()
     
-    # Получаем данные
-    library_data = get_all_library_data()
+    # Получаем сводку; сами записи читаются из базы потоково при записи файлов
+    library_info = get_library_info()
     
-    if not library_data:
+    if not library_info:
         print("Нет данных для экспорта!")
         return
     
     # Экспортируем в разные форматы
-    print("\nНачинаем экспорт данных...")
+    tasks = build_export_tasks(args.formats, args.split_tables)
+    print(f"\nНачинаем экспорт данных (задач: {len(tasks)}, процессов: {max(args.workers, 1)})...")
     
-    # Создаем файлы во всех форматах
-    results = {
-        'JSON': save_to_json(library_data, os.path.join(out_dir, 'data.json')),
-        'CSV': save_to_csv(library_data, os.path.join(out_dir, 'data.csv')),
-        'XML': save_to_xml(library_data, os.path.join(out_dir, 'data.xml')),
-        'YAML': save_to_yaml(library_data, os.path.join(out_dir, 'data.yaml'))
-    }
+    started = time.perf_counter()
+    results = run_export_tasks(tasks, out_dir, library_info, args.workers)
+    elapsed = time.perf_counter() - started
     
     # Итоги
     print("\n" + "=" * 50)
     print("ЭКСПОРТ ЗАВЕРШЕН!")
     print("=" * 50)
     
-    successful = sum(results.values())
+    successful = sum(1 for _, ok, _ in results if ok)
     total = len(results)
+    if successful == total:
+        ChangeLogDAO.set_watermark(EXPORT_WATERMARK, upto_change_id)
     
-    print(f"Результаты: {successful}/{total} форматов создано успешно")
+    print(f"Результаты: {successful}/{total} задач выполнено успешно")
+    for label, ok, seconds in results:
+        print(f"  {label}: {'OK' if ok else 'ОШИБКА'} ({seconds:.2f} с)")
+    print(f"Общее время: {elapsed:.2f} с")
     
     print("\nСозданные файлы:")
     print("-" * 40)
@@ -244,4 +483,4 @@ def main():
     print("=" * 50)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
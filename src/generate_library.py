@@ -0,0 +1,361 @@
+# generate_library.py
+"""Генератор больших синтетических баз библиотеки.
+
+Строит новую базу по схеме migrations.py заданного размера из зерна
+генератора: одинаковые параметры, зерно и дата --as-of всегда дают одну и
+ту же базу. Данные похожи на настоящие:
+- популярность книг и активность читателей распределены по Ципфу;
+- выдачи идут по датам за несколько лет, часть возвращена с опозданием,
+  часть не возвращена вовсе;
+- available_copies равно числу экземпляров без активных выдач;
+- за поздний возврат и текущую просрочку начислены штрафы, читатели
+  с неоплаченными штрафами заблокированы;
+- ожидающие бронирования стоят только на книги без свободных экземпляров.
+
+Строки вставляются пакетами, каждая пачка - отдельная транзакция.
+Индексы и триггеры на время загрузки снимаются и создаются заново в конце,
+поэтому журнал изменений change_log новой базы пуст, а счетчики статистики,
+очередь бронирований и полнотекстовый индекс пересчитываются целиком:
+    cd src
+    python generate_library.py /tmp/library_10m.db --loans 10000000 --seed 1
+"""
+import argparse
+import io
+import os
+import random
+import sqlite3
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from itertools import accumulate
+
+from isbn import isbn13_check_digit, normalize_isbn
+from migrations import apply_migrations, rebuild_book_holds, rebuild_library_stats
+
+DEFAULT_SEED = 1
+BATCH_SIZE = 100_000
+# Срок выдачи и ставка штрафа за день просрочки - как в data_access
+LOAN_DAYS = 30
+FINE_DAILY_RATE = float(os.environ.get('LIBRARY_FINE_DAILY_RATE', '10'))
+OVERDUE_FINE_REASON = 'Просрочка возврата книги'
+# Опоздание при позднем возврате: от 1 до MAX_LATE_DAYS дней после срока
+MAX_LATE_DAYS = 90
+# Доля неоплаченных штрафов за уже возвращенные книги
+UNPAID_RETURNED_SHARE = 0.02
+
+# Доли строк относительно числа выдач по умолчанию
+BOOKS_PER_LOAN = 0.05
+READERS_PER_LOAN = 0.02
+RESERVATIONS_PER_LOAN = 0.1
+# Ожидающие бронирования - доля от всех бронирований
+WAITING_SHARE = 0.02
+RESERVATION_OUTCOMES = ['fulfilled', 'cancelled', 'expired']
+RESERVATION_OUTCOME_WEIGHTS = [0.6, 0.25, 0.15]
+
+ADJECTIVES = ['Тихий', 'Белый', 'Последний', 'Северный', 'Далекий', 'Старый', 'Ясный', 'Новый',
+              'Темный', 'Зимний', 'Лесной', 'Морской', 'Речной', 'Горный', 'Весенний', 'Вечный',
+              'Золотой', 'Синий', 'Верный', 'Тайный', 'Чужой', 'Первый', 'Долгий', 'Осенний',
+              'Забытый', 'Красный', 'Пустой', 'Ночной', 'Южный', 'Летний']
+NOUNS = ['дом', 'сад', 'берег', 'путь', 'город', 'ветер', 'остров', 'мост', 'дождь', 'лес',
+         'порт', 'замок', 'мир', 'час', 'свет', 'край', 'след', 'голос', 'огонь', 'перевал',
+         'поезд', 'маяк', 'снег', 'день', 'сон', 'океан', 'полдень', 'рассказ', 'пруд', 'двор']
+PLACES = ['над рекой', 'у моря', 'в тумане', 'на рассвете', 'под снегом', 'за холмом',
+          'в старом городе', 'на краю света', 'без названия', 'у дороги']
+MALE_NAMES = ['Иван', 'Петр', 'Алексей', 'Сергей', 'Дмитрий', 'Андрей', 'Михаил', 'Николай',
+              'Владимир', 'Павел', 'Юрий', 'Константин']
+FEMALE_NAMES = ['Мария', 'Анна', 'Ольга', 'Наталья', 'Елена', 'Татьяна', 'Ирина', 'Светлана',
+                'Екатерина', 'Вера', 'Людмила', 'Ксения']
+PATRONYMIC_INITIALS = 'АБВГДЕИКЛМНОПРСФЮ'
+# Фамилии в мужской форме; женская получается окончанием «а»
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+            'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов',
+            'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров',
+            'Никитин', 'Захаров', 'Зайцев', 'Соловьев', 'Борисов', 'Яковлев']
+GENRES = ['Роман', 'Фантастика', 'Поэзия', 'Детектив', 'История', 'Наука', 'Детская литература',
+          'Приключения', 'Биография', 'Драма']
+GENRE_WEIGHTS = [30, 15, 5, 15, 8, 7, 10, 5, 3, 2]
+PUBLISHERS = ['АСТ', 'Эксмо', 'Азбука', 'Просвещение', 'Наука', 'Росмэн', 'Махаон', 'Речь']
+
+def _zipf_cum_weights(count, exponent):
+    """Накопленные веса распределения Ципфа: элемент ранга k весит 1 / (k + 1) ** exponent"""
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+def _person(rng):
+    if rng.random() < 0.5:
+        return rng.choice(MALE_NAMES), rng.choice(SURNAMES)
+    return rng.choice(FEMALE_NAMES), rng.choice(SURNAMES) + 'а'
+
+def _title(rng):
+    template = rng.random()
+    if template < 0.45:
+        return f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+    if template < 0.7:
+        return f'{rng.choice(NOUNS).capitalize()} и {rng.choice(NOUNS)}'
+    if template < 0.9:
+        return f'{rng.choice(NOUNS).capitalize()} {rng.choice(PLACES)}'
+    return f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}. Книга {rng.randint(1, 5)}'
+
+def _isbn(number):
+    digits = f'9785{number:08d}'
+    return f'978-5-{digits[4:8]}-{digits[8:]}-{isbn13_check_digit(digits)}'
+
+def _suspend_schema_objects(conn):
+    """Удаляет индексы и триггеры, возвращая их определения для восстановления"""
+    objects = conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+        ORDER BY type = 'trigger', name
+    ''').fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    return objects
+
+def _restore_schema_objects(conn, objects):
+    # Сначала индексы, затем триггеры: пересчет ниже идет уже по индексам
+    for _, _, sql in objects:
+        conn.execute(sql)
+
+class _BatchWriter:
+    """Копит строки и вставляет их пачками по BATCH_SIZE, по транзакции на пачку"""
+
+    def __init__(self, conn, sql):
+        self.conn = conn
+        self.sql = sql
+        self.rows = []
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            with self.conn:
+                self.conn.executemany(self.sql, self.rows)
+            self.count += len(self.rows)
+            self.rows.clear()
+
+def generate_library(path, loans, seed=DEFAULT_SEED, books=None, readers=None, reservations=None,
+                     years=3, late_rate=0.1, lost_rate=0.001, zipf=1.0, as_of=None, log=print):
+    """Создает в path новую базу с loans выдачами; возвращает число строк по таблицам.
+
+    books, readers и reservations по умолчанию растут пропорционально числу
+    выдач. late_rate - доля выдач, возвращенных после срока, lost_rate - доля
+    не возвращенных вовсе, zipf - показатель распределения популярности книг.
+    """
+    rng = random.Random(seed)
+    as_of = as_of or date.today()
+    book_count = books or max(int(loans * BOOKS_PER_LOAN), 50)
+    reader_count = readers or max(int(loans * READERS_PER_LOAN), 20)
+    reservation_count = reservations if reservations is not None else int(loans * RESERVATIONS_PER_LOAN)
+    span = years * 365
+    start = as_of - timedelta(days=span)
+    # Даты считаются номерами дней от start; строки дат готовятся один раз,
+    # с запасом на сроки возврата выдач последнего месяца
+    days = [(start + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(span + LOAN_DAYS + 1)]
+
+    conn = sqlite3.connect(path, isolation_level='DEFERRED')
+    # База создается с нуля: при сбое ее строят заново, журнал не нужен
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    with redirect_stdout(io.StringIO()):
+        apply_migrations(conn)
+    suspended = _suspend_schema_objects(conn)
+    conn.commit()
+
+    stage = time.perf_counter()
+    book_weights = _zipf_cum_weights(book_count, zipf)
+    # Активность читателей распределена ровнее популярности книг
+    reader_weights = _zipf_cum_weights(reader_count, zipf / 2)
+    # Популярные книги закупают большим тиражом
+    total_copies = [rng.randint(1, 3) + (rng.randint(2, 8) if rank < book_count // 100 else 0)
+                    for rank in range(book_count)]
+    available = list(total_copies)
+    unpaid_readers = set()
+
+    loan_writer = _BatchWriter(conn, '''
+        INSERT INTO loans (loan_id, book_id, reader_id, issue_date, due_date, return_date, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''')
+    fine_writer = _BatchWriter(conn, '''
+        INSERT INTO fines (fine_id, reader_id, amount, reason, status, loan_id, accrual_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''')
+    loan_id = 0
+    while loan_id < loans:
+        # Выдачи генерируются в порядке дат, поэтому loan_id растет вместе с issue_date
+        size = min(BATCH_SIZE, loans - loan_id)
+        book_sample = rng.choices(range(book_count), cum_weights=book_weights, k=size)
+        reader_sample = rng.choices(range(reader_count), cum_weights=reader_weights, k=size)
+        for book, reader in zip(book_sample, reader_sample):
+            issued = loan_id * span // loans
+            loan_id += 1
+            due = issued + LOAN_DAYS
+            outcome = rng.random()
+            if outcome < lost_rate:
+                returned = None
+            elif outcome < lost_rate + late_rate:
+                returned = due + rng.randint(1, MAX_LATE_DAYS)
+            else:
+                returned = issued + rng.randint(0, LOAN_DAYS)
+
+            if returned is None or returned > span:
+                if available[book] > 0:
+                    # Книга на руках на дату as_of
+                    available[book] -= 1
+                    loan_writer.add((loan_id, book + 1, reader + 1, days[issued], days[due], None, 'active'))
+                    if due < span:
+                        # Просрочена: штраф уже начислен по дату as_of
+                        fine_writer.add((None, reader + 1, round(FINE_DAILY_RATE * (span - due), 2),
+                                         OVERDUE_FINE_REASON, 'unpaid', loan_id, days[span]))
+                        unpaid_readers.add(reader)
+                    continue
+                # Свободных экземпляров нет: книгу успели вернуть
+                returned = rng.randint(issued, span)
+
+            loan_writer.add((loan_id, book + 1, reader + 1, days[issued], days[due], days[returned], 'returned'))
+            if returned > due:
+                status = 'unpaid' if rng.random() < UNPAID_RETURNED_SHARE else 'paid'
+                if status == 'unpaid':
+                    unpaid_readers.add(reader)
+                fine_writer.add((None, reader + 1, round(FINE_DAILY_RATE * (returned - due), 2),
+                                 OVERDUE_FINE_REASON, status, loan_id, days[returned]))
+    loan_writer.flush()
+    fine_writer.flush()
+    log(f"Выдачи: {loan_writer.count}, штрафы: {fine_writer.count} ({time.perf_counter() - stage:.1f} с)")
+
+    stage = time.perf_counter()
+    book_writer = _BatchWriter(conn, '''
+        INSERT INTO books (book_id, title, author, isbn, isbn_norm, year, publisher, genre, description,
+                           total_copies, available_copies)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''')
+    authors = []
+    for _ in range(max(book_count // 8, 1)):
+        first, surname = _person(rng)
+        authors.append(f'{first[0]}.{rng.choice(PATRONYMIC_INITIALS)}. {surname}')
+    genres = rng.choices(GENRES, weights=GENRE_WEIGHTS, k=book_count)
+    for book in range(book_count):
+        title = _title(rng)
+        author = rng.choice(authors)
+        isbn = _isbn(book + 1)
+        book_writer.add((book + 1, title, author, isbn, normalize_isbn(isbn), rng.randint(1850, as_of.year),
+                         rng.choice(PUBLISHERS), genres[book], f'{genres[book]}. {author}, «{title}»',
+                         total_copies[book], available[book]))
+    book_writer.flush()
+
+    reader_writer = _BatchWriter(conn, '''
+        INSERT INTO readers (reader_id, name, card_number, contact, password, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''')
+    for reader in range(reader_count):
+        first, surname = _person(rng)
+        # Читатели с неоплаченными штрафами заблокированы, как после accrue_overdue_fines
+        reader_writer.add((reader + 1, f'{surname} {first}', f'{reader + 1:07d}', f'reader{reader + 1}@mail.ru',
+                           f'{rng.randint(0, 9999):04d}', 0 if reader in unpaid_readers else 1))
+    reader_writer.flush()
+    conn.executemany('INSERT INTO librarians (name, username, password) VALUES (?, ?, ?)',
+                     [('Анна Петрова', '01', '1111'), ('Иван Сидоров', '02', '2222')])
+    conn.commit()
+    log(f"Книги: {book_count}, читатели: {reader_count} ({time.perf_counter() - stage:.1f} с)")
+
+    stage = time.perf_counter()
+    reservation_writer = _BatchWriter(conn, '''
+        INSERT INTO reservations (book_id, reader_id, reservation_date, status)
+        VALUES (?, ?, ?, ?)
+    ''')
+    waiting_count = int(reservation_count * WAITING_SHARE)
+    history_count = reservation_count - waiting_count
+    made = 0
+    while made < history_count:
+        size = min(BATCH_SIZE, history_count - made)
+        book_sample = rng.choices(range(book_count), cum_weights=book_weights, k=size)
+        reader_sample = rng.choices(range(reader_count), cum_weights=reader_weights, k=size)
+        outcomes = rng.choices(RESERVATION_OUTCOMES, weights=RESERVATION_OUTCOME_WEIGHTS, k=size)
+        for book, reader, status in zip(book_sample, reader_sample, outcomes):
+            reservation_writer.add((book + 1, reader + 1, days[made * span // history_count], status))
+            made += 1
+
+    # Очередь: ожидающие бронирования на книги, все экземпляры которых выданы,
+    # не больше одного на пару (книга, читатель); reservation_id растет с датой
+    waiting = set()
+    attempts = 0
+    while len(waiting) < waiting_count and attempts < waiting_count * 20:
+        size = min(BATCH_SIZE, (waiting_count - len(waiting)) * 4)
+        attempts += size
+        book_sample = rng.choices(range(book_count), cum_weights=book_weights, k=size)
+        reader_sample = rng.choices(range(reader_count), cum_weights=reader_weights, k=size)
+        for book, reader in zip(book_sample, reader_sample):
+            if available[book] == 0 and len(waiting) < waiting_count:
+                waiting.add((book, reader))
+    queue = sorted((rng.randint(span - LOAN_DAYS, span), book, reader) for book, reader in waiting)
+    for day, book, reader in queue:
+        reservation_writer.add((book + 1, reader + 1, days[day], 'active'))
+    reservation_writer.flush()
+    log(f"Бронирования: {reservation_writer.count}, из них в очереди: {len(queue)} "
+        f"({time.perf_counter() - stage:.1f} с)")
+
+    stage = time.perf_counter()
+    _restore_schema_objects(conn, suspended)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+    rebuild_library_stats(cursor)
+    rebuild_book_holds(cursor)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA journal_mode = WAL')
+    log(f"Индексы, триггеры и счетчики ({time.perf_counter() - stage:.1f} с)")
+
+    counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+              for table in ('books', 'readers', 'loans', 'reservations', 'fines')}
+    conn.close()
+    return counts
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Генерация большой синтетической базы библиотеки")
+    parser.add_argument('path', help="файл новой базы")
+    parser.add_argument('--loans', type=int, default=1_000_000, help="число выдач (по умолчанию: %(default)s)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="зерно генератора (по умолчанию: %(default)s)")
+    parser.add_argument('--books', type=int, help=f"число книг (по умолчанию: {BOOKS_PER_LOAN:g} на выдачу)")
+    parser.add_argument('--readers', type=int, help=f"число читателей (по умолчанию: {READERS_PER_LOAN:g} на выдачу)")
+    parser.add_argument('--reservations', type=int,
+                        help=f"число бронирований (по умолчанию: {RESERVATIONS_PER_LOAN:g} на выдачу)")
+    parser.add_argument('--years', type=int, default=3, help="глубина истории в годах (по умолчанию: %(default)s)")
+    parser.add_argument('--late-rate', type=float, default=0.1,
+                        help="доля выдач, возвращенных после срока (по умолчанию: %(default)s)")
+    parser.add_argument('--lost-rate', type=float, default=0.001,
+                        help="доля выдач, не возвращенных вовсе (по умолчанию: %(default)s)")
+    parser.add_argument('--zipf', type=float, default=1.0,
+                        help="показатель распределения популярности книг (по умолчанию: %(default)s)")
+    parser.add_argument('--as-of', type=date.fromisoformat, default=date.today(),
+                        help="дата, на которую строится база, ГГГГ-ММ-ДД (по умолчанию: сегодня)")
+    parser.add_argument('--force', action='store_true', help="перезаписать существующий файл")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if os.path.exists(args.path) and not args.force:
+        print(f"Файл {args.path} уже существует; для перезаписи укажите --force")
+        return 1
+    # Строим во временный файл: прерванная генерация не оставит неполную базу
+    partial = args.path + '.partial'
+    for leftover in (partial, partial + '-wal', partial + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    started = time.perf_counter()
+    counts = generate_library(partial, args.loans, args.seed, books=args.books, readers=args.readers,
+                              reservations=args.reservations, years=args.years, late_rate=args.late_rate,
+                              lost_rate=args.lost_rate, zipf=args.zipf, as_of=args.as_of)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(args.path + suffix):
+            os.remove(args.path + suffix)
+    os.replace(partial, args.path)
+    summary = ', '.join(f'{table}: {count}' for table, count in counts.items())
+    print(f"База {args.path} готова за {time.perf_counter() - started:.1f} с ({summary})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# import_books.py
+"""Импорт каталога книг поставщика из CSV или JSON.
+
+Запуск из папки src:
+    python -m import_books catalog.csv
+    python -m import_books catalog.jsonl --batch-size 10000
+
+Строки читаются потоково и передаются в BookDAO.add_books, который пишет
+их пачками в одной транзакции. Книги с уже известным ISBN пополняют
+число экземпляров. Поддерживаются CSV с заголовком, JSON Lines (.jsonl)
+и JSON - список объектов или файл экспорта с ключом "books".
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from data_access import BookDAO, IMPORT_BATCH_SIZE
+from models import Book
+
+IMPORT_FORMATS = ('csv', 'json', 'jsonl')
+
+def _to_int(value, default=None):
+    if value is None or value == '':
+        return default
+    return int(value)
+
+def book_from_record(record):
+    """Строит книгу из записи каталога; без названия книга не импортируется"""
+    title = (record.get('title') or '').strip()
+    if not title:
+        return None
+    total = _to_int(record.get('total_copies', record.get('copies')), 1)
+    return Book(
+        title=title,
+        author=(record.get('author') or '').strip(),
+        isbn=(record.get('isbn') or '').strip() or None,
+        year=_to_int(record.get('year')),
+        publisher=record.get('publisher') or '',
+        genre=record.get('genre') or '',
+        description=record.get('description') or '',
+        total_copies=total,
+        available_copies=_to_int(record.get('available_copies'), total),
+    )
+
+def read_csv_records(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+def read_jsonl_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_json_records(path):
+    # Обычный JSON целиком загружается в память; для больших каталогов - JSON Lines
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('books', [])
+    yield from data
+
+READERS = {
+    'csv': read_csv_records,
+    'json': read_json_records,
+    'jsonl': read_jsonl_records,
+}
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return extension if extension in IMPORT_FORMATS else None
+
+def import_books(path, fmt=None, batch_size=IMPORT_BATCH_SIZE):
+    """Импортирует файл каталога; возвращает (успех, сообщение, число пропущенных строк)"""
+    fmt = fmt or detect_format(path)
+    if fmt not in READERS:
+        return False, f"Неизвестный формат файла: {path}", 0
+
+    skipped = 0
+
+    def books():
+        nonlocal skipped
+        for record in READERS[fmt](path):
+            book = book_from_record(record)
+            if book is None:
+                skipped += 1
+                continue
+            yield book
+
+    success, message = BookDAO.add_books(books(), batch_size=batch_size)
+    return success, message, skipped
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт каталога книг из CSV или JSON")
+    parser.add_argument('path', help="файл каталога (.csv, .json или .jsonl)")
+    parser.add_argument('--format', choices=IMPORT_FORMATS,
+                        help="формат файла, если его нельзя определить по расширению")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                        help="строк в одном executemany (по умолчанию: %(default)s)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.path):
+        print(f"Файл '{args.path}' не найден!")
+        return 1
+
+    started = time.perf_counter()
+    success, message, skipped = import_books(args.path, args.format, args.batch_size)
+    elapsed = time.perf_counter() - started
+
+    print(message)
+    if skipped:
+        print(f"Пропущено строк без названия: {skipped}")
+    print(f"Время импорта: {elapsed:.2f} с")
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+# isbn.py
+"""Нормализация ISBN.
+
+Один и тот же тираж встречается в каталогах поставщиков как ISBN-10
+(0-306-40615-2), как ISBN-13 (978-0-306-40615-7) и с разными разделителями.
+normalize_isbn приводит все варианты к одному ключу: 13 цифр без
+дефисов и пробелов, ISBN-10 переводится в ISBN-13 с префиксом 978.
+"""
+import re
+
+_NON_ISBN_CHARS = re.compile(r'[^0-9X]')
+
+def isbn13_check_digit(first12):
+    total = sum(int(digit) * (3 if index % 2 else 1) for index, digit in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+def normalize_isbn(value):
+    """Возвращает ключ ISBN для поиска дубликатов или None для пустого значения.
+
+    Контрольная цифра исходного номера не проверяется: в реальных
+    каталогах встречаются номера с ошибкой, и они тоже должны совпадать
+    сами с собой. Строки, не похожие на ISBN, возвращаются очищенными.
+    """
+    if value is None:
+        return None
+    digits = _NON_ISBN_CHARS.sub('', str(value).upper())
+    if not digits:
+        return None
+    if len(digits) == 10 and digits[:9].isdigit():
+        first12 = '978' + digits[:9]
+        return first12 + isbn13_check_digit(first12)
+    return digits
@@ -1,9 +1,18 @@
 # librarian_interface.py
-from data_access import BookDAO, ReaderDAO, LoanDAO, ReservationDAO, FineDAO
+from data_access import BookDAO, ReaderDAO, LoanDAO, ReservationDAO, FineDAO, StatsDAO
 from models import Book
+from pager import KeysetPager
 import os
 from datetime import datetime, timedelta
 
+RESERVATION_STATUSES = {
+    'active': "В очереди",
+    'ready': "Экземпляр отложен",
+    'fulfilled': "Выдано",
+    'expired': "Истекло",
+    'cancelled': "Отменено",
+}
+
 class LibrarianInterface:
     def __init__(self, librarian):
         self.librarian = librarian
@@ -68,24 +77,29 @@ class LibrarianInterface:
             print(f"Ошибка при добавлении книги: {e}")
     
     def show_all_books(self):
-        self.clear_screen()
-        self.display_header()
-        print("\nВСЕ КНИГИ В БИБЛИОТЕКЕ")
-        
-        books = BookDAO.get_all_books()
-        if not books:
-            print("В библиотеке пока нет книг!")
-            return
-        
-        total_books = sum(book.total_copies for book in books)
-        available_books = sum(book.available_copies for book in books)
-        
-        print(f"Всего книг: {total_books} | Доступно: {available_books}")
-        print("-" * 60)
-        
-        for i, book in enumerate(books, 1):
-            status = "+" if book.available_copies > 0 else "-"
-            print(f"{i}. {status} {book}")
+        total_books, available_books = BookDAO.get_copies_summary()
+
+        def render(books):
+            self.clear_screen()
+            self.display_header()
+            print("\nВСЕ КНИГИ В БИБЛИОТЕКЕ")
+
+            if not books:
+                print("В библиотеке пока нет книг!")
+                return
+
+            print(f"Всего книг: {total_books} | Доступно: {available_books}")
+            print("-" * 60)
+
+            for i, book in enumerate(books, 1):
+                status = "+" if book.available_copies > 0 else "-"
+                print(f"{i}. {status} {book}")
+
+        # Каталог листается по страницам, в памяти только текущая страница
+        pager = KeysetPager(BookDAO.get_books_page,
+                            key=lambda book: (book.title, book.book_id),
+                            jump_key=lambda title: (title, 0))
+        pager.run(render)
     
     def search_books(self):
         self.clear_screen()
@@ -109,20 +123,25 @@ class LibrarianInterface:
             print()
     
     def manage_readers(self):
-        self.clear_screen()
-        self.display_header()
-        print("\nУПРАВЛЕНИЕ ЧИТАТЕЛЯМИ")
-        
-        readers = ReaderDAO.get_all_readers()
+        def render(readers):
+            self.clear_screen()
+            self.display_header()
+            print("\nУПРАВЛЕНИЕ ЧИТАТЕЛЯМИ")
+
+            if not readers:
+                print("Нет зарегистрированных читателей!")
+                return
+
+            print("\nСПИСОК ЧИТАТЕЛЕЙ:")
+            for i, reader in enumerate(readers, 1):
+                print(f"{i}. {reader}")
+
+        # Штрафы приходят вместе с читателями одним запросом на страницу;
+        # выбор номера относится к странице, на которой закончен просмотр
+        pager = KeysetPager(ReaderDAO.get_readers_with_fine_summary, key=lambda reader: reader.reader_id)
+        readers = pager.run(render)
         if not readers:
-            print("Нет зарегистрированных читателей!")
             return
-        
-        print("\nСПИСОК ЧИТАТЕЛЕЙ:")
-        for i, reader in enumerate(readers, 1):
-            status = "Активен" if reader.status else "Заблокирован"
-            unpaid_fines = FineDAO.get_reader_unpaid_fines_count(reader.reader_id)
-            print(f"{i}. {reader.name} | {reader.card_number} | {status} | Неоплаченных штрафов: {unpaid_fines}")
 
         print("\nОпции:")
         print("1. Изменить статус читателя")
@@ -310,6 +329,15 @@ class LibrarianInterface:
             print(f"Ошибка: {e}")
 
     def show_all_loans(self):
+        self.clear_screen()
+        self.display_header()
+        print("\nВЫДАЧИ")
+        print("1. Все активные выдачи")
+        print("2. Только просроченные")
+        if input("\nВыберите режим: ").strip() == '2':
+            self.show_overdue_loans()
+            return
+
         self.clear_screen()
         self.display_header()
         print("\nВСЕ АКТИВНЫЕ ВЫДАЧИ")
@@ -340,6 +368,36 @@ class LibrarianInterface:
                 print(f"   Осталось дней: {days_left}")
             print()
 
+    def show_overdue_loans(self):
+        # Дата фиксируется на весь просмотр, чтобы страницы не сдвигались в полночь
+        as_of = datetime.now().strftime('%Y-%m-%d')
+        total_overdue = LoanDAO.count_overdue(as_of)
+
+        def render(loans):
+            self.clear_screen()
+            self.display_header()
+            print("\nПРОСРОЧЕННЫЕ ВЫДАЧИ")
+
+            if not loans:
+                print("Просроченных выдач нет")
+                return
+
+            print(f"Всего просроченных выдач: {total_overdue}")
+            print("-" * 70)
+
+            for i, loan in enumerate(loans, 1):
+                print(f"{i}. Читатель: {loan.reader_name}")
+                print(f"   Книга: '{loan.book_title}'")
+                print(f"   Выдана: {loan.issue_date}")
+                print(f"   Вернуть до: {loan.due_date}")
+                print(f"   ПРОСРОЧЕНО на {loan.days_overdue} дней")
+                print()
+
+        pager = KeysetPager(lambda after=None, before=None, limit=20:
+                                LoanDAO.get_overdue_loans(as_of, after=after, before=before, limit=limit),
+                            key=lambda loan: (loan.due_date, loan.loan_id))
+        pager.run(render)
+
     def manage_reservations(self):
         self.clear_screen()
         self.display_header()
@@ -354,7 +412,7 @@ class LibrarianInterface:
         print("-" * 60)
         
         for i, reservation in enumerate(reservations, 1):
-            status = "Активно" if reservation.status == 'active' else "Отменено"
+            status = RESERVATION_STATUSES.get(reservation.status, reservation.status)
             print(f"{i}. Читатель: {reservation.reader_name}")
             print(f"   Книга: '{reservation.book_title}'")
             print(f"   Забронирована: {reservation.reservation_date}")
@@ -392,39 +450,40 @@ class LibrarianInterface:
         self.display_header()
         print("\nСТАТИСТИКА БИБЛИОТЕКИ")
         
-        # Простая статистика
-        books = BookDAO.get_all_books()
-        readers = ReaderDAO.get_all_readers()
-        loans = LoanDAO.get_active_loans()
-        reservations = ReservationDAO.get_all_reservations()
-        fines = FineDAO.get_all_fines()
-        
-        total_books = sum(book.total_copies for book in books)
-        available_books = sum(book.available_copies for book in books)
+        # Счетчики поддерживаются триггерами, экран не перебирает таблицы
+        stats = StatsDAO.get_summary()
+
+        total_books = stats['total_copies']
+        available_books = stats['available_copies']
         borrowed_books = total_books - available_books
-        
-        active_readers = sum(1 for reader in readers if reader.status)
-        blocked_readers = sum(1 for reader in readers if not reader.status)
-        
-        unpaid_fines = sum(fine.amount for fine in fines if fine.status == 'unpaid')
+
+        active_readers = stats['active_readers']
+        blocked_readers = stats['readers'] - active_readers
 
         print("ОСНОВНАЯ СТАТИСТИКА:")
+        print(f"   Названий в каталоге: {stats['book_titles']}")
         print(f"   Книги в фонде: {total_books}")
         print(f"   Доступно для выдачи: {available_books}")
         print(f"   Выдано читателям: {borrowed_books}")
         print()
-        
+
+        genres = StatsDAO.get_genre_breakdown()
+        if genres:
+            print("ПО ЖАНРАМ:")
+            for genre, titles, total, available in genres:
+                print(f"   {genre or 'Без жанра'}: названий {titles}, экземпляров {total}, доступно {available}")
+            print()
+
         print("ЧИТАТЕЛИ:")
-        print(f"   Всего читателей: {len(readers)}")
+        print(f"   Всего читателей: {stats['readers']}")
         print(f"   Активных: {active_readers}")
         print(f"   Заблокированных: {blocked_readers}")
         print()
         
         print("АКТИВНОСТЬ:")
-        print(f"   Активных выдач: {len(loans)}")
-        active_reservations = len([r for r in reservations if r.status == 'active'])
-        print(f"   Активных бронирований: {active_reservations}")
-        print(f"   Неоплаченных штрафов: {unpaid_fines} руб.")
+        print(f"   Активных выдач: {stats['active_loans']}")
+        print(f"   Активных бронирований: {stats['active_reservations']}")
+        print(f"   Неоплаченных штрафов: {round(stats['unpaid_fines_amount'], 2)} руб.")
 
     def run(self):
         while True:
@@ -0,0 +1,390 @@
+# load_test.py
+"""Нагрузочный тест терминалов: много сессий читателей и библиотекарей сразу.
+
+Каждый терминал - поток, который проигрывает сессию: вход читателя и
+несколько действий из меню с паузами на обдумывание между ними. Действия
+вызывают те же методы DAO, что и ReaderInterface и LibrarianInterface
+(вместо ввода с клавиатуры), и выбираются случайно по заданной смеси.
+Терминалы распределяются по нескольким процессам, как отдельные
+программы, открывшие одну базу. По каждому действию выводятся
+пропускная способность, задержки p50/p95/p99 и число ошибок блокировки.
+
+По умолчанию тест идет на временной копии базы (LIBRARY_DB или library.db),
+пишущие действия исходную базу не меняют:
+    python load_test.py --terminals 200 --processes 4 --seconds 30
+    python load_test.py --db /tmp/library_10m.db --mix search=50,checkout=25,return=25
+"""
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+# Действие -> доля в смеси по умолчанию
+DEFAULT_MIX = {
+    'login': 5,
+    'browse': 15,
+    'search': 25,
+    'book': 10,
+    'account': 15,
+    'reserve': 8,
+    'cancel': 2,
+    'checkout': 8,
+    'return': 7,
+    'overdue': 2,
+    'readers': 1,
+    'stats': 2,
+}
+# Признаки ошибки занятой базы в сообщениях DAO и исключениях SQLite
+LOCK_MARKERS = ('locked', 'busy')
+PERCENTILES = (50, 95, 99)
+READER_SAMPLE = 10_000
+WORD_SAMPLE = 2_000
+# Сколько процессы ждут друг друга перед стартом, с
+START_TIMEOUT = 120
+
+class _Session:
+    """Состояние одного терминала: текущий читатель и случайный генератор"""
+
+    def __init__(self, rng, fixture):
+        self.rng = rng
+        self.fixture = fixture
+        self.reader_id = None
+        self.card_number = None
+        self.password = None
+
+    def start(self):
+        self.reader_id, self.card_number, self.password = self.rng.choice(self.fixture['readers'])
+
+    def book_id(self):
+        # Спрос смещен к началу каталога: популярные книги выдают и бронируют чаще
+        return int(self.fixture['max_book_id'] * self.rng.random() ** 3) + 1
+
+    def word(self):
+        return self.rng.choice(self.fixture['words'])
+
+def _op_login(session):
+    from data_access import AuthDAO
+    return AuthDAO.authenticate_reader(session.card_number, session.password)
+
+def _op_browse(session):
+    from data_access import BookDAO
+    return BookDAO.get_books_page(limit=20)
+
+def _op_search(session):
+    from data_access import BookDAO
+    return BookDAO.search_books(session.word())
+
+def _op_book(session):
+    from data_access import BookDAO
+    return BookDAO.get_book_by_id(session.book_id())
+
+def _op_account(session):
+    from data_access import ReaderDAO
+    return ReaderDAO.get_account_summary(session.reader_id)
+
+def _op_reserve(session):
+    from data_access import ReaderDAO
+    return ReaderDAO.reserve_book(session.book_id(), session.reader_id)
+
+def _op_cancel(session):
+    from data_access import ReaderDAO, ReservationDAO
+    reservations = ReaderDAO.get_reader_reservations(session.reader_id)
+    if not reservations:
+        return False, "Нет бронирований"
+    # cancel_reservation возвращает только признак успеха: отказ, в том числе
+    # из-за блокировки, учитывается как 'refused'
+    if ReservationDAO.cancel_reservation(session.rng.choice(reservations).reservation_id):
+        return True, "Бронирование отменено"
+    return False, "Бронирование не отменено"
+
+def _op_checkout(session):
+    from data_access import LoanDAO
+    return LoanDAO.create_loan(session.book_id(), session.reader_id)
+
+def _op_return(session):
+    from data_access import ReaderDAO, LoanDAO
+    loans = ReaderDAO.get_reader_loans(session.reader_id)
+    if not loans:
+        return False, "Нет выдач"
+    return LoanDAO.return_loan(session.rng.choice(loans).loan_id)
+
+def _op_overdue(session):
+    from data_access import LoanDAO
+    LoanDAO.count_overdue()
+    return LoanDAO.get_overdue_loans(limit=20)
+
+def _op_readers(session):
+    from data_access import ReaderDAO
+    return ReaderDAO.get_readers_with_fine_summary(limit=20)
+
+def _op_stats(session):
+    from data_access import StatsDAO
+    StatsDAO.get_summary()
+    return StatsDAO.get_genre_breakdown()
+
+OPERATIONS = {
+    'login': _op_login,
+    'browse': _op_browse,
+    'search': _op_search,
+    'book': _op_book,
+    'account': _op_account,
+    'reserve': _op_reserve,
+    'cancel': _op_cancel,
+    'checkout': _op_checkout,
+    'return': _op_return,
+    'overdue': _op_overdue,
+    'readers': _op_readers,
+    'stats': _op_stats,
+}
+
+def parse_mix(text):
+    """Разбирает смесь вида 'search=50,checkout=25' в словарь действие -> вес"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"неизвестное действие: {name} (есть: {', '.join(OPERATIONS)})")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"вес действия {name} должен быть числом") from None
+    if not mix or sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("сумма весов смеси должна быть положительной")
+    return mix
+
+def _is_lock_error(message):
+    message = str(message).lower()
+    return any(marker in message for marker in LOCK_MARKERS)
+
+def _classify(result):
+    """Исход действия: 'ok', 'refused' (DAO вернул отказ) или 'locked'"""
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], bool):
+        success, message = result
+        if success:
+            return 'ok'
+        return 'locked' if _is_lock_error(message) else 'refused'
+    return 'ok'
+
+def _load_fixture(conn):
+    """Читатели, от имени которых идут сессии, и слова для поиска"""
+    readers = conn.execute('''
+        SELECT reader_id, card_number, password FROM readers
+        WHERE status != 0 ORDER BY reader_id LIMIT ?
+    ''', (READER_SAMPLE,)).fetchall()
+    max_book_id = conn.execute('SELECT COALESCE(MAX(book_id), 0) FROM books').fetchone()[0]
+    titles = conn.execute('SELECT title FROM books ORDER BY book_id LIMIT ?', (WORD_SAMPLE,)).fetchall()
+    words = sorted({word.strip('.,:;!?«»') for (title,) in titles for word in title.split() if len(word) > 3})
+    return {'readers': readers, 'max_book_id': max_book_id, 'words': words or ['книга']}
+
+def run_terminals(index, terminals, mix, seconds, think_ms, session_ops, seed, start_barrier):
+    """Запускается в отдельном процессе: terminals потоков-терминалов на seconds секунд.
+
+    Возвращает (результаты по действиям, начало, конец): для каждого действия
+    задержки в мс, число исходов и первые сообщения неожиданных ошибок.
+    """
+    from database import db
+    import data_access  # noqa: F401 - миграции применяются до старта замера
+
+    # У каждого терминала свое соединение, как у отдельной программы
+    db.pool.max_size = max(db.pool.max_size, terminals)
+    db.read_pool.max_size = max(db.read_pool.max_size, terminals)
+    conn = db.get_connection(read_only=True)
+    fixture = _load_fixture(conn)
+    conn.close()
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results = {name: {'latencies': [], 'ok': 0, 'refused': 0, 'locked': 0, 'errors': 0, 'messages': []}
+               for name in names}
+    lock = threading.Lock()
+    ready = threading.Barrier(terminals + 1)
+    stop = threading.Event()
+
+    def terminal(number):
+        rng = random.Random(f'{seed}-{index}-{number}')
+        session = _Session(rng, fixture)
+        ready.wait()
+        while not stop.is_set():
+            session.start()
+            for name in rng.choices(names, weights=weights, k=session_ops):
+                if stop.wait(rng.expovariate(1000 / think_ms) if think_ms > 0 else 0):
+                    return
+                started = time.perf_counter()
+                try:
+                    outcome, message = _classify(OPERATIONS[name](session)), None
+                except Exception as e:
+                    outcome, message = ('locked' if _is_lock_error(e) else 'errors'), f'{type(e).__name__}: {e}'
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    result = results[name]
+                    result['latencies'].append(elapsed)
+                    result[outcome] += 1
+                    if outcome == 'errors' and len(result['messages']) < 5:
+                        result['messages'].append(message)
+
+    threads = [threading.Thread(target=terminal, args=(number,), daemon=True) for number in range(terminals)]
+    # Методы DAO печатают служебные сообщения; в нагрузочном тесте они не нужны
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for thread in threads:
+            thread.start()
+        ready.wait()
+        # Все процессы начинают одновременно, после того как подготовились
+        start_barrier.wait(timeout=START_TIMEOUT)
+        began = time.time()
+        stop.wait(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        ended = time.time()
+    db.pool.close_all()
+    db.read_pool.close_all()
+    return results, began, ended
+
+def percentile(sorted_values, percent):
+    """Значение ранга percent в отсортированном списке (метод ближайшего ранга)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def merge_results(parts):
+    merged = {}
+    for results in parts:
+        for name, result in results.items():
+            target = merged.setdefault(name, {'latencies': [], 'ok': 0, 'refused': 0, 'locked': 0,
+                                              'errors': 0, 'messages': []})
+            target['latencies'].extend(result['latencies'])
+            for key in ('ok', 'refused', 'locked', 'errors'):
+                target[key] += result[key]
+            target['messages'].extend(result['messages'][:5 - len(target['messages'])])
+    return merged
+
+def summarize(merged, elapsed):
+    """Сводка по действиям: число вызовов, вызовов в секунду, исходы и задержки в мс"""
+    summary = {}
+    for name, result in merged.items():
+        latencies = sorted(result['latencies'])
+        row = {
+            'calls': len(latencies),
+            'per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'ok': result['ok'],
+            'refused': result['refused'],
+            'locked': result['locked'],
+            'errors': result['errors'],
+        }
+        for percent in PERCENTILES:
+            row[f'p{percent}_ms'] = round(percentile(latencies, percent), 2)
+        row['max_ms'] = round(latencies[-1], 2) if latencies else 0.0
+        row['messages'] = result['messages']
+        summary[name] = row
+    return summary
+
+def make_scratch_database(source):
+    """Копирует базу во временный файл, чтобы пишущие действия не меняли данные"""
+    scratch = os.path.join(tempfile.mkdtemp(), 'load_test.db')
+    if os.path.exists(source):
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(scratch)
+        src.backup(dst)
+        src.close()
+        dst.close()
+    return scratch
+
+def load_test(source, terminals, processes, seconds, mix, think_ms, session_ops, seed, in_place=False):
+    path = source if in_place else make_scratch_database(source)
+    empty = not os.path.exists(source)
+    # Дочерние процессы открывают базу из LIBRARY_DB при импорте database
+    os.environ['LIBRARY_DB'] = path
+    if empty:
+        with redirect_stdout(io.StringIO()):
+            from database import db
+            db.add_sample_data()
+
+    processes = max(1, min(processes, terminals))
+    shares = [terminals // processes + (1 if i < terminals % processes else 0) for i in range(processes)]
+
+    print("=" * 50)
+    print("НАГРУЗОЧНЫЙ ТЕСТ ТЕРМИНАЛОВ")
+    print("=" * 50)
+    if empty:
+        print(f"База: {path} (тестовые данные, {source} не найдена)")
+    elif in_place:
+        print(f"База: {path}")
+    else:
+        print(f"База: {path} (копия {source})")
+    print(f"Терминалов: {terminals}, процессов: {processes}, длительность: {seconds} с, "
+          f"пауза: {think_ms} мс, действий в сессии: {session_ops}")
+    print("Смесь: " + ', '.join(f'{name}={weight:g}' for name, weight in mix.items()))
+
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        start_barrier = manager.Barrier(processes)
+        futures = [pool.submit(run_terminals, index, share, mix, seconds, think_ms, session_ops, seed,
+                               start_barrier)
+                   for index, share in enumerate(shares)]
+        parts = [future.result() for future in futures]
+
+    elapsed = max(ended for _, _, ended in parts) - min(began for _, began, _ in parts)
+    return summarize(merge_results(results for results, _, _ in parts), elapsed), elapsed
+
+def print_summary(summary, elapsed):
+    print("-" * 104)
+    print(f"  {'действие':<10}{'вызовов':>9}{'в сек':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+          f"{'макс, мс':>10}{'отказов':>9}{'блокир.':>9}{'ошибок':>9}")
+    totals = {'calls': 0, 'locked': 0, 'errors': 0}
+    for name, row in summary.items():
+        print(f"  {name:<10}{row['calls']:>9}{row['per_second']:>9.1f}{row['p50_ms']:>10.2f}"
+              f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}"
+              f"{row['refused']:>9}{row['locked']:>9}{row['errors']:>9}")
+        for key in totals:
+            totals[key] += row[key]
+    print("-" * 104)
+    print(f"Всего: {totals['calls']} действий за {elapsed:.1f} с ({totals['calls'] / elapsed:.1f} в секунду), "
+          f"ошибок блокировки: {totals['locked']}, прочих ошибок: {totals['errors']}")
+    for name, row in summary.items():
+        for message in row['messages']:
+            print(f"  {name}: {message}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест одновременной работы терминалов")
+    parser.add_argument('--db', default=os.environ.get('LIBRARY_DB', 'library.db'),
+                        help="исходная база (по умолчанию: LIBRARY_DB или library.db)")
+    parser.add_argument('--in-place', action='store_true', help="работать с самой базой, а не с ее копией")
+    parser.add_argument('--terminals', type=int, default=200, help="терминалов (по умолчанию: %(default)s)")
+    parser.add_argument('--processes', type=int, default=4, help="процессов (по умолчанию: %(default)s)")
+    parser.add_argument('--seconds', type=float, default=30, help="длительность (по умолчанию: %(default)s)")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="смесь действий: имя=вес через запятую, действия: " + ', '.join(OPERATIONS))
+    parser.add_argument('--think-ms', type=float, default=500,
+                        help="средняя пауза между действиями, мс (по умолчанию: %(default)s)")
+    parser.add_argument('--session-ops', type=int, default=10,
+                        help="действий в сессии до смены читателя (по умолчанию: %(default)s)")
+    parser.add_argument('--seed', type=int, default=1, help="зерно генератора (по умолчанию: %(default)s)")
+    parser.add_argument('--json', help="сохранить сводку в JSON-файл")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    summary, elapsed = load_test(args.db, args.terminals, args.processes, args.seconds, args.mix,
+                                 args.think_ms, args.session_ops, args.seed, args.in_place)
+    print_summary(summary, elapsed)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed': round(elapsed, 3), 'operations': summary}, f, ensure_ascii=False, indent=2)
+    # Ошибки блокировки - измеряемая величина; неожиданные ошибки - повод разбираться
+    return 1 if any(row['errors'] for row in summary.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
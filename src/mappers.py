@@ -0,0 +1,57 @@
+# mappers.py
+"""Сопоставление столбцов запроса с полями моделей.
+
+Каждое место вызова DAO описывает явный список нужных ему столбцов.
+По этому списку заранее компилируется фабрика строк, которая
+устанавливается курсору как row_factory: SQLite отдает только
+перечисленные столбцы, а объект модели строится без промежуточных
+кортежей и сопоставления по позиции в SELECT *.
+"""
+
+class RowMapper:
+    """Список столбцов запроса и скомпилированные фабрики модели и ее кортежного вида.
+
+    columns - SQL-выражения столбцов; имя поля модели берется из псевдонима
+    (`b.title AS book_title`) или из имени столбца (`l.loan_id` -> loan_id).
+    Поля модели, не попавшие в список, равны None и в объекте, и в кортежном
+    виде: значения по умолчанию конструктора не выдаются за прочитанные из базы,
+    а to_dict таких объектов (см. Model.partial) отдает только выбранные поля.
+    rows_only=True - неполная выборка только для чтения: фабрика всегда
+    строит кортежный вид, а не объект модели.
+    """
+
+    def __init__(self, model, columns, rows_only=False):
+        self.model = model
+        self.rows_only = rows_only
+        self.fields = [self._field_name(column) for column in columns]
+        unknown = [field for field in self.fields if field not in model.__slots__]
+        if unknown:
+            raise ValueError(f"{model.__name__} не содержит полей: {', '.join(unknown)}")
+
+        # Строка для подстановки в SELECT
+        self.columns = ', '.join(columns)
+        missing = [name for name in model.__slots__ if name not in self.fields]
+        # Объекты неполной выборки отдают в to_dict только выбранные поля
+        target = model.partial(self.fields) if missing else model
+        self.object_factory = self._compile(target, self.fields, missing)
+        self.row_factory = self._compile(target.Row, self.fields)
+
+    def factory(self, as_rows=False):
+        return self.row_factory if as_rows or self.rows_only else self.object_factory
+
+    @staticmethod
+    def _field_name(column):
+        parts = column.split()
+        if len(parts) >= 3 and parts[-2].upper() == 'AS':
+            return parts[-1]
+        return column.split('.')[-1]
+
+    @staticmethod
+    def _compile(model, fields, missing=()):
+        # Генерируем функцию вида model(book_id=row[0], title=row[1], ..., isbn=None)
+        arguments = [f'{field}=row[{index}]' for index, field in enumerate(fields)]
+        arguments = ', '.join(arguments + [f'{field}=None' for field in missing])
+        source = f'def factory(cursor, row):\n    return model({arguments})\n'
+        namespace = {'model': model}
+        exec(compile(source, f'<RowMapper {model.__name__}>', 'exec'), namespace)
+        return namespace['factory']
@@ -0,0 +1,525 @@
+# migrations.py
+"""Версионированные миграции схемы базы данных.
+
+Номер примененной миграции хранится в PRAGMA user_version, поэтому при
+запуске выполняются только недостающие шаги, а существующие данные не трогаются.
+"""
+
+from isbn import normalize_isbn
+
+MIGRATIONS = []
+
+# Управляемый набор вторичных индексов: имя -> определение.
+# Индексы по выдачам и бронированиям читателя покрывающие: вместе с rowid
+# они содержат все столбцы строки, и запрос не обращается к самой таблице.
+# Книги и читатели в соединениях ищутся по INTEGER PRIMARY KEY (rowid),
+# это уже прямой переход к строке, отдельный индекс для title/name не нужен.
+INDEXES = {
+    'idx_books_title': 'books (title)',
+    'idx_loans_reader_status': 'loans (reader_id, status, book_id, issue_date, due_date, return_date)',
+    'idx_loans_status_due': 'loans (status, due_date, book_id, reader_id, issue_date, return_date)',
+    'idx_reservations_book_reader_status': 'reservations (book_id, reader_id, status)',
+    'idx_reservations_reader_status': 'reservations (reader_id, status, book_id, reservation_date)',
+    'idx_fines_reader_status': 'fines (reader_id, status)',
+}
+
+def migration(version, description):
+    """Регистрирует функцию как миграцию с указанным номером версии"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def latest_version():
+    return max(version for version, _, _ in MIGRATIONS)
+
+def apply_migrations(conn):
+    """Применяет все миграции новее текущей версии схемы.
+
+    Каждая миграция выполняется в своей транзакции вместе с обновлением
+    user_version. Возвращает список примененных версий.
+    """
+    if get_schema_version(conn) >= latest_version():
+        return []
+
+    applied = []
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        # Захватываем блокировку записи и перепроверяем версию:
+        # другой процесс мог успеть применить миграцию раньше нас
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            func(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"Применена миграция {version}: {description}")
+    return applied
+
+@migration(1, 'Базовая схема')
+def create_base_schema(cursor):
+    # Таблица книг
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            book_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            isbn TEXT UNIQUE,
+            year INTEGER,
+            publisher TEXT,
+            genre TEXT,
+            description TEXT,
+            total_copies INTEGER DEFAULT 1,
+            available_copies INTEGER DEFAULT 1
+        )
+    ''')
+    
+    # Таблица библиотекарей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS librarians (
+            librarian_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+    ''')
+
+    # Таблица читателей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS readers (
+            reader_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            card_number TEXT UNIQUE NOT NULL,
+            contact TEXT,
+            password TEXT NOT NULL,
+            status BOOLEAN DEFAULT 1
+        )
+    ''')
+    
+    # Таблица выдачи книг
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS loans (
+            loan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            reader_id INTEGER NOT NULL,
+            issue_date TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            return_date TEXT,
+            status TEXT DEFAULT 'active',
+            FOREIGN KEY (book_id) REFERENCES books (book_id),
+            FOREIGN KEY (reader_id) REFERENCES readers (reader_id)
+        )
+    ''')
+    
+    # Таблица бронирований
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reservations (
+            reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            reader_id INTEGER NOT NULL,
+            reservation_date TEXT NOT NULL,
+            status TEXT DEFAULT 'active',
+            FOREIGN KEY (book_id) REFERENCES books (book_id),
+            FOREIGN KEY (reader_id) REFERENCES readers (reader_id)
+        )
+    ''')
+    
+    # Таблица штрафов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fines (
+            fine_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reader_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            reason TEXT,
+            status TEXT DEFAULT 'unpaid',
+            FOREIGN KEY (reader_id) REFERENCES readers (reader_id)
+        )
+    ''')
+
+@migration(2, 'Вторичные индексы для запросов DAO')
+def create_indexes(cursor):
+    for name, definition in INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+@migration(3, 'Полнотекстовый индекс каталога (FTS5)')
+def create_books_fts(cursor):
+    # unicode61 не считает «ё» вариантом «е», поэтому индекс строится
+    # по представлению, где «ё» уже заменена (то же делает BookDAO.search_books)
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS books_fts_content AS
+        SELECT book_id,
+               replace(replace(title, 'ё', 'е'), 'Ё', 'Е') AS title,
+               replace(replace(author, 'ё', 'е'), 'Ё', 'Е') AS author,
+               replace(replace(genre, 'ё', 'е'), 'Ё', 'Е') AS genre,
+               isbn
+        FROM books
+    ''')
+
+    # Внешний контент: текст хранится в books, FTS5 держит только индекс.
+    # unicode61 приводит к нижнему регистру любые буквы Unicode, включая кириллицу
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            title, author, genre, isbn,
+            content='books_fts_content',
+            content_rowid='book_id',
+            tokenize='unicode61'
+        )
+    ''')
+
+    # Триггеры синхронизируют индекс с таблицей книг
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author, genre, isbn)
+            SELECT book_id, title, author, genre, isbn
+            FROM books_fts_content WHERE book_id = new.book_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, genre, isbn)
+            VALUES ('delete', old.book_id,
+                    replace(replace(old.title, 'ё', 'е'), 'Ё', 'Е'),
+                    replace(replace(old.author, 'ё', 'е'), 'Ё', 'Е'),
+                    replace(replace(old.genre, 'ё', 'е'), 'Ё', 'Е'),
+                    old.isbn);
+        END
+    ''')
+    # Изменение количества экземпляров не затрагивает индекс
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update
+        AFTER UPDATE OF title, author, genre, isbn ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, genre, isbn)
+            VALUES ('delete', old.book_id,
+                    replace(replace(old.title, 'ё', 'е'), 'Ё', 'Е'),
+                    replace(replace(old.author, 'ё', 'е'), 'Ё', 'Е'),
+                    replace(replace(old.genre, 'ё', 'е'), 'Ё', 'Е'),
+                    old.isbn);
+            INSERT INTO books_fts (rowid, title, author, genre, isbn)
+            SELECT book_id, title, author, genre, isbn
+            FROM books_fts_content WHERE book_id = new.book_id;
+        END
+    ''')
+
+    # Индексируем уже существующие книги
+    cursor.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+# Таблицы, изменения которых записываются в change_log: имя -> первичный ключ
+TRACKED_TABLES = {
+    'books': 'book_id',
+    'readers': 'reader_id',
+    'loans': 'loan_id',
+    'reservations': 'reservation_id',
+    'fines': 'fine_id',
+}
+
+@migration(4, 'Журнал изменений для инкрементального экспорта')
+def create_change_log(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+
+    # Отметка последнего выгруженного изменения для каждого потребителя
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS export_state (
+            name TEXT PRIMARY KEY,
+            last_change_id INTEGER NOT NULL,
+            exported_at TEXT NOT NULL
+        )
+    ''')
+
+    for table, key in TRACKED_TABLES.items():
+        for operation, row in [('insert', 'new'), ('update', 'new'), ('delete', 'old')]:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_log_{operation}
+                AFTER {operation.upper()} ON {table} BEGIN
+                    INSERT INTO change_log (table_name, row_id, operation)
+                    VALUES ('{table}', {row}.{key}, '{operation}');
+                END
+            ''')
+
+def backfill_isbn_norm(cursor):
+    """Заполняет isbn_norm у книг, где он еще не вычислен.
+
+    Если одна книга заведена дважды (ISBN-10 и ISBN-13), ключ получает
+    только первая запись, чтобы не нарушить уникальный индекс.
+    Возвращает число пропущенных дубликатов.
+    """
+    cursor.execute('''
+        SELECT book_id, isbn FROM books
+        WHERE isbn IS NOT NULL AND isbn_norm IS NULL
+        ORDER BY book_id
+    ''')
+    seen = set()
+    updates = []
+    duplicates = 0
+    for book_id, isbn in cursor.fetchall():
+        key = normalize_isbn(isbn)
+        if key is None:
+            continue
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        updates.append((key, book_id))
+    cursor.executemany('UPDATE books SET isbn_norm = ? WHERE book_id = ?', updates)
+    return duplicates
+
+@migration(5, 'Нормализованный ISBN для поиска дубликатов')
+def add_isbn_norm(cursor):
+    cursor.execute('ALTER TABLE books ADD COLUMN isbn_norm TEXT')
+    # Нормализация делается на Python: пользовательская функция в триггере
+    # сделала бы схему нечитаемой для внешних инструментов
+    duplicates = backfill_isbn_norm(cursor)
+    if duplicates:
+        print(f"Книг с повторяющимся ISBN: {duplicates}, ключ isbn_norm у них не заполнен")
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_books_isbn_norm ON books (isbn_norm)')
+
+# Сводная статистика для экрана статистики: (metric, genre) -> value.
+# Строки с genre = '*' - итог по всей библиотеке, остальные - разбивка
+# книжного фонда по жанрам. Значения поддерживаются триггерами.
+STATS_ALL = '*'
+
+# Таблица -> (столбцы, влияющие на статистику, [(metric, genre, вклад строки)]).
+# Выражения записаны над {row}: new/old в триггерах, имя таблицы при пересчете
+_BOOK_GENRE = "COALESCE({row}.genre, '')"
+STATS_COUNTERS = {
+    'books': ('genre, total_copies, available_copies', [
+        ('book_titles', _BOOK_GENRE, '1'),
+        ('total_copies', _BOOK_GENRE, 'COALESCE({row}.total_copies, 0)'),
+        ('available_copies', _BOOK_GENRE, 'COALESCE({row}.available_copies, 0)'),
+        ('book_titles', f"'{STATS_ALL}'", '1'),
+        ('total_copies', f"'{STATS_ALL}'", 'COALESCE({row}.total_copies, 0)'),
+        ('available_copies', f"'{STATS_ALL}'", 'COALESCE({row}.available_copies, 0)'),
+    ]),
+    'readers': ('status', [
+        ('readers', f"'{STATS_ALL}'", '1'),
+        ('active_readers', f"'{STATS_ALL}'", '({row}.status != 0)'),
+    ]),
+    'loans': ('status', [
+        ('active_loans', f"'{STATS_ALL}'", "({row}.status = 'active')"),
+    ]),
+    'reservations': ('status', [
+        ('active_reservations', f"'{STATS_ALL}'", "({row}.status IN ('active', 'ready'))"),
+    ]),
+    'fines': ('status, amount', [
+        ('unpaid_fines', f"'{STATS_ALL}'", "({row}.status = 'unpaid')"),
+        ('unpaid_fines_amount', f"'{STATS_ALL}'", "({row}.status = 'unpaid') * COALESCE({row}.amount, 0)"),
+    ]),
+}
+
+def _stats_upsert(counters, row, sign):
+    """INSERT, прибавляющий вклад строки row к счетчикам (sign: '+' или '-')"""
+    values = ', '.join(f"('{metric}', {genre.format(row=row)}, {sign}{value.format(row=row)})"
+                       for metric, genre, value in counters)
+    return f'''
+        INSERT INTO library_stats (metric, genre, value) VALUES {values}
+        ON CONFLICT (metric, genre) DO UPDATE SET value = value + excluded.value;
+    '''
+
+def create_stats_triggers(cursor):
+    for table, (columns, counters) in STATS_COUNTERS.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table} BEGIN
+                {_stats_upsert(counters, 'new', '+')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table} BEGIN
+                {_stats_upsert(counters, 'old', '-')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_update AFTER UPDATE OF {columns} ON {table} BEGIN
+                {_stats_upsert(counters, 'old', '-')}
+                {_stats_upsert(counters, 'new', '+')}
+            END
+        ''')
+
+def add_library_stats(cursor, table, condition='1', params=(), sign='+'):
+    """Прибавляет к library_stats вклад строк table, отобранных условием condition.
+
+    sign='-' вычитает вклад. Так массовые операции, выполняемые со снятыми
+    триггерами статистики, учитывают целую пачку строк одним запросом
+    на счетчик вместо построчных срабатываний.
+    """
+    _, counters = STATS_COUNTERS[table]
+    for metric, genre, value in counters:
+        genre, value = genre.format(row=table), value.format(row=table)
+        cursor.execute(f'''
+            INSERT INTO library_stats (metric, genre, value)
+            SELECT '{metric}', {genre}, {sign}TOTAL({value}) FROM {table} WHERE {condition} GROUP BY {genre}
+            ON CONFLICT (metric, genre) DO UPDATE SET value = value + excluded.value
+        ''', params)
+
+def rebuild_library_stats(cursor):
+    """Пересчитывает library_stats с нуля по тем же выражениям, что и триггеры"""
+    cursor.execute('DELETE FROM library_stats')
+    for table in STATS_COUNTERS:
+        add_library_stats(cursor, table)
+
+@migration(6, 'Счетчики статистики библиотеки')
+def create_library_stats(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS library_stats (
+            metric TEXT NOT NULL,
+            genre TEXT NOT NULL,
+            value NUMERIC NOT NULL DEFAULT 0,
+            PRIMARY KEY (genre, metric)
+        ) WITHOUT ROWID
+    ''')
+    create_stats_triggers(cursor)
+    rebuild_library_stats(cursor)
+
+@migration(7, 'Начисление штрафов за просрочку по выдачам')
+def add_fine_accrual(cursor):
+    # Штраф, начисленный заданием, помнит выдачу и дату начисления;
+    # уникальный ключ делает повторный запуск за ту же дату безопасным
+    cursor.execute('ALTER TABLE fines ADD COLUMN loan_id INTEGER REFERENCES loans (loan_id)')
+    cursor.execute('ALTER TABLE fines ADD COLUMN accrual_date TEXT')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_fines_loan_accrual
+        ON fines (loan_id, accrual_date) WHERE loan_id IS NOT NULL
+    ''')
+
+# Бронирование в очереди: 'active' - ждет экземпляра, 'ready' - экземпляр
+# отложен для читателя до expires_at; далее 'fulfilled' (книга выдана),
+# 'expired' (не забрана вовремя) или 'cancelled'
+HOLD_STATUSES = ('active', 'ready')
+# Срок, который получают бронирования, ставшие готовыми при миграции
+# или при загрузке тестовых данных
+MIGRATED_HOLD_DAYS = 3
+
+def _holds_upsert(row, sign):
+    return f'''
+        INSERT INTO book_holds (book_id, waiting, ready)
+        VALUES ({row}.book_id, {sign}({row}.status = 'active'), {sign}({row}.status = 'ready'))
+        ON CONFLICT (book_id) DO UPDATE SET
+            waiting = waiting + excluded.waiting,
+            ready = ready + excluded.ready;
+    '''
+
+def rebuild_book_holds(cursor):
+    """Пересчитывает book_holds с нуля по текущим бронированиям"""
+    cursor.execute('DELETE FROM book_holds')
+    cursor.execute(f'''
+        INSERT INTO book_holds (book_id, waiting, ready)
+        SELECT book_id, SUM(status = 'active'), SUM(status = 'ready')
+        FROM reservations WHERE status IN {HOLD_STATUSES}
+        GROUP BY book_id
+    ''')
+
+def promote_waiting_holds(cursor):
+    """Откладывает свободные экземпляры для первых ожидающих по всем книгам.
+
+    Используется при переходе на очередь и для данных, вставленных
+    напрямую (тестовые данные); в работе очередь продвигает ReservationDAO.
+    """
+    cursor.execute('''
+        SELECT reservation_id FROM (
+            SELECT r.reservation_id, b.available_copies,
+                   ROW_NUMBER() OVER (PARTITION BY r.book_id ORDER BY r.reservation_id) AS position
+            FROM reservations r JOIN books b ON b.book_id = r.book_id
+            WHERE r.status = 'active'
+        ) WHERE position <= available_copies
+    ''')
+    ready = cursor.fetchall()
+    cursor.executemany(f'''
+        UPDATE reservations SET status = 'ready', expires_at = date('now', '+{MIGRATED_HOLD_DAYS} days')
+        WHERE reservation_id = ?
+    ''', ready)
+
+@migration(8, 'Очередь бронирований')
+def create_hold_queue(cursor):
+    cursor.execute('ALTER TABLE reservations ADD COLUMN expires_at TEXT')
+
+    # Раньше бронирование проверялось и вставлялось разными запросами,
+    # поэтому дубликаты возможны: оставляем самое раннее
+    cursor.execute('''
+        UPDATE reservations SET status = 'cancelled'
+        WHERE status = 'active' AND reservation_id > (
+            SELECT MIN(r.reservation_id) FROM reservations r
+            WHERE r.book_id = reservations.book_id
+              AND r.reader_id = reservations.reader_id
+              AND r.status = 'active'
+        )
+    ''')
+    if cursor.rowcount:
+        print(f"Отменено повторных бронирований: {cursor.rowcount}")
+
+    # Одно действующее бронирование книги на читателя
+    cursor.execute(f'''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_reservations_active_hold
+        ON reservations (book_id, reader_id) WHERE status IN {HOLD_STATUSES}
+    ''')
+    # Очередь книги по порядку постановки: следующий ожидающий - первая строка диапазона
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reservations_queue
+        ON reservations (book_id, status, reservation_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reservations_ready_expiry
+        ON reservations (expires_at) WHERE status = 'ready'
+    ''')
+
+    # Прежние бронирования делались только на доступные книги и экземпляр
+    # не откладывали: теперь первые в очереди получают свободные экземпляры
+    promote_waiting_holds(cursor)
+
+    # Число ожидающих и готовых бронирований по книгам
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS book_holds (
+            book_id INTEGER PRIMARY KEY,
+            waiting INTEGER NOT NULL DEFAULT 0,
+            ready INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    rebuild_book_holds(cursor)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS reservations_holds_insert AFTER INSERT ON reservations
+        WHEN new.status IN {HOLD_STATUSES} BEGIN
+            {_holds_upsert('new', '+')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS reservations_holds_delete AFTER DELETE ON reservations
+        WHEN old.status IN {HOLD_STATUSES} BEGIN
+            {_holds_upsert('old', '-')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS reservations_holds_update AFTER UPDATE OF book_id, status ON reservations
+        WHEN old.status IN {HOLD_STATUSES} OR new.status IN {HOLD_STATUSES} BEGIN
+            {_holds_upsert('old', '-')}
+            {_holds_upsert('new', '+')}
+        END
+    ''')
+
+    # Доступно для выдачи без бронирования: свободные экземпляры за вычетом отложенных
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS book_availability AS
+        SELECT b.book_id, b.total_copies, b.available_copies,
+               COALESCE(h.ready, 0) AS ready_holds,
+               COALESCE(h.waiting, 0) AS waiting_holds,
+               MAX(b.available_copies - COALESCE(h.ready, 0), 0) AS effective_available
+        FROM books b LEFT JOIN book_holds h ON h.book_id = b.book_id
+    ''')
+
+    # Готовые бронирования теперь тоже считаются действующими в статистике
+    for operation in ('insert', 'delete', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS reservations_stats_{operation}')
+    create_stats_triggers(cursor)
+    rebuild_library_stats(cursor)
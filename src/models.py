@@ -1,6 +1,48 @@
+from collections import namedtuple
 from datetime import datetime
 
-class Book:
+class Model:
+    """Базовый класс моделей.
+
+    Атрибуты хранятся в __slots__, а не в словаре экземпляра, что примерно
+    вдвое уменьшает память на строку в списках. Для каждой модели создается
+    также кортежный вид строки Model.Row (namedtuple с теми же полями и
+    тем же __str__) для массовых выборок только для чтения.
+    """
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Подкласс без собственных полей (см. partial) получает кортежный вид отдельно
+        if not cls.__slots__:
+            return
+        # Поля, не выбранные запросом, в кортежном виде равны None
+        row = namedtuple(f'{cls.__name__}Row', cls.__slots__, defaults=(None,) * len(cls.__slots__))
+        cls.Row = type(row.__name__, (row,), {'__slots__': (), '__str__': cls.__str__, 'to_dict': row._asdict})
+
+    @classmethod
+    def partial(cls, fields):
+        """Подкласс модели для выборки только полей fields.
+
+        to_dict у него и у его кортежного вида Row отдает лишь прочитанные
+        поля: непрочитанные равны None, но не выдаются за значения из базы.
+        """
+        fields = tuple(fields)
+
+        def to_dict(self):
+            return {name: getattr(self, name) for name in fields}
+
+        model = type(cls.__name__, (cls,), {'__slots__': (), 'to_dict': to_dict})
+        model.Row = type(cls.Row.__name__, (cls.Row,), {'__slots__': (), 'to_dict': to_dict})
+        return model
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class Book(Model):
+    __slots__ = ('book_id', 'title', 'author', 'isbn', 'year', 'publisher', 'genre', 'description',
+                 'total_copies', 'available_copies')
+
     def __init__(self, book_id=None, title="", author="", isbn="", year=None, publisher="", genre="", description="", total_copies=1, available_copies=1):
         self.book_id = book_id
         self.title = title
@@ -16,7 +58,9 @@ class Book:
     def __str__(self):
         return f"'{self.title}' - {self.author} ({self.year} | Доступно: {self.available_copies}/{self.total_copies})"
 
-class Reader:
+class Reader(Model):
+    __slots__ = ('reader_id', 'name', 'card_number', 'contact', 'password', 'status')
+
     def __init__(self, reader_id=None, name="", card_number="", contact="", password="", status=True):
         self.reader_id = reader_id
         self.name = name
@@ -28,8 +72,27 @@ class Reader:
     def __str__(self):
         status_str = "активен" if self.status else "заблокирован"
         return f"{self.name} (Карта: {self.card_number}) - {status_str})"
-    
-class Librarian:
+
+class ReaderFineSummary(Model):
+    # Читатель вместе со сводкой по неоплаченным штрафам для списка читателей
+    __slots__ = ('reader_id', 'name', 'card_number', 'status', 'unpaid_fines', 'unpaid_amount')
+
+    def __init__(self, reader_id=None, name="", card_number="", status=True, unpaid_fines=0, unpaid_amount=0.0):
+        self.reader_id = reader_id
+        self.name = name
+        self.card_number = card_number
+        self.status = status
+        self.unpaid_fines = unpaid_fines
+        self.unpaid_amount = unpaid_amount
+
+    def __str__(self):
+        status_str = "Активен" if self.status else "Заблокирован"
+        return (f"{self.name} | {self.card_number} | {status_str} | "
+                f"Неоплаченных штрафов: {self.unpaid_fines} на {self.unpaid_amount:.2f} руб.")
+
+class Librarian(Model):
+    __slots__ = ('librarian_id', 'name', 'username', 'password')
+
     def __init__(self, librarian_id=None, name="", username="", password=""):
         self.librarian_id = librarian_id
         self.name = name
@@ -39,8 +102,13 @@ class Librarian:
     def __str__(self):
         return f"{self.name} (Логин: {self.username})"
     
-class Loan:
-    def __init__(self, loan_id=None, book_id=None, reader_id=None, issue_date="", due_date="", return_date=None, status="active"):
+class Loan(Model):
+    # book_title и reader_name заполняются DAO из соединений с книгами и читателями
+    __slots__ = ('loan_id', 'book_id', 'reader_id', 'issue_date', 'due_date', 'return_date', 'status',
+                 'book_title', 'reader_name')
+
+    def __init__(self, loan_id=None, book_id=None, reader_id=None, issue_date="", due_date="", return_date=None, status="active",
+                 book_title=None, reader_name=None):
         self.loan_id = loan_id
         self.book_id = book_id
         self.reader_id = reader_id
@@ -48,29 +116,106 @@ class Loan:
         self.due_date = due_date
         self.return_date = return_date
         self.status = status
+        self.book_title = book_title
+        self.reader_name = reader_name
     
     def __str__(self):
         return f"Выдача #{self.loan_id} - до {self.due_date} ({self.status})"
     
-class Reservation:
-    def __init__(self, reservation_id=None, book_id=None, reader_id=None, reservation_date="", status="active"):
+class OverdueLoan(Model):
+    # Просроченная выдача; days_overdue вычисляется в запросе на дату проверки
+    __slots__ = ('loan_id', 'book_id', 'reader_id', 'issue_date', 'due_date', 'book_title', 'reader_name',
+                 'days_overdue')
+
+    def __init__(self, loan_id=None, book_id=None, reader_id=None, issue_date="", due_date="", book_title=None,
+                 reader_name=None, days_overdue=0):
+        self.loan_id = loan_id
+        self.book_id = book_id
+        self.reader_id = reader_id
+        self.issue_date = issue_date
+        self.due_date = due_date
+        self.book_title = book_title
+        self.reader_name = reader_name
+        self.days_overdue = days_overdue
+
+    def __str__(self):
+        return f"Выдача #{self.loan_id} - до {self.due_date} (просрочено на {self.days_overdue} дн.)"
+
+class Reservation(Model):
+    __slots__ = ('reservation_id', 'book_id', 'reader_id', 'reservation_date', 'status', 'book_title', 'reader_name')
+
+    def __init__(self, reservation_id=None, book_id=None, reader_id=None, reservation_date="", status="active",
+                 book_title=None, reader_name=None):
         self.reservation_id = reservation_id
         self.book_id = book_id
         self.reader_id = reader_id
         self.reservation_date = reservation_date
         self.status = status
+        self.book_title = book_title
+        self.reader_name = reader_name
     
     def __str__(self):
         return f"Бронирование #{self.reservation_id} от {self.reservation_date}"
 
-class Fine:
-    def __init__(self, fine_id=None, reader_id=None, amount=0.0, reason="", status="unpaid"):
+class Hold(Model):
+    # Бронирование читателя в очереди на книгу; queue_position - место среди
+    # ожидающих (для готового к выдаче бронирования не заполняется)
+    __slots__ = ('reservation_id', 'book_id', 'reader_id', 'reservation_date', 'status', 'expires_at',
+                 'book_title', 'queue_position')
+
+    def __init__(self, reservation_id=None, book_id=None, reader_id=None, reservation_date="", status="active",
+                 expires_at=None, book_title=None, queue_position=None):
+        self.reservation_id = reservation_id
+        self.book_id = book_id
+        self.reader_id = reader_id
+        self.reservation_date = reservation_date
+        self.status = status
+        self.expires_at = expires_at
+        self.book_title = book_title
+        self.queue_position = queue_position
+
+    @property
+    def is_ready(self):
+        return self.status == 'ready'
+
+    def __str__(self):
+        if self.is_ready:
+            return f"Бронирование #{self.reservation_id}: книга ждет вас до {self.expires_at}"
+        return f"Бронирование #{self.reservation_id}: место в очереди {self.queue_position}"
+
+class Fine(Model):
+    __slots__ = ('fine_id', 'reader_id', 'amount', 'reason', 'status', 'reader_name')
+
+    def __init__(self, fine_id=None, reader_id=None, amount=0.0, reason="", status="unpaid", reader_name=None):
         self.fine_id = fine_id
         self.reader_id = reader_id
         self.amount = amount
         self.reason = reason
         self.status = status
+        self.reader_name = reader_name
     
     def __str__(self):
         status_str = "оплачен" if self.status == 'paid' else "не оплачен"
-        return f"Штраф: {self.amount} руб. - {self.reason} ({status_str})"
\ No newline at end of file
+        return f"Штраф: {self.amount} руб. - {self.reason} ({status_str})"
+
+class AccountSummary(Model):
+    # Состояние учетной записи читателя, прочитанное одним снимком базы
+    __slots__ = ('reader', 'loans', 'reservations', 'fines')
+
+    def __init__(self, reader=None, loans=(), reservations=(), fines=()):
+        self.reader = reader
+        self.loans = list(loans)
+        self.reservations = list(reservations)
+        self.fines = list(fines)
+
+    @property
+    def unpaid_fines(self):
+        return [fine for fine in self.fines if fine.status == 'unpaid']
+
+    @property
+    def has_unpaid_fines(self):
+        return any(fine.status == 'unpaid' for fine in self.fines)
+
+    def __str__(self):
+        return (f"{self.reader}: выдач {len(self.loans)}, бронирований {len(self.reservations)}, "
+                f"неоплаченных штрафов {len(self.unpaid_fines)}")
@@ -0,0 +1,79 @@
+# pager.py
+"""Постраничный просмотр длинных списков в терминале"""
+
+class KeysetPager:
+    """Листает список страницами, запрашивая у DAO только текущую страницу.
+
+    fetch_page(after=..., before=..., limit=...) возвращает страницу,
+    упорядоченную по ключу; key(item) - ключ элемента; jump_key(text) -
+    ключ, с которого начинается переход по введенному тексту (необязательно).
+    """
+
+    def __init__(self, fetch_page, key, jump_key=None, page_size=20):
+        self.fetch_page = fetch_page
+        self.key = key
+        self.jump_key = jump_key
+        self.page_size = page_size
+        self.items = []
+        self.has_next = False
+        self.has_prev = False
+
+    def first(self):
+        self._load_after(None)
+        self.has_prev = False
+
+    def next(self):
+        if self.has_next and self.items:
+            self._load_after(self.key(self.items[-1]))
+            self.has_prev = True
+
+    def prev(self):
+        if not (self.has_prev and self.items):
+            return
+        # Берем на одну строку больше, чтобы узнать, есть ли страница еще раньше
+        items = self.fetch_page(before=self.key(self.items[0]), limit=self.page_size + 1)
+        self.has_prev = len(items) > self.page_size
+        self.items = items[-self.page_size:]
+        self.has_next = True
+
+    def jump(self, text):
+        key = self.jump_key(text)
+        self._load_after(key)
+        if not self.items:
+            # Ключ дальше конца списка - показываем последнюю страницу
+            self.items = self.fetch_page(before=key, limit=self.page_size)
+        self.has_prev = bool(self.items) and bool(self.fetch_page(before=self.key(self.items[0]), limit=1))
+
+    def _load_after(self, key):
+        items = self.fetch_page(after=key, limit=self.page_size + 1)
+        self.has_next = len(items) > self.page_size
+        self.items = items[:self.page_size]
+
+    def run(self, render):
+        """Показывает страницы, пока пользователь не выйдет; возвращает последнюю страницу.
+
+        render(items) выводит текущую страницу на экран.
+        """
+        self.first()
+        while True:
+            render(self.items)
+            if not (self.has_next or self.has_prev):
+                return self.items
+
+            options = []
+            if self.has_next:
+                options.append("n - следующая")
+            if self.has_prev:
+                options.append("p - предыдущая")
+            if self.jump_key is not None:
+                options.append("j - перейти")
+            choice = input(f"\n{', '.join(options)}, Enter - закончить просмотр: ").strip().lower()
+
+            if choice == 'n':
+                self.next()
+            elif choice == 'p':
+                self.prev()
+            elif choice == 'j' and self.jump_key is not None:
+                self.jump(input("Перейти к: ").strip())
+            elif choice == '':
+                return self.items
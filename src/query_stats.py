@@ -0,0 +1,379 @@
+# query_stats.py
+"""Статистика запросов SQLite: время по местам вызова, журнал медленных запросов.
+
+Включается переменной окружения LIBRARY_QUERY_STATS:
+    не задана, пустая или 0 - выключено: соединения открываются обычным
+        sqlite3.Connection, и на пути выполнения запросов нет ни одной
+        лишней проверки;
+    1 - статистика копится в памяти процесса (query_stats.stats);
+    путь к файлу - то же, плюс при завершении процесса снимок дописывается
+        в файл одной строкой JSON (несколько процессов пишут в один файл).
+
+Для каждой пары (место вызова, текст запроса) считаются число вызовов,
+суммарное и максимальное время, гистограмма задержек и число строк. Место
+вызова - функция вне этого модуля, выполнившая запрос, например
+LoanDAO.create_loan.<locals>.checkout. Время запроса SELECT включает
+выборку строк (fetchone/fetchall/перебор), но не обработку строк между
+ними. Запросы дольше LIBRARY_SLOW_QUERY_MS (по умолчанию 100 мс) попадают
+в журнал медленных запросов вместе с планом EXPLAIN QUERY PLAN.
+
+Самые затратные запросы из сохраненного файла:
+    LIBRARY_QUERY_STATS=/tmp/queries.jsonl python load_test.py --seconds 10
+    python query_stats.py /tmp/queries.jsonl --top 15
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+QUERY_STATS_ENV = 'LIBRARY_QUERY_STATS'
+SLOW_QUERY_ENV = 'LIBRARY_SLOW_QUERY_MS'
+DEFAULT_SLOW_MS = 100.0
+# Верхние границы корзин гистограммы, мс; последняя корзина - все, что дольше
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+SLOW_LOG_SIZE = 200
+SORT_KEYS = ('total', 'calls', 'mean', 'p95', 'max', 'rows')
+
+class StatementStats:
+    """Накопленные замеры одного запроса в одном месте вызова"""
+
+    def __init__(self, site, sql):
+        self.site = site
+        self.sql = sql
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+        self.plan = None
+
+    def add(self, elapsed_ms, rows):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        bucket = 0
+        while bucket < len(BUCKETS_MS) and elapsed_ms > BUCKETS_MS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def to_dict(self):
+        return {'site': self.site, 'sql': self.sql, 'calls': self.calls, 'total_ms': round(self.total_ms, 3),
+                'max_ms': round(self.max_ms, 3), 'rows': self.rows, 'histogram': self.histogram,
+                'plan': self.plan}
+
+class QueryStats:
+    """Реестр замеров запросов процесса; методы безопасны для нескольких потоков"""
+
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS, path=None):
+        self.slow_ms = slow_ms
+        self.path = path
+        self.statements = {}
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._lock = threading.Lock()
+
+    def record(self, conn, site, sql, parameters, elapsed_ms, rows):
+        key = (site, sql)
+        with self._lock:
+            entry = self.statements.get(key)
+            if entry is None:
+                entry = self.statements[key] = StatementStats(site, sql)
+            entry.add(elapsed_ms, rows)
+            capture_plan = elapsed_ms >= self.slow_ms and entry.plan is None
+        if elapsed_ms < self.slow_ms:
+            return
+        # План запрашивается один раз на запрос, вне блокировки реестра
+        plan = explain(conn, sql, parameters) if capture_plan else entry.plan
+        with self._lock:
+            if capture_plan:
+                entry.plan = plan
+            self.slow.append({'at': time.strftime('%Y-%m-%d %H:%M:%S'), 'site': site, 'sql': sql,
+                              'ms': round(elapsed_ms, 3), 'rows': rows, 'plan': plan})
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.slow.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {'pid': os.getpid(), 'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'slow_ms': self.slow_ms, 'buckets_ms': list(BUCKETS_MS),
+                    'statements': [entry.to_dict() for entry in self.statements.values()],
+                    'slow': list(self.slow)}
+
+    def save(self, path=None):
+        """Дописывает снимок в файл строкой JSON"""
+        path = path or self.path
+        snapshot = self.snapshot()
+        if not snapshot['statements']:
+            return
+        # Одна запись в режиме O_APPEND: строки разных процессов не перемешиваются
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(snapshot, ensure_ascii=False) + '\n')
+
+def explain(conn, sql, parameters):
+    """Строки EXPLAIN QUERY PLAN запроса или None, если план получить нельзя"""
+    try:
+        # Обычный курсор, чтобы сам EXPLAIN не попал в статистику
+        cursor = sqlite3.Cursor(conn)
+        cursor.row_factory = None
+        return [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters)]
+    except (sqlite3.Error, ValueError, TypeError):
+        return None
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    code = frame.f_code
+    # co_qualname есть с Python 3.11; в старых версиях - только имя функции
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+
+class _ParameterStream:
+    """Строки параметров executemany без копирования: число строк и первая строка"""
+
+    def __init__(self, seq_of_parameters):
+        self._source = seq_of_parameters
+        self.first = ()
+        self.count = 0
+
+    def __iter__(self):
+        for parameters in self._source:
+            if not self.count:
+                self.first = parameters
+            self.count += 1
+            yield parameters
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время выполнения и выборки каждого запроса"""
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        site = _call_site()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._pending = [site, sql, parameters, (time.perf_counter() - started) * 1000, 0]
+        if self.description is None:
+            self._finish(max(self.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        site = _call_site()
+        # Параметры могут быть потоком (импорт): не копируем их в список,
+        # а пропускаем через счетчик, запоминая первую строку для плана
+        stream = _ParameterStream(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, stream)
+        finally:
+            self._pending = [site, sql, stream.first, (time.perf_counter() - started) * 1000, 0]
+        self._finish(self.rowcount if self.rowcount >= 0 else stream.count)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(started, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _fetched(self, started, rows, done):
+        pending = self._pending
+        if pending is None:
+            return
+        pending[3] += (time.perf_counter() - started) * 1000
+        pending[4] += rows
+        if done:
+            self._finish()
+
+    def _finish(self, rows=None):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        site, sql, parameters, elapsed_ms, fetched = pending
+        if stats is not None:
+            stats.record(self.connection, site, sql, parameters, elapsed_ms,
+                         fetched if rows is None else rows)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, все курсоры которого ведут статистику запросов"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute создает курсор в обход cursor(), поэтому переопределены и они
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connection_factory():
+    """Класс соединения для sqlite3.connect: с замерами, если статистика включена"""
+    return InstrumentedConnection if stats is not None else sqlite3.Connection
+
+def enable(slow_ms=None, path=None):
+    """Включает статистику в процессе; действует на соединения, открытые после вызова"""
+    global stats
+    if stats is None:
+        stats = QueryStats(DEFAULT_SLOW_MS if slow_ms is None else slow_ms, path)
+        if path:
+            atexit.register(stats.save)
+    elif slow_ms is not None:
+        stats.slow_ms = slow_ms
+    return stats
+
+def disable():
+    global stats
+    stats = None
+
+def _from_env():
+    value = os.environ.get(QUERY_STATS_ENV, '').strip()
+    if value in ('', '0'):
+        return None
+    slow_ms = float(os.environ.get(SLOW_QUERY_ENV, DEFAULT_SLOW_MS))
+    return enable(slow_ms, None if value == '1' else value)
+
+stats = None
+_from_env()
+
+def load_snapshots(path):
+    """Объединяет снимки из файла: замеры одного запроса в одном месте складываются"""
+    merged = {}
+    slow = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            snapshot = json.loads(line)
+            for item in snapshot['statements']:
+                entry = merged.get((item['site'], item['sql']))
+                if entry is None:
+                    merged[(item['site'], item['sql'])] = dict(item, histogram=list(item['histogram']))
+                    continue
+                entry['calls'] += item['calls']
+                entry['total_ms'] += item['total_ms']
+                entry['max_ms'] = max(entry['max_ms'], item['max_ms'])
+                entry['rows'] += item['rows']
+                entry['histogram'] = [a + b for a, b in zip(entry['histogram'], item['histogram'])]
+                entry['plan'] = entry['plan'] or item['plan']
+            slow.extend(snapshot['slow'])
+    return list(merged.values()), slow
+
+def histogram_percentile(histogram, percent):
+    """Оценка процентиля сверху: граница корзины, в которую он попадает"""
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    threshold = percent / 100 * total
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if seen >= threshold:
+            return BUCKETS_MS[bucket] if bucket < len(BUCKETS_MS) else float('inf')
+    return float('inf')
+
+def _sort_value(entry, key):
+    if key == 'mean':
+        return entry['total_ms'] / entry['calls']
+    if key == 'p95':
+        return histogram_percentile(entry['histogram'], 95)
+    return entry[{'total': 'total_ms', 'max': 'max_ms'}.get(key, key)]
+
+def _one_line(sql, width):
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= width else sql[:width - 3] + '...'
+
+def print_report(statements, slow, top=20, sort='total', slow_count=10):
+    print("=" * 50)
+    print("САМЫЕ ЗАТРАТНЫЕ ЗАПРОСЫ")
+    print("=" * 50)
+    grand_total = sum(entry['total_ms'] for entry in statements) or 1
+    ranked = sorted(statements, key=lambda entry: _sort_value(entry, sort), reverse=True)
+    print(f"  {'всего, мс':>11}{'доля':>7}{'вызовов':>9}{'средн., мс':>12}{'p95 ≤, мс':>11}{'макс, мс':>10}"
+          f"{'строк/выз.':>11}")
+    for entry in ranked[:top]:
+        mean = entry['total_ms'] / entry['calls']
+        print(f"  {entry['total_ms']:>11.1f}{entry['total_ms'] / grand_total:>7.1%}{entry['calls']:>9}"
+              f"{mean:>12.3f}{histogram_percentile(entry['histogram'], 95):>11g}{entry['max_ms']:>10.1f}"
+              f"{entry['rows'] / entry['calls']:>11.1f}")
+        print(f"      {entry['site']}")
+        print(f"      {_one_line(entry['sql'], 100)}")
+        for detail in entry['plan'] or []:
+            print(f"        план: {detail}")
+
+    if slow and slow_count:
+        print("-" * 50)
+        print(f"Медленные запросы (последние {min(slow_count, len(slow))} из {len(slow)}):")
+        for item in sorted(slow, key=lambda item: item['at'])[-slow_count:]:
+            print(f"  {item['at']}  {item['ms']:.1f} мс, строк: {item['rows']}  {item['site']}")
+            print(f"      {_one_line(item['sql'], 100)}")
+            for detail in item['plan'] or []:
+                print(f"        план: {detail}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Отчет о самых затратных запросах")
+    parser.add_argument('path', help=f"файл статистики (значение {QUERY_STATS_ENV} при замерах)")
+    parser.add_argument('--top', type=int, default=20, help="сколько запросов показать (по умолчанию: %(default)s)")
+    parser.add_argument('--sort', choices=SORT_KEYS, default='total',
+                        help="порядок: суммарное время, вызовы, среднее, p95, максимум, строки "
+                             "(по умолчанию: %(default)s)")
+    parser.add_argument('--slow', type=int, default=10,
+                        help="сколько последних медленных запросов показать (по умолчанию: %(default)s)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.path):
+        print(f"Файл {args.path} не найден")
+        return 1
+    statements, slow = load_snapshots(args.path)
+    print_report(statements, slow, args.top, args.sort, args.slow)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,24 @@
 # reader_interface.py
-from data_access import BookDAO, ReaderDAO, ReservationDAO
+from data_access import BookDAO, ReaderDAO, ReservationDAO, ReaderAccountCache
+from pager import KeysetPager
 import os
 
 class ReaderInterface:
     def __init__(self, reader):
         self.reader = reader
-        self.run()
+        # Сводка читателя перечитывается только после изменений в базе
+        self.account = ReaderAccountCache(reader.reader_id)
+        try:
+            self.run()
+        finally:
+            self.account.close()
     
     def clear_screen(self):
         os.system('cls' if os.name == 'nt' else 'clear')
     
     def display_header(self):
         # Проверяем актуальные задолженности
-        has_unpaid_fines = ReaderDAO.has_unpaid_fines(self.reader.reader_id)
+        has_unpaid_fines = self.account.get().has_unpaid_fines
         status_text = "Активен" if not has_unpaid_fines else "Заблокирован (неоплаченные штрафы)"
         infowr1 = "БИБЛИОТЕЧНАЯ СИСТЕМА - ЧИТАТЕЛЬ"
         infowr2 = f"Пользователь: {self.reader.name} (Карта: {self.reader.card_number})"
@@ -64,11 +70,8 @@ class ReaderInterface:
                 try:
                     book_index = int(choice) - 1
                     if 0 <= book_index < len(books):
-                        selected_book = books[book_index]
-                        if selected_book.available_copies > 0:
-                            self.reserve_selected_book(selected_book)
-                        else:
-                            print("Эта книга недоступна для бронирования!")
+                        # Недоступную книгу тоже можно забронировать - читатель встанет в очередь
+                        self.reserve_selected_book(books[book_index])
                     else:
                         print("Неверный номер книги!")
                 except ValueError:
@@ -77,18 +80,24 @@ class ReaderInterface:
         return books
     
     def show_all_books(self):
-        self.clear_screen()
-        self.display_header()
-        print("\nВСЕ КНИГИ В БИБЛИОТЕКЕ")
-        
-        books = BookDAO.get_all_books()
-        if not books:
-            print("В библиотеке пока нет книг!")
-            return
-        
-        for i, book in enumerate(books, 1):
-            status = "Доступна" if book.available_copies > 0 else "Нет в наличии"
-            print(f"{i}. {book.title} - {book.author} | {status}")
+        def render(books):
+            self.clear_screen()
+            self.display_header()
+            print("\nВСЕ КНИГИ В БИБЛИОТЕКЕ")
+
+            if not books:
+                print("В библиотеке пока нет книг!")
+                return
+
+            for i, book in enumerate(books, 1):
+                status = "Доступна" if book.available_copies > 0 else "Нет в наличии"
+                print(f"{i}. {book.title} - {book.author} | {status}")
+
+        # Каталог листается по страницам, в памяти только текущая страница
+        pager = KeysetPager(BookDAO.get_books_page,
+                            key=lambda book: (book.title, book.book_id),
+                            jump_key=lambda title: (title, 0))
+        pager.run(render)
     
     def reserve_book(self):
         self.clear_screen()
@@ -96,7 +105,7 @@ class ReaderInterface:
         print("\nБРОНИРОВАНИЕ КНИГИ")
         
         # Проверяем есть ли неоплаченные штрафы (актуальная блокировка)
-        has_unpaid_fines = ReaderDAO.has_unpaid_fines(self.reader.reader_id)
+        has_unpaid_fines = self.account.get().has_unpaid_fines
         
         if has_unpaid_fines:
             print("\nВНИМАНИЕ: У вас есть неоплаченные штрафы!")
@@ -149,10 +158,10 @@ class ReaderInterface:
         
         if confirm in ['да', 'д', 'y', 'yes', '1']:
             success, message = ReaderDAO.reserve_book(book.book_id, self.reader.reader_id)
+            self.account.invalidate()
             
             if success:
-                print(f"Успех: {message}")
-                print(f"Книга '{book.title}' успешно забронирована!")
+                print(f"Книга '{book.title}' забронирована: {message}")
             else:
                 print(f"Ошибка: {message}")
         else:
@@ -163,7 +172,7 @@ class ReaderInterface:
         self.display_header()
         print("\nМОИ ТЕКУЩИЕ ВЫДАЧИ")
         
-        loans = ReaderDAO.get_reader_loans(self.reader.reader_id)
+        loans = self.account.get().loans
         if not loans:
             print("У вас нет текущих выдач")
             return
@@ -179,7 +188,7 @@ class ReaderInterface:
         self.display_header()
         print("\nМОИ БРОНИРОВАНИЯ")
         
-        reservations = ReaderDAO.get_reader_reservations(self.reader.reader_id)
+        reservations = self.account.get().reservations
         if not reservations:
             print("У вас нет активных бронирований")
             return
@@ -187,6 +196,10 @@ class ReaderInterface:
         for i, reservation in enumerate(reservations, 1):
             print(f"{i}. Книга: '{reservation.book_title}'")
             print(f"   Забронирована: {reservation.reservation_date}")
+            if reservation.is_ready:
+                print(f"   Экземпляр отложен, заберите до {reservation.expires_at}")
+            else:
+                print(f"   Место в очереди: {reservation.queue_position}")
             print()
         
         # Опция отмены бронирования
@@ -196,7 +209,9 @@ class ReaderInterface:
                 confirm = input("Подтвердить отмену бронирования? (да/нет): ").strip().lower()
                 if confirm in ['1', 'да', 'д', 'y', 'yes']:
                     reservation_id = reservations[int(choice)-1].reservation_id
-                    if ReservationDAO.cancel_reservation(reservation_id):
+                    cancelled = ReservationDAO.cancel_reservation(reservation_id)
+                    self.account.invalidate()
+                    if cancelled:
                         print("Бронирование отменено!")
     
     def show_my_fines(self):
@@ -204,12 +219,13 @@ class ReaderInterface:
         self.display_header()
         print("\nМОИ ШТРАФЫ")
         
-        fines = ReaderDAO.get_reader_fines(self.reader.reader_id)
+        account = self.account.get()
+        fines = account.fines
         if not fines:
             print("У вас нет штрафов")
             return
         
-        unpaid_fines = [f for f in fines if f.status == 'unpaid']
+        unpaid_fines = account.unpaid_fines
         total_unpaid = sum(fine.amount for fine in unpaid_fines)
         
         print(f"\nОбщая сумма неоплаченных штрафов: {total_unpaid} руб.")
@@ -0,0 +1,12 @@
+# rebuild_stats.py
+from data_access import StatsDAO
+
+def rebuild_stats():
+    # Счетчики library_stats ведут триггеры; пересчет нужен после правки
+    # данных с отключенными триггерами, например массовой загрузки
+    success, message = StatsDAO.rebuild()
+    print(message)
+    return success
+
+if __name__ == "__main__":
+    rebuild_stats()
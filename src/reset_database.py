@@ -1,13 +1,21 @@
 import os
 
 def reset_database():
-    # Удаляем старый файл базы данных
-    if os.path.exists('library.db'):
-        os.remove('library.db')
+    # Путь тот же, что у database.db; сам модуль импортируем только после
+    # удаления, иначе он сразу откроет старую базу
+    path = os.environ.get('LIBRARY_DB', 'library.db')
+    # Удаляем старый файл базы данных вместе с журналом WAL: оставшийся
+    # -wal применился бы к новой пустой базе
+    if os.path.exists(path):
+        os.remove(path)
         print("Старая база данных удалена")
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
     
-    # Пересоздаем базу
+    # Пересоздаем базу: схема создается миграциями, затем добавляем тестовые данные
     from database import db
+    db.add_sample_data()
     print("Новая база данных создана")
 
 if __name__ == "__main__":
@@ -0,0 +1,10 @@
+# seed_database.py
+from database import db
+
+def seed_database():
+    # Тестовые данные добавляются только по явной команде,
+    # add_sample_data сама пропускает уже заполненную базу
+    db.add_sample_data()
+
+if __name__ == "__main__":
+    seed_database()
@@ -0,0 +1,434 @@
+# server.py
+"""HTTP/JSON-сервис над DAO для терминалов читателей и библиотекарей.
+
+Терминалы обращаются к одному процессу вместо того, чтобы каждый открывал
+файл базы сам: соединения пула остаются прогретыми, а число одновременно
+выполняемых запросов ограничено пулом рабочих потоков. Только стандартная
+библиотека; по умолчанию сервис слушает только localhost:
+    cd src
+    python server.py --port 8080 --workers 8
+
+Соединения HTTP/1.1 держатся открытыми (keep-alive). Списки отдаются
+страницами: {"items": [...], "next": "<курсор>"}; курсор передается в
+параметре after следующего запроса. Время обработки запроса возвращается
+в заголовке Server-Timing и пишется в журнал.
+
+Маршруты:
+    GET    /books?after=&limit=          GET  /books/search?q=
+    GET    /books/<id>                   POST /books
+    POST   /books/<id>/copies            {"change": n}
+    POST   /auth/reader                  {"card_number", "password"}
+    POST   /auth/librarian               {"username", "password"}
+    GET    /readers?after=&limit=        GET  /readers/<id>
+    GET    /readers/<id>/loans|reservations|fines|summary
+    PUT    /readers/<id>/status          {"active": true|false}
+    GET    /loans?after=&limit=          GET  /loans/overdue?as_of=&after=&limit=
+    POST   /loans                        {"book_id", "reader_id", "days"}
+    POST   /loans/<id>/return
+    GET    /reservations?after=&limit=   POST /reservations {"book_id", "reader_id"}
+    DELETE /reservations/<id>            POST /reservations/expire {"as_of"}
+    GET    /fines?after=&limit=          POST /fines {"reader_id", "amount", "reason"}
+    PUT    /fines/<id>/status            {"status": "paid"|"unpaid"}
+    POST   /fines/accrue                 {"as_of", "rate"}
+    GET    /stats
+"""
+import argparse
+import base64
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from database import db, PoolExhaustedError
+from data_access import (AuthDAO, BookDAO, ReaderDAO, LoanDAO, ReservationDAO, FineDAO, StatsDAO,
+                         FINE_DAILY_RATE)
+from models import Book
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 500
+MAX_BODY_SIZE = 1024 * 1024
+# Сколько секунд простаивающее keep-alive соединение занимает рабочий поток
+IDLE_TIMEOUT = 15
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def _to_json(value):
+    # Модели и их кортежный вид Row отдаются словарями только с прочитанными
+    # запросом полями (см. Model.partial); пароли из ответов исключаются.
+    # Row - namedtuple, и json записал бы его списком, поэтому ответ
+    # приводится к словарям и спискам до сериализации
+    if hasattr(value, 'to_dict'):
+        data = value.to_dict()
+        data.pop('password', None)
+        return {key: _to_json(item) for key, item in data.items()}
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+def _is_scalar(value):
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+def decode_cursor(cursor, size=1):
+    """Ключ страницы из курсора: значение при size=1, иначе кортеж из size значений"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        key = None
+    if size == 1:
+        valid = _is_scalar(key)
+    else:
+        valid = isinstance(key, list) and len(key) == size and all(_is_scalar(item) for item in key)
+    if not valid:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Неверный курсор страницы")
+    return key if size == 1 else tuple(key)
+
+def parse_date(value, name):
+    """Дата 'YYYY-MM-DD' из запроса; None - не указана (DAO возьмет сегодняшнюю)"""
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Значение {name} должно быть датой ГГГГ-ММ-ДД") from None
+
+class Request:
+    """Разобранный запрос: параметры пути, строки запроса и тело JSON"""
+
+    def __init__(self, params, query, body):
+        self.params = params
+        self.query = query
+        self.body = body
+
+    def arg(self, name, default=None):
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def int_arg(self, name, default=None):
+        value = self.arg(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Параметр {name} должен быть числом") from None
+
+    def id(self):
+        return int(self.params['id'])
+
+    def field(self, name, kind=None, default=...):
+        if name not in self.body:
+            if default is ...:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Не указано поле {name}")
+            return default
+        value = self.body[name]
+        if kind is bool:
+            # bool("false") истинно, поэтому принимаются только логические значения JSON
+            if not isinstance(value, bool):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Поле {name} должно быть true или false")
+            return value
+        if kind is not None:
+            try:
+                value = kind(value)
+            except (TypeError, ValueError):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Неверное значение поля {name}") from None
+        return value
+
+def paged(request, fetch_page, key, key_size=1):
+    """Страница списка: fetch_page(after=..., limit=...) и курсор следующей страницы.
+
+    key(item) - ключ последней строки страницы из key_size значений.
+    """
+    limit = min(max(request.int_arg('limit', DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    cursor = request.arg('after')
+    after = decode_cursor(cursor, key_size) if cursor else None
+    # Строка сверх страницы показывает, есть ли следующая
+    items = fetch_page(after=after, limit=limit + 1)
+    following = encode_cursor(key(items[limit - 1])) if len(items) > limit else None
+    return HTTPStatus.OK, {'items': items[:limit], 'next': following}
+
+def found(value):
+    if value is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "Не найдено")
+    return HTTPStatus.OK, value
+
+def outcome(result, status=HTTPStatus.OK):
+    # Методы записи DAO возвращают (успех, сообщение); отказ - конфликт с состоянием базы
+    success, message = result
+    return (status if success else HTTPStatus.CONFLICT), {'ok': success, 'message': message}
+
+def add_book(request):
+    total = request.field('total_copies', int, 1)
+    book = Book(title=request.field('title', str), author=request.field('author', str, ''),
+                isbn=request.field('isbn', str, None), year=request.field('year', int, None),
+                publisher=request.field('publisher', str, ''), genre=request.field('genre', str, ''),
+                description=request.field('description', str, ''), total_copies=total,
+                available_copies=request.field('available_copies', int, total))
+    if not book.title.strip():
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Не указано название книги")
+    try:
+        BookDAO.add_book(book)
+    except sqlite3.IntegrityError:
+        raise HTTPError(HTTPStatus.CONFLICT, "Книга с таким ISBN уже есть в каталоге") from None
+    return HTTPStatus.CREATED, {'ok': True, 'message': "Книга добавлена"}
+
+def update_book_copies(request):
+    if BookDAO.get_book_by_id(request.id()) is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "Книга не найдена")
+    BookDAO.update_book_copies(request.id(), request.field('change', int))
+    return HTTPStatus.OK, {'ok': True, 'message': "Количество экземпляров обновлено"}
+
+def authenticate(authenticate_user, login_field):
+    def handler(request):
+        user = authenticate_user(request.field(login_field, str), request.field('password', str))
+        if user is None:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "Неверные данные для входа")
+        return HTTPStatus.OK, user
+    return handler
+
+def account_summary(request):
+    summary = ReaderDAO.get_account_summary(request.id())
+    return found(summary if summary.reader is not None else None)
+
+def cancel_reservation(request):
+    if ReservationDAO.cancel_reservation(request.id()):
+        return HTTPStatus.OK, {'ok': True, 'message': "Бронирование отменено"}
+    raise HTTPError(HTTPStatus.NOT_FOUND, "Бронирование не найдено")
+
+def update_fine_status(request):
+    status = request.field('status', str)
+    if status not in ('paid', 'unpaid'):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Статус штрафа: paid или unpaid")
+    return outcome(FineDAO.update_fine_status(request.id(), status))
+
+# (метод, шаблон пути, обработчик); <id> - числовой параметр пути
+ROUTES = [
+    ('GET', '/books', lambda r: paged(r, BookDAO.get_books_page, lambda b: (b.title, b.book_id), 2)),
+    ('GET', '/books/search', lambda r: (HTTPStatus.OK, {'items': BookDAO.search_books(r.arg('q', ''))})),
+    ('GET', '/books/<id>', lambda r: found(BookDAO.get_book_by_id(r.id()))),
+    ('POST', '/books', add_book),
+    ('POST', '/books/<id>/copies', update_book_copies),
+    ('POST', '/auth/reader', authenticate(AuthDAO.authenticate_reader, 'card_number')),
+    ('POST', '/auth/librarian', authenticate(AuthDAO.authenticate_librarian, 'username')),
+    ('GET', '/readers', lambda r: paged(r, ReaderDAO.get_readers_with_fine_summary, lambda rd: rd.reader_id)),
+    ('GET', '/readers/<id>', lambda r: found(ReaderDAO.get_reader_by_id(r.id()))),
+    ('GET', '/readers/<id>/loans', lambda r: (HTTPStatus.OK, {'items': ReaderDAO.get_reader_loans(r.id())})),
+    ('GET', '/readers/<id>/reservations',
+     lambda r: (HTTPStatus.OK, {'items': ReaderDAO.get_reader_reservations(r.id())})),
+    ('GET', '/readers/<id>/fines', lambda r: (HTTPStatus.OK, {'items': ReaderDAO.get_reader_fines(r.id())})),
+    ('GET', '/readers/<id>/summary', account_summary),
+    ('PUT', '/readers/<id>/status',
+     lambda r: outcome(ReaderDAO.update_reader_status(r.id(), r.field('active', bool)))),
+    ('GET', '/loans', lambda r: paged(r, LoanDAO.get_active_loans_page, lambda l: l.loan_id)),
+    ('GET', '/loans/overdue',
+     lambda r: paged(r, lambda after, limit: LoanDAO.get_overdue_loans(parse_date(r.arg('as_of'), 'as_of'),
+                                                                       after=after, limit=limit),
+                     lambda l: (l.due_date, l.loan_id), 2)),
+    ('POST', '/loans', lambda r: outcome(LoanDAO.create_loan(r.field('book_id', int), r.field('reader_id', int),
+                                                             r.field('days', int, 30)), HTTPStatus.CREATED)),
+    ('POST', '/loans/<id>/return', lambda r: outcome(LoanDAO.return_loan(r.id()))),
+    ('GET', '/reservations', lambda r: paged(r, ReservationDAO.get_reservations_page, lambda rs: rs.reservation_id)),
+    ('POST', '/reservations', lambda r: outcome(ReservationDAO.place_hold(r.field('book_id', int),
+                                                                          r.field('reader_id', int)),
+                                                HTTPStatus.CREATED)),
+    ('DELETE', '/reservations/<id>', cancel_reservation),
+    ('POST', '/reservations/expire', lambda r: outcome(ReservationDAO.expire_holds(
+        parse_date(r.field('as_of', default=None), 'as_of')))),
+    ('GET', '/fines', lambda r: paged(r, FineDAO.get_fines_page, lambda f: f.fine_id)),
+    ('POST', '/fines', lambda r: outcome(FineDAO.add_fine_with_status_update(
+        r.field('reader_id', int), r.field('amount', float), r.field('reason', str)), HTTPStatus.CREATED)),
+    ('PUT', '/fines/<id>/status', update_fine_status),
+    ('POST', '/fines/accrue', lambda r: outcome(FineDAO.accrue_overdue_fines(
+        parse_date(r.field('as_of', default=None), 'as_of'), r.field('rate', float, FINE_DAILY_RATE)))),
+    ('GET', '/stats', lambda r: (HTTPStatus.OK, StatsDAO.get_summary())),
+]
+
+def compile_routes(routes):
+    compiled = []
+    for method, pattern, handler in routes:
+        regex = re.compile('^' + pattern.replace('<id>', r'(?P<id>\d+)') + '$')
+        compiled.append((method, regex, handler))
+    return compiled
+
+class LibraryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'LibraryHTTP/1.0'
+    timeout = IDLE_TIMEOUT
+    routes = compile_routes(ROUTES)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        try:
+            body = self.read_body()
+            handler, params = self.route(method, url.path)
+            status, payload = handler(Request(params, parse_qs(url.query), body))
+        except HTTPError as e:
+            status, payload = e.status, {'error': e.message}
+        except PoolExhaustedError as e:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)}
+        except sqlite3.IntegrityError as e:
+            # Запись нарушает ограничение схемы - конфликт с состоянием базы, а не сбой сервера
+            status, payload = HTTPStatus.CONFLICT, {'error': f"Нарушено ограничение базы: {e}"}
+        except Exception as e:
+            self.log_error("Ошибка обработки %s %s: %r", method, url.path, e)
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Внутренняя ошибка сервера"}
+        elapsed = (time.perf_counter() - started) * 1000
+        self.send_json(status, payload, elapsed)
+        self.log_message('"%s %s" %d %.2f мс', method, self.path, status, elapsed)
+
+    def route(self, method, path):
+        allowed = False
+        for route_method, regex, handler in self.routes:
+            match = regex.match(path)
+            if match:
+                if route_method == method:
+                    return handler, match.groupdict()
+                allowed = True
+        if allowed:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Метод не поддерживается")
+        raise HTTPError(HTTPStatus.NOT_FOUND, "Маршрут не найден")
+
+    def read_body(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Непрочитанное тело осталось бы в сокете, а rfile.read(-1) ждал бы закрытия соединения
+            self.close_connection = True
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Неверный заголовок Content-Length")
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Слишком большое тело запроса")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Тело запроса должно быть JSON") from None
+        if not isinstance(body, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Тело запроса должно быть объектом JSON")
+        return body
+
+    def send_json(self, status, payload, elapsed):
+        data = json.dumps(_to_json(payload), ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Server-Timing', f'app;dur={elapsed:.2f}')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+class LibraryHTTPServer(HTTPServer):
+    """HTTP-сервер, обслуживающий соединения в ограниченном пуле потоков.
+
+    Каждое соединение (со всеми его keep-alive запросами) обрабатывает один
+    поток пула. Если в очереди уже max_pending соединений, новое сразу
+    получает ответ 503 вместо того, чтобы ждать неограниченно долго.
+    """
+
+    def __init__(self, address, workers=8, max_pending=64, quiet=False):
+        super().__init__(address, LibraryRequestHandler)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.quiet = quiet
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='library-http')
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Каждому рабочему потоку - свое соединение каждого пула без ожидания
+        db.pool.max_size = max(db.pool.max_size, workers)
+        db.read_pool.max_size = max(db.read_pool.max_size, workers)
+
+    def process_request(self, request, client_address):
+        # Под блокировкой только решение: ответ 503 медленному клиенту
+        # не должен задерживать прием остальных соединений
+        with self._lock:
+            admitted = self._pending < self.workers + self.max_pending
+            if admitted:
+                self._pending += 1
+        if not admitted:
+            self.reject(request)
+            return
+        self._executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self._pending -= 1
+
+    def reject(self, request):
+        data = json.dumps({'error': "Сервер перегружен"}, ensure_ascii=False).encode('utf-8')
+        try:
+            request.sendall(b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json; charset=utf-8\r\n'
+                            b'Connection: close\r\nContent-Length: ' + str(len(data)).encode('ascii') +
+                            b'\r\n\r\n' + data)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON-сервис библиотеки")
+    parser.add_argument('--host', default='127.0.0.1', help="адрес (по умолчанию: %(default)s)")
+    parser.add_argument('--port', type=int, default=8080, help="порт (по умолчанию: %(default)s)")
+    parser.add_argument('--workers', type=int, default=8, help="рабочих потоков (по умолчанию: %(default)s)")
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help="соединений в очереди, сверх которых отвечать 503 (по умолчанию: %(default)s)")
+    parser.add_argument('--quiet', action='store_true', help="не писать журнал запросов")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = LibraryHTTPServer((args.host, args.port), workers=args.workers, max_pending=args.max_pending,
+                               quiet=args.quiet)
+    print(f"Сервис библиотеки: http://{args.host}:{server.server_port}/ (потоков: {args.workers})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nОстановка сервиса")
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
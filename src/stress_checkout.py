@@ -0,0 +1,135 @@
+# stress_checkout.py
+"""Нагрузочная проверка выдачи книг: параллельные выдачи не продают лишнего.
+
+На временной базе создается книга с заданным числом экземпляров, после
+чего несколько процессов, каждый с несколькими потоками, одновременно
+пытаются ее выдать. Проверяется, что успешных выдач ровно столько, сколько
+было экземпляров, остаток не ушел в минус, а после возврата всех выдач
+фонд восстановился. При нарушении скрипт завершается с кодом 1.
+    python stress_checkout.py --copies 50 --processes 4 --threads 8 --attempts 25
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+def make_scratch_database():
+    scratch = os.path.join(tempfile.mkdtemp(), 'stress_checkout.db')
+    os.environ['LIBRARY_DB'] = scratch
+    return scratch
+
+def checkout_worker(book_id, reader_id, threads, attempts):
+    """Запускается в отдельном процессе; возвращает (успешных выдач, отказов, ошибок)"""
+    from data_access import LoanDAO
+
+    results = {'ok': 0, 'refused': 0, 'errors': []}
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def run():
+        start.wait()
+        for _ in range(attempts):
+            success, message = LoanDAO.create_loan(book_id, reader_id)
+            with lock:
+                if success:
+                    results['ok'] += 1
+                elif message == "Нет доступных экземпляров":
+                    results['refused'] += 1
+                else:
+                    results['errors'].append(message)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results['ok'], results['refused'], results['errors']
+
+def stress_checkout(copies, processes, threads, attempts):
+    scratch = make_scratch_database()
+
+    from data_access import BookDAO, LoanDAO
+    from models import Book
+
+    # База создается миграциями при импорте; добавляем читателя и книгу
+    conn = sqlite3.connect(scratch)
+    conn.execute("INSERT INTO readers (name, card_number, password) VALUES ('Нагрузка', 'stress', '-')")
+    conn.commit()
+    reader_id = conn.execute("SELECT reader_id FROM readers WHERE card_number = 'stress'").fetchone()[0]
+    conn.close()
+    BookDAO.add_book(Book(title='Нагрузочная книга', author='-', total_copies=copies, available_copies=copies))
+    book_id = BookDAO.get_books_page(limit=1)[0].book_id
+
+    print("=" * 50)
+    print("НАГРУЗОЧНАЯ ПРОВЕРКА ВЫДАЧИ")
+    print("=" * 50)
+    print(f"Экземпляров: {copies}, процессов: {processes}, потоков: {threads}, попыток на поток: {attempts}")
+
+    started = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = [pool.submit(checkout_worker, book_id, reader_id, threads, attempts) for _ in range(processes)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    succeeded = sum(ok for ok, _, _ in results)
+    refused = sum(refused for _, refused, _ in results)
+    errors = [error for _, _, errs in results for error in errs]
+
+    conn = sqlite3.connect(scratch)
+    available = conn.execute('SELECT available_copies FROM books WHERE book_id = ?', (book_id,)).fetchone()[0]
+    active_loans = conn.execute("SELECT COUNT(*) FROM loans WHERE book_id = ? AND status = 'active'",
+                                (book_id,)).fetchone()[0]
+    loan_ids = [row[0] for row in conn.execute("SELECT loan_id FROM loans WHERE book_id = ?", (book_id,))]
+    conn.close()
+
+    print(f"Попыток: {processes * threads * attempts} за {elapsed:.2f} с")
+    print(f"Выдано: {succeeded}, отказов: {refused}, ошибок: {len(errors)}")
+    print(f"Остаток: {available}, активных выдач: {active_loans}")
+    for error in errors[:5]:
+        print(f"  {error}")
+
+    failures = []
+    if succeeded != copies or active_loans != copies:
+        failures.append(f"выдано {succeeded} (выдач в базе {active_loans}) при {copies} экземплярах")
+    if available != 0:
+        failures.append(f"остаток {available} вместо 0")
+    if errors:
+        failures.append(f"ошибок при выдаче: {len(errors)}")
+
+    # Возвращаем все выдачи и проверяем, что фонд восстановился
+    for loan_id in loan_ids:
+        LoanDAO.return_loan(loan_id)
+    repeated, _ = LoanDAO.return_loan(loan_ids[0]) if loan_ids else (False, None)
+    book = BookDAO.get_book_by_id(book_id)
+    print(f"После возврата: доступно {book.available_copies}/{book.total_copies}")
+    if book.available_copies != copies:
+        failures.append(f"после возврата доступно {book.available_copies} вместо {copies}")
+    if repeated:
+        failures.append("повторный возврат выдачи прошел успешно")
+
+    print("-" * 50)
+    if failures:
+        for failure in failures:
+            print(f"ОШИБКА: {failure}")
+        return False
+    print("Лишних выдач нет")
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка атомарной выдачи книг")
+    parser.add_argument('--copies', type=int, default=50, help="экземпляров книги (по умолчанию: %(default)s)")
+    parser.add_argument('--processes', type=int, default=4, help="процессов (по умолчанию: %(default)s)")
+    parser.add_argument('--threads', type=int, default=8, help="потоков в процессе (по умолчанию: %(default)s)")
+    parser.add_argument('--attempts', type=int, default=25,
+                        help="попыток выдачи на поток (по умолчанию: %(default)s)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(0 if stress_checkout(args.copies, args.processes, args.threads, args.attempts) else 1)